@@ -0,0 +1,1657 @@
+"""
+Benchmarks for the components of the media player. Run
+
+	python benchmark.py --help
+
+to see which benchmarks are available. All benchmarks print their results
+to stdout, so they can easily be compared between machines and releases.
+"""
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+	import tracemalloc
+except ImportError:
+	# Python 2
+	tracemalloc = None
+
+import numpy as np
+
+import player
+from moviepy.config import get_setting
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+try:
+	import resource
+except ImportError:
+	# Not available on Windows
+	resource = None
+
+#---------------------------------------------------------------------
+# Helper functions
+#---------------------------------------------------------------------
+
+def cpu_time():
+	""" Returns the CPU time (user + system) consumed by all threads of
+	this process so far, in seconds """
+	if resource:
+		usage = resource.getrusage(resource.RUSAGE_SELF)
+		return usage.ru_utime + usage.ru_stime
+	try:
+		return time.process_time()
+	except AttributeError:
+		# Python 2
+		return time.clock()
+
+def children_cpu_time():
+	""" Returns the CPU time (user + system) consumed by child processes (such
+	as ffmpeg) that have exited and been waited for, in seconds, or None if
+	this cannot be determined on this platform """
+	if not resource:
+		return None
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+def summarize(values, scale=1000.0, unit="ms"):
+	""" Returns a one line summary (mean, sd, percentiles, max) of the
+	distribution of values.
+
+	Arguments:
+	values -- sequence of numbers
+
+	Keyword arguments:
+	scale -- factor to multiply the values with before printing (default: 1000.0)
+	unit -- unit to print after the values (default: ms)
+	"""
+	values = np.asarray(values, dtype=np.float64) * scale
+	if not len(values):
+		return "no samples"
+	p50, p95, p99 = np.percentile(values, [50, 95, 99])
+	return "mean {0:.3f} sd {1:.3f} p50 {2:.3f} p95 {3:.3f} p99 {4:.3f} max {5:.3f} {6}".format(
+		values.mean(), values.std(), p50, p95, p99, values.max(), unit)
+
+def peak_memory():
+	""" Returns the peak resident set size of this process and of the largest
+	child process (such as ffmpeg) that has exited and been waited for, in
+	bytes, or (None, None) if this cannot be determined on this platform """
+	if not resource:
+		return None, None
+	# Linux reports kilobytes, macOS bytes
+	unit = 1 if sys.platform == "darwin" else 1024
+	return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+		resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+# Codecs (and their pixel formats) that synthetic clips can be encoded with
+SYNTHETIC_CODECS = {
+	"libx264": "yuv420p",
+	"mpeg4": "yuv420p",
+	"mjpeg": "yuvj420p",
+	"libvpx-vp9": "yuv420p",
+}
+
+def synthetic_clip(folder, size, fps, codec="libx264", audio=True, duration=5.0):
+	""" Returns the path to a clip with a moving test pattern (and a sine tone)
+	that is generated with ffmpeg, so benchmarks do not depend on any media
+	files. The clip is only generated if it is not in folder yet.
+
+	Arguments:
+	folder -- the folder to keep the clip in
+	size -- (width, height) of the clip
+	fps -- frame rate of the clip
+
+	Keyword arguments:
+	codec -- video codec, one of SYNTHETIC_CODECS (default: libx264)
+	audio -- whether the clip has a 44.1 kHz stereo audio track (default: True)
+	duration -- duration of the clip in seconds (default: 5.0)
+	"""
+	name = "{0}x{1}_{2}fps_{3}_{4}_{5}s.mkv".format(size[0], size[1], fps, codec,
+		"audio" if audio else "silent", duration)
+	path = os.path.join(folder, name)
+	if os.path.exists(path):
+		return path
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "lavfi",
+		"-i", "testsrc2=size={0}x{1}:rate={2}:duration={3}".format(size[0], size[1], fps,
+		duration)]
+	if audio:
+		cmd += ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100:duration={0}".format(
+			duration), "-ac", "2", "-c:a", "aac"]
+	cmd += ["-c:v", codec, "-pix_fmt", SYNTHETIC_CODECS[codec]]
+	if codec == "libx264":
+		cmd += ["-preset", "veryfast"]
+	elif codec == "mjpeg":
+		cmd += ["-q:v", "3"]
+	elif codec == "libvpx-vp9":
+		cmd += ["-deadline", "realtime", "-cpu-used", "8"]
+	# Write to a temporary file first, so an interrupted run does not leave
+	# a truncated clip behind
+	tmpfile = os.path.join(folder, "tmp_" + name)
+	subprocess.check_call(cmd + [tmpfile])
+	os.rename(tmpfile, path)
+	return path
+
+class SimulatedAudioDevice(object):
+	""" Stands in for an audio renderer. Samples are consumed at the rate of a
+	device whose clock runs slightly faster or slower than the system clock. """
+
+	def __init__(self, fps, drift=0.0, latency=0.02):
+		"""
+		Constructor
+
+		Arguments:
+		fps -- the sample rate of the audio
+
+		Keyword arguments:
+		drift -- relative deviation of the device clock, e.g. -0.001 for a
+			device that plays 0.1% slower than real time (default: 0.0)
+		latency -- output latency of the device in seconds (default: 0.02)
+		"""
+		self.fps = float(fps)
+		self.drift = drift
+		self.latency = latency
+		self.samples_written = 0
+		self.start_time = None
+
+	def write(self, frame):
+		""" Accepts a block of samples """
+		if self.start_time is None:
+			self.start_time = player.monotonic_time()
+		self.samples_written += len(frame)
+
+	def get_position(self):
+		""" Returns the playback position of the device in seconds """
+		if self.start_time is None:
+			return None
+		position = (player.monotonic_time() - self.start_time) * (1 + self.drift) - self.latency
+		return max(0.0, min(position, self.samples_written / self.fps))
+
+class SimulatedDisplay(object):
+	""" Stands in for a display with vertical sync: flip() blocks until the
+	next refresh, like the flip of an OpenGL window with vsync enabled. """
+
+	def __init__(self, refresh_rate=60.0):
+		self.refresh_interval = 1.0 / refresh_rate
+		self.start_time = player.monotonic_time()
+
+	def flip(self):
+		""" Waits for the next refresh and returns its time """
+		now = player.monotonic_time()
+		refresh = self.start_time + (int((now - self.start_time) / self.refresh_interval) + 1) * \
+			self.refresh_interval
+		time.sleep(max(0.0, refresh - now))
+		return refresh
+
+def play_headless(videofile, decode_spike=0.0, audio_device=None, timings=None, **player_kwargs):
+	""" Plays videofile from start to end without rendering anything and
+	records when each frame is delivered to the video callback.
+
+	Arguments:
+	videofile -- path to the video file to play
+
+	Keyword arguments:
+	decode_spike -- extra time in seconds that decoding every 10th frame
+		takes, to simulate a slow decoder (default: 0.0)
+	audio_device -- object with write() and get_position() methods to play
+		the audio with, or None to play the video without audio (default: None)
+	timings -- player.StageTimings to record the stages of playback in
+		(default: None)
+	player_kwargs -- passed on to player.Player
+
+	Returns:
+	(player, lateness) tuple, in which lateness contains for every delivered
+	frame how long after its ideal presentation time it arrived (in seconds)
+	"""
+	player_kwargs.setdefault("play_audio", audio_device is not None)
+	lateness = []
+
+	def videorenderfunc(frame):
+		# Compare with the time at which the delivered frame is due, which
+		# takes into account where the clip started on the clock
+		lateness.append(mplayer.clock.time - mplayer.frame_time(mplayer.rendered_frame_no))
+
+	mplayer = player.Player(videofile, videorenderfunc=videorenderfunc, **player_kwargs)
+	mplayer.timings = timings
+	if audio_device:
+		mplayer.set_audioframerender_callback(audio_device.write)
+		mplayer.set_audioposition_callback(audio_device.get_position)
+
+	# Count how often the ffmpeg pipe is (re)opened at a new position
+	mplayer.pipe_openings = 0
+	initialize = mplayer.clip.reader.initialize
+	def counting_initialize(*args, **kwargs):
+		mplayer.pipe_openings += 1
+		return initialize(*args, **kwargs)
+	mplayer.clip.reader.initialize = counting_initialize
+
+	if decode_spike:
+		# Slow down both ways in which the player retrieves frames
+		get_frame = mplayer.clip.get_frame
+		def slow_get_frame(t):
+			if int(round(t * mplayer.fps)) % 10 == 0:
+				time.sleep(decode_spike)
+			return get_frame(t)
+		mplayer.clip.get_frame = slow_get_frame
+
+		stream_get_frame = player.StreamDecoder.get_frame
+		def slow_stream_get_frame(decoder, frame_no, out=None):
+			if frame_no % 10 == 0:
+				time.sleep(decode_spike)
+			return stream_get_frame(decoder, frame_no, out)
+		player.StreamDecoder.get_frame = slow_stream_get_frame
+
+	try:
+		mplayer.play()
+		while mplayer.status in [player.PLAYING, player.PAUSED]:
+			time.sleep(0.05)
+		mplayer.renderloop.join()
+	finally:
+		# Don't leave the decoder slowed down for the benchmarks that follow
+		if decode_spike:
+			player.StreamDecoder.get_frame = stream_get_frame
+	return mplayer, lateness
+
+def create_gl_context(size):
+	""" Opens a hidden pygame window with an OpenGL context, set up with the
+	same per pixel projection as the OpenGL renderers of the plugin use. If no
+	display is available, SDL's offscreen video driver is used.
+
+	Arguments:
+	size -- (width, height) of the window
+
+	Returns:
+	the OpenGL.GL module
+	"""
+	import pygame
+	if not os.environ.get("DISPLAY") and not sys.platform.startswith(("win", "darwin")):
+		os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+	pygame.display.init()
+	pygame.display.set_mode(size, pygame.OPENGL | pygame.DOUBLEBUF | getattr(pygame, "HIDDEN", 0))
+	import OpenGL.GL as GL
+
+	GL.glViewport(0, 0, size[0], size[1])
+	GL.glMatrixMode(GL.GL_PROJECTION)
+	GL.glLoadIdentity()
+	GL.glOrtho(0.0, size[0], size[1], 0.0, 0.0, 1.0)
+	GL.glMatrixMode(GL.GL_MODELVIEW)
+	GL.glLoadIdentity()
+	GL.glEnable(GL.GL_TEXTURE_2D)
+	print("OpenGL {0} on {1}".format(GL.glGetString(GL.GL_VERSION).decode(),
+		GL.glGetString(GL.GL_RENDERER).decode()))
+	return GL
+
+def exec_plugin(sections, namespace):
+	""" Executes sections of the plugin module in namespace. The plugin
+	module itself can only be imported inside OpenSesame, so only the
+	sections that are needed are executed, with stand-ins in namespace for
+	the OpenSesame names they use. The other lines are left empty, so that
+	tracebacks still point to the right lines of the plugin.
+
+	Arguments:
+	sections -- list of (first line, line after the last) tuples of the
+		sections, by their text
+	namespace -- dict to execute the sections in
+	"""
+	pluginfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media_player_mpy.py")
+	with open(pluginfile) as f:
+		lines = f.read().splitlines()
+	source = [""] * len(lines)
+	for first, after_last in sections:
+		start = lines.index(first)
+		end = lines.index(after_last, start)
+		source[start:end] = lines[start:end]
+	exec(compile("\n".join(source), pluginfile, "exec"), namespace)
+	return namespace
+
+# The section of the plugin with the frame handlers, from the "Base classes"
+# section up to the main player class, and the main player class itself
+HANDLERS_SECTION = ("# Base classes (should be subclassed by backend-specific classes)",
+	"# Main player class -- communicates with MoviePy")
+ITEM_SECTION = ("class media_player_mpy(item):",
+	"class qtmedia_player_mpy(media_player_mpy, qtautoplugin):")
+
+def handlers_namespace():
+	""" Returns a namespace with the stand-ins for the OpenSesame names the
+	frame handlers use """
+	import ctypes
+	import pygame
+
+	class osexception(Exception):
+		pass
+
+	class color(object):
+		def __init__(self, experiment, colorspec):
+			self.backend_color = pygame.Color(colorspec)
+
+	return {"__name__": "media_player_mpy_handlers", "ctypes": ctypes, "np": np,
+		"player": player, "pygame": pygame, "osexception": osexception, "color": color}
+
+def load_handlers():
+	""" Returns a dict with the frame handler classes of the plugin, by name """
+	namespace = exec_plugin([HANDLERS_SECTION], handlers_namespace())
+	return dict((name, namespace[name]) for name in ["legacy_handler",
+		"expyriment_handler", "psychopy_handler"])
+
+def load_plugin(handler_class):
+	""" Returns the media_player_mpy item class of the plugin, on a stand-in for
+	OpenSesame's item class (see StubItem), in which the legacy backend draws
+	frames with handler_class instead of legacy_handler """
+	import threading
+	from collections import deque
+	namespace = handlers_namespace()
+	namespace.update({"item": StubItem, "debug": argparse.Namespace(msg=lambda msg: None),
+		"os": os, "sys": sys, "time": time, "threading": threading, "deque": deque,
+		"unicode": str})
+	exec_plugin([HANDLERS_SECTION, ITEM_SECTION], namespace)
+	namespace["legacy_handler"] = handler_class
+	return namespace["media_player_mpy"]
+
+class StubItem(object):
+	""" Stands in for OpenSesame's item class, from which the plugin's item
+	derives """
+
+	def __init__(self, name, experiment):
+		self.name = name
+		self.experiment = experiment
+		self.var = argparse.Namespace()
+		self.reset()
+
+	def prepare(self):
+		pass
+
+	def set_item_onset(self):
+		pass
+
+class StubExperiment(object):
+	""" Stands in for the OpenSesame experiment the plugin's item belongs to,
+	with the legacy backend in a window of the given size. Variables that the
+	item logs end up in variables. The clock of the experiment is the clock
+	of the item's player (in ms), so that the frame onsets the item returns
+	can be compared with the times the frames are due at. """
+
+	def __init__(self, size):
+		self.size = size
+		self.fullscreen = False
+		self.surface = self.window = None
+		self.logfile = os.path.join(tempfile.gettempdir(), "benchmark.csv")
+		self.variables = {}
+		self.var = argparse.Namespace(set=self.variables.__setitem__)
+		self.item = None
+		self.clock = argparse.Namespace(time=lambda: 1000 * self.item.player.current_playtime
+			if self.item and getattr(self.item, "player", None) else 0.0)
+
+	def resolution(self):
+		return self.size
+
+	def get_file(self, path):
+		return path
+
+class StubHandler(object):
+	""" Stands in for a frame handler of the plugin in its run loop. Frames
+	are not drawn; instead, the time between handing a frame over and drawing
+	it is recorded, and how often input is processed. swap_buffers() waits for
+	the next refresh of display (a SimulatedDisplay) if one is set. """
+
+	display = None
+
+	def __init__(self, main_player, screen, custom_event_code=None):
+		self.main_player = main_player
+		self.custom_event_code = custom_event_code
+		self.handed_over = None
+		self.latencies = []
+		self.polls = 0
+
+	def prepare_for_playback(self):
+		pass
+
+	def handle_videoframe(self, frame):
+		self.handed_over = player.monotonic_time()
+
+	def draw_frame(self):
+		if self.handed_over is not None:
+			self.latencies.append(player.monotonic_time() - self.handed_over)
+			self.handed_over = None
+
+	def swap_buffers(self):
+		if self.display:
+			self.display.flip()
+
+	def process_user_input(self):
+		self.polls += 1
+		return True
+
+	def playback_finished(self):
+		pass
+
+def run_plugin(videofile, handler_class=StubHandler, **variables):
+	""" Prepares and runs the plugin's item for videofile, with the legacy
+	backend drawing with handler_class, as OpenSesame would in a trial
+
+	Arguments:
+	videofile -- path to the video file to play
+
+	Keyword arguments:
+	handler_class -- class that draws the frames (default: StubHandler)
+	variables -- variables of the item to set, such as presentation
+
+	Returns:
+	namespace with the item, its handler, the frame_onsets the run returned,
+	the cpu time and wall-clock duration of the run in seconds, and the fps
+	and nframes of the clip (the item's player has released it after the run)
+	"""
+	experiment = StubExperiment((1280, 720))
+	mp_item = load_plugin(handler_class)("media_player_mpy", experiment)
+	experiment.item = mp_item
+	mp_item.var.video_src = videofile
+	mp_item.var.playaudio = "no"
+	mp_item.var.canvas_backend = "legacy"
+	for name, value in variables.items():
+		setattr(mp_item.var, name, value)
+	mp_item.prepare()
+	fps, nframes = mp_item.player.fps, mp_item.player.nframes
+	start = time.time()
+	cpu_start = cpu_time()
+	frame_onsets = mp_item.run()
+	return argparse.Namespace(item=mp_item, handler=mp_item.handler, frame_onsets=frame_onsets,
+		cpu=cpu_time() - cpu_start, duration=time.time() - start, fps=fps, nframes=nframes)
+
+class StubMainPlayer(object):
+	""" Stands in for the plugin item that owns a frame handler, with the
+	attributes the handlers use. The handlers record the time they spend on
+	uploading frames in player.timings, as they do in the plugin. """
+
+	def __init__(self, vidsize, windowsize, destsize, nframes, pixel_format="rgb24",
+		gl_upload="pbo", legacy_render="zerocopy"):
+		"""
+		Constructor
+
+		Arguments:
+		vidsize -- (width, height) of the frames
+		windowsize -- (width, height) of the window
+		destsize -- (width, height) the frames are drawn at
+		nframes -- number of frames that will be drawn
+
+		Keyword arguments:
+		pixel_format -- pixel format of the frames (default: rgb24)
+		gl_upload -- gl_upload variable of the plugin (default: pbo)
+		legacy_render -- legacy_render variable of the plugin (default: zerocopy)
+		"""
+		self.var = argparse.Namespace(gl_upload=gl_upload, legacy_render=legacy_render)
+		self.experiment = argparse.Namespace(width=windowsize[0], height=windowsize[1],
+			background="black")
+		self.player = argparse.Namespace(nframes=nframes, pixel_format=pixel_format,
+			timings=player.StageTimings(["upload", "draw", "flip"]))
+		self.vidsize = vidsize
+		self.destsize = destsize
+		self.vidPos = ((windowsize[0] - destsize[0]) // 2, (windowsize[1] - destsize[1]) // 2)
+
+#---------------------------------------------------------------------
+# Benchmarks
+#---------------------------------------------------------------------
+
+def benchmark_clock(args):
+	""" Compares CPU usage and timing jitter of the clock implementations.
+	For every clock mode, a number of clocks (one per simulated player) is
+	started and polled at a fixed rate. The value reported by the clock is
+	compared to the elapsed time measured with a high resolution reference
+	clock. """
+	for mode in sorted(player.CLOCK_MODES):
+		clocks = [player.CLOCK_MODES[mode](fps=args.fps) for i in range(args.clocks)]
+		errors = np.zeros(int(args.duration / args.poll_interval) + 1, dtype=np.float64)
+
+		cpu_start = cpu_time()
+		for clock in clocks:
+			clock.start()
+		# The threaded clock starts measuring in its own thread
+		time.sleep(0.01)
+		reference_start = player.monotonic_time() - clocks[0].time
+
+		n = 0
+		deadline = reference_start + args.duration
+		while n < len(errors) and player.monotonic_time() < deadline:
+			reference = player.monotonic_time() - reference_start
+			errors[n] = abs(clocks[0].time - reference)
+			n += 1
+			time.sleep(args.poll_interval)
+
+		for clock in clocks:
+			clock.stop()
+		cpu_used = cpu_time() - cpu_start
+
+		print("{0} clock ({1} running)".format(mode, args.clocks))
+		print("\tCPU usage: {0:.1f}% of one core".format(100.0 * cpu_used / args.duration))
+		print("\tError versus reference: {0}".format(summarize(errors[:n])))
+
+def benchmark_prefetch(args):
+	""" Compares frame delivery with and without decoding frames ahead.
+	The video file is played once for every prefetch depth, and for each run
+	the delay between the ideal presentation time of a frame and its delivery
+	to the renderer is reported. """
+	for depth in args.depths:
+		mplayer, lateness = play_headless(args.videofile, args.decode_spike / 1000.0,
+			clock_mode="monotonic", prefetch_depth=depth)
+		print("prefetch depth {0}".format(depth))
+		print("\tDelivered {0} of {1} frames".format(len(lateness), mplayer.nframes))
+		print("\tDelivery delay: {0}".format(summarize(lateness)))
+		if mplayer.prefetch_stats:
+			print("\tPrefetcher: {decoded} decoded, {discarded} discarded, "
+				"{underruns} underruns".format(**mplayer.prefetch_stats))
+
+def benchmark_decode(args):
+	""" Compares looking up frames by timestamp with reading them in order
+	from a single ffmpeg pipe. For both decode modes the number of times the
+	pipe was reopened at a new position is reported, together with the
+	frame delivery delay. """
+	for mode in player.DECODE_MODES:
+		mplayer, lateness = play_headless(args.videofile, clock_mode="monotonic",
+			decode_mode=mode, prefetch_depth=args.prefetch_depth)
+		print("{0} decode mode".format(mode))
+		print("\tDelivered {0} of {1} frames".format(len(lateness), mplayer.nframes))
+		print("\tffmpeg pipe (re)opened {0} times".format(mplayer.pipe_openings))
+		print("\tDelivery delay: {0}".format(summarize(lateness)))
+		if mplayer.decoder_stats:
+			print("\tDecoder: {decoded} decoded, {skipped} skipped, {seeks} seeks, "
+				"{rereads} rereads".format(**mplayer.decoder_stats))
+
+def benchmark_sync(args):
+	""" Compares the sync policies of the player when decoding is slow.
+	For every policy the clip is played once, and the number of rendered,
+	dropped, repeated and late frames is reported. """
+	for policy in player.SYNC_POLICIES:
+		start = player.monotonic_time()
+		mplayer, lateness = play_headless(args.videofile, args.decode_spike / 1000.0,
+			clock_mode="monotonic", decode_mode="stream",
+			prefetch_depth=args.prefetch_depth, sync_policy=policy)
+		print("{0} sync policy".format(policy))
+		print("\tPlayback took {0:.2f} s for a {1:.2f} s clip".format(
+			player.monotonic_time() - start, mplayer.duration))
+		print("\tFrames: {rendered} rendered, {dropped} dropped, {repeated} repeated, "
+			"{late} late".format(**mplayer.frame_stats))
+		print("\tDelivery delay: {0}".format(summarize(lateness)))
+
+def benchmark_schedule(args):
+	""" Measures how precisely the render loop delivers frames at their
+	deadlines. The clip is played once for every spin-wait setting, and the
+	distribution of the delivery error relative to the ideal presentation
+	time is reported together with the CPU usage of the process. """
+	for spin_wait in args.spin_waits:
+		cpu_start = cpu_time()
+		start = player.monotonic_time()
+		mplayer, lateness = play_headless(args.videofile, clock_mode="monotonic",
+			decode_mode="stream", prefetch_depth=args.prefetch_depth,
+			spin_wait=spin_wait / 1000.0)
+		cpu_used = cpu_time() - cpu_start
+		print("spin wait {0} ms".format(spin_wait))
+		print("\tCPU usage: {0:.1f}% of one core".format(
+			100.0 * cpu_used / (player.monotonic_time() - start)))
+		print("\tDelivery error: {0}".format(summarize(lateness)))
+
+def benchmark_audio(args):
+	""" Compares the per-frame audio chunking of earlier versions of the player
+	(an index array and to_soundarray() call for every video frame) with
+	reading the PCM stream block by block. The complete audio track is decoded
+	with both methods as fast as possible. """
+	from moviepy.video.io.VideoFileClip import VideoFileClip
+	clip = VideoFileClip(args.videofile)
+	if not clip.audio:
+		print("{0} has no audio track".format(args.videofile))
+		return
+	audio_fps = clip.audio.fps
+	n_samples = int(clip.audio.duration * audio_fps)
+
+	def per_frame_chunks():
+		frame_interval = 1.0 / clip.fps
+		t = 0.0
+		while t < clip.audio.duration - frame_interval:
+			interval = np.arange(int(audio_fps * t), int(audio_fps * (t + frame_interval) * 1.05))
+			clip.audio.to_soundarray(tt=interval / float(audio_fps),
+				buffersize=frame_interval * audio_fps, quantize=True)
+			t += frame_interval
+
+	def stream_blocks():
+		stream = player.AudioStream(clip.audio.reader, args.block_size)
+		stream.seek(0)
+		while stream.read_block() is not None:
+			pass
+
+	for name, func in [("per-frame chunks", per_frame_chunks), ("stream blocks", stream_blocks)]:
+		if tracemalloc:
+			tracemalloc.start()
+		cpu_start = cpu_time()
+		start = player.monotonic_time()
+		func()
+		duration = player.monotonic_time() - start
+		cpu_used = cpu_time() - cpu_start
+		print(name)
+		print("\tDecoded {0} samples in {1:.3f} s ({2:.1f}x real time), {3:.3f} s CPU".format(
+			n_samples, duration, clip.audio.duration / duration, cpu_used))
+		if tracemalloc:
+			current, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			print("\tPeak traced memory: {0:.1f} kB".format(peak / 1024.0))
+
+def benchmark_avsync(args):
+	""" Measures the offset between audio and video when the audio device
+	clock drifts away from the system clock. The clip is played with a
+	simulated audio device under every sync policy, and the distribution of
+	the offset between the audio playback position and the presentation
+	time of the video frames is reported. """
+	for policy in player.SYNC_POLICIES:
+		device = SimulatedAudioDevice(44100, args.drift / 100.0, args.latency / 1000.0)
+		mplayer, lateness = play_headless(args.videofile, audio_device=device,
+			clock_mode="monotonic", decode_mode="stream", prefetch_depth=4,
+			sync_policy=policy)
+		offsets = mplayer.av_offsets
+		print("{0} sync policy".format(policy))
+		print("\tA/V offset: {0}".format(summarize(offsets[:,1])))
+		# Offset at the end relative to the start, to show drift
+		n = max(1, len(offsets) // 10)
+		print("\tDrift over {0:.1f} s: {1:.3f} ms".format(offsets[-1,0] - offsets[0,0],
+			1000 * (offsets[-n:,1].mean() - offsets[:n,1].mean())))
+
+def benchmark_quad(args):
+	""" Compares the per frame overhead of drawing the video quad in immediate
+	mode with calling a display list that is compiled once. Both paths issue
+	the same drawing commands as the OpenGL renderers of the plugin, and the
+	time spent on issuing them is reported, as well as the time until the GPU
+	has finished drawing. """
+	import pygame
+	GL = create_gl_context((args.width, args.height))
+	(w,h) = (args.width * 3 // 4, args.height * 3 // 4)
+	(x,y) = ((args.width - w) // 2, (args.height - h) // 2)
+
+	texid = GL.glGenTextures(1)
+	GL.glBindTexture(GL.GL_TEXTURE_2D, texid)
+	GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB, 64, 64, 0, GL.GL_RGB,
+		GL.GL_UNSIGNED_BYTE, np.zeros((64, 64, 3), dtype=np.uint8))
+	GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+	GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+
+	def immediate():
+		GL.glBegin(GL.GL_QUADS)
+		GL.glTexCoord2f(0.0, 0.0); GL.glVertex3i(x, y, 0)
+		GL.glTexCoord2f(1.0, 0.0); GL.glVertex3i(x+w, y, 0)
+		GL.glTexCoord2f(1.0, 1.0); GL.glVertex3i(x+w, y+h, 0)
+		GL.glTexCoord2f(0.0, 1.0); GL.glVertex3i(x, y+h, 0)
+		GL.glEnd()
+
+	quad_list = GL.glGenLists(1)
+	GL.glNewList(quad_list, GL.GL_COMPILE)
+	immediate()
+	GL.glEndList()
+	def display_list():
+		GL.glCallList(quad_list)
+
+	for name, draw in [("immediate mode", immediate), ("display list", display_list)]:
+		issue_times = np.zeros(args.frames)
+		finish_times = np.zeros(args.frames)
+		for i in range(args.frames):
+			GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+			GL.glColor4f(1, 1, 1, 1)
+			t0 = player.monotonic_time()
+			draw()
+			t1 = player.monotonic_time()
+			GL.glFinish()
+			issue_times[i] = t1 - t0
+			finish_times[i] = player.monotonic_time() - t0
+		print(name)
+		print("\tIssuing draw calls: {0}".format(summarize(issue_times, 1e6, "us")))
+		print("\tUntil drawn: {0}".format(summarize(finish_times, 1e6, "us")))
+
+	GL.glDeleteLists(quad_list, 1)
+	GL.glDeleteTextures([texid])
+	pygame.display.quit()
+
+def benchmark_pixelformat(args):
+	""" Compares decoding frames as RGB with decoding them as planar YUV 4:2:0
+	that is converted to RGB on the GPU. For both pixel formats all frames of
+	the clip are read from the ffmpeg pipe and uploaded to textures, as the
+	OpenGL renderers of the plugin do. The bytes moved per frame, the time
+	spent on reading and uploading each frame and the CPU time used by ffmpeg
+	are reported. """
+	from moviepy.video.io.VideoFileClip import VideoFileClip
+	clip = VideoFileClip(args.videofile, audio=False)
+	(w, h) = clip.size
+	if not args.no_upload:
+		GL = create_gl_context((w, h))
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+
+	for pixel_format in player.PIXEL_FORMATS:
+		if args.no_upload:
+			planes = []
+		elif pixel_format == "yuv420p":
+			planes = [(GL.glGenTextures(1), GL.GL_LUMINANCE, size)
+				for size in [(w, h), (w // 2, h // 2), (w // 2, h // 2)]]
+		else:
+			planes = [(GL.glGenTextures(1), GL.GL_RGB, (w, h))]
+		for texid, fmt, (plane_w, plane_h) in planes:
+			GL.glBindTexture(GL.GL_TEXTURE_2D, texid)
+			GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, fmt, plane_w, plane_h, 0, fmt,
+				GL.GL_UNSIGNED_BYTE, None)
+
+		clip.reader.close()
+		ffmpeg_cpu_start = children_cpu_time()
+		decoder = player.StreamDecoder(clip.reader, pixel_format=pixel_format)
+		frame = np.empty(decoder.frame_shape, dtype=np.uint8)
+		read_times = np.zeros(clip.reader.nframes)
+		upload_times = np.zeros(clip.reader.nframes)
+		for frame_no in range(clip.reader.nframes):
+			t0 = player.monotonic_time()
+			decoder.get_frame(frame_no, frame)
+			t1 = player.monotonic_time()
+			if planes:
+				if pixel_format == "yuv420p":
+					data = [np.ascontiguousarray(plane) for plane in player.yuv420_planes(frame)]
+				else:
+					data = [frame]
+				for (texid, fmt, size), plane in zip(planes, data):
+					GL.glBindTexture(GL.GL_TEXTURE_2D, texid)
+					GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, plane.shape[1],
+						plane.shape[0], fmt, GL.GL_UNSIGNED_BYTE, plane)
+				GL.glFinish()
+			read_times[frame_no] = t1 - t0
+			upload_times[frame_no] = player.monotonic_time() - t1
+		# ffmpeg's CPU time is only accounted for once it has exited
+		decoder.close()
+		for plane in planes:
+			GL.glDeleteTextures([plane[0]])
+
+		print("{0} ({1}x{2})".format(pixel_format, w, h))
+		print("\tBytes per frame: {0} ({1:.1f} MB/s at {2:g} fps)".format(frame.nbytes,
+			frame.nbytes * clip.fps / 1e6, clip.fps))
+		print("\tReading: {0}".format(summarize(read_times)))
+		if planes:
+			print("\tUploading: {0}".format(summarize(upload_times)))
+		if ffmpeg_cpu_start is not None:
+			print("\tffmpeg CPU time: {0:.3f} s".format(children_cpu_time() - ffmpeg_cpu_start))
+
+def benchmark_scale(args):
+	""" Compares decoding frames at the size of the video file and scaling them
+	afterwards with letting ffmpeg scale them while decoding. For both the
+	bytes per frame, the time spent on reading each frame from the pipe and
+	the CPU time used by ffmpeg are reported. For full size decoding, the time
+	the legacy renderer needs to scale each frame with pygame is also
+	reported. """
+	try:
+		import pygame
+	except ImportError:
+		pygame = None
+	mplayer = player.Player(args.videofile, play_audio=False, decode_mode="stream")
+	if args.size:
+		decode_size = tuple(args.size)
+	else:
+		decode_size = (int(mplayer.source_size[0] * args.factor),
+			int(mplayer.source_size[1] * args.factor))
+
+	for size in [None, decode_size]:
+		size = mplayer.set_decode_size(size)
+		mplayer.clip.reader.close()
+		ffmpeg_cpu_start = children_cpu_time()
+		decoder = player.StreamDecoder(mplayer.clip.reader)
+		frame = np.empty(decoder.frame_shape, dtype=np.uint8)
+		read_times = np.zeros(mplayer.nframes)
+		scale_times = np.zeros(mplayer.nframes)
+		if pygame and size != decode_size:
+			# Same surfaces as the legacy renderer uses
+			src_surface = pygame.Surface(size, 0, 24, (255, 65280, 16711680, 0))
+			dest_surface = pygame.Surface(decode_size, 0, 24, (255, 65280, 16711680, 0))
+		else:
+			src_surface = None
+		for frame_no in range(mplayer.nframes):
+			t0 = player.monotonic_time()
+			decoder.get_frame(frame_no, frame)
+			t1 = player.monotonic_time()
+			if src_surface:
+				pygame.surfarray.blit_array(src_surface, frame.swapaxes(0, 1))
+				pygame.transform.scale(src_surface, decode_size, dest_surface)
+			read_times[frame_no] = t1 - t0
+			scale_times[frame_no] = player.monotonic_time() - t1
+		decoder.close()
+
+		print("decoded at {0}x{1}".format(*size))
+		print("\tBytes per frame: {0}".format(frame.nbytes))
+		print("\tReading: {0}".format(summarize(read_times)))
+		if src_surface:
+			print("\tScaling to {0}x{1} with pygame: {2}".format(decode_size[0],
+				decode_size[1], summarize(scale_times)))
+		if ffmpeg_cpu_start is not None:
+			print("\tffmpeg CPU time: {0:.3f} s".format(children_cpu_time() - ffmpeg_cpu_start))
+
+def benchmark_legacy(args):
+	""" Compares the per frame render time of the two drawing paths of the
+	legacy (pygame) renderer of the plugin. The "copy" path copies every frame
+	into an intermediate surface before scaling and blitting it, the
+	"zerocopy" path blits (or scales) a surface that uses the memory of the
+	frame directly. Both paths are timed with and without resizing the frames
+	to the window. """
+	import pygame
+	if not os.environ.get("DISPLAY") and not sys.platform.startswith(("win", "darwin")):
+		os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+	pygame.display.init()
+	screen = pygame.display.set_mode((args.width, args.height), 0, 32)
+
+	# Render frames from memory, so only the drawing is timed
+	mplayer = player.Player(args.videofile, play_audio=False, decode_mode="stream")
+	decoder = player.StreamDecoder(mplayer.clip.reader)
+	frames = [decoder.get_frame(frame_no).copy() for frame_no in range(min(args.frames, mplayer.nframes))]
+	decoder.close()
+	vidsize = tuple(mplayer.clip.size)
+
+	# Same surfaces as the legacy renderer uses
+	def surface(size):
+		return pygame.Surface(size, 0, 24, (255, 65280, 16711680, 0))
+
+	def copy(frame, destsize, src_surface, dest_surface):
+		pygame.surfarray.blit_array(src_surface, frame.swapaxes(0, 1))
+		if destsize != vidsize:
+			pygame.transform.scale(src_surface, destsize, dest_surface)
+			screen.blit(dest_surface, (0, 0))
+		else:
+			screen.blit(src_surface, (0, 0))
+
+	def zerocopy(frame, destsize, src_surface, dest_surface):
+		frame_surface = pygame.image.frombuffer(frame, vidsize, "RGB")
+		if destsize != vidsize:
+			pygame.transform.scale(frame_surface, destsize, dest_surface)
+			frame_surface = dest_surface
+		screen.blit(frame_surface, (0, 0))
+
+	for destsize in [vidsize, (args.width, args.height)]:
+		src_surface, dest_surface = surface(vidsize), surface(destsize)
+		for name, draw in [("copy", copy), ("zerocopy", zerocopy)]:
+			render_times = np.zeros(args.repeat * len(frames))
+			for i in range(len(render_times)):
+				t0 = player.monotonic_time()
+				draw(frames[i % len(frames)], destsize, src_surface, dest_surface)
+				render_times[i] = player.monotonic_time() - t0
+			print("{0} {1}x{2} to {3}x{4}".format(name, vidsize[0], vidsize[1], *destsize))
+			print("\tRender time: {0}".format(summarize(render_times)))
+	pygame.display.quit()
+
+def benchmark_handlers(args):
+	""" Drives the frame handlers of the plugin against an offscreen window:
+	the expyriment handler (OpenGL, with and without pixel buffer objects,
+	with RGB and YUV frames), the psychopy handler (if pyglet is installed)
+	and the legacy handler (pygame, with both drawing paths). Prerecorded
+	frames of a synthetic clip are handed over, drawn and flipped as in the
+	run loop of the plugin, at every frame size. The time spent on uploading,
+	drawing (including the upload) and flipping each frame is reported. """
+	import pygame
+	handlers = load_handlers()
+	windowsize = tuple(int(n) for n in args.window.split("x"))
+	variants = []
+	for gl_upload in ["pbo", "direct"]:
+		for pixel_format in player.PIXEL_FORMATS:
+			variants.append(("expyriment", gl_upload, pixel_format, None))
+	variants.append(("psychopy", "pbo", "rgb24", None))
+	for legacy_render in ["copy", "zerocopy"]:
+		variants.append(("legacy", None, "rgb24", legacy_render))
+	variants = [variant for variant in variants if variant[0] in args.handlers]
+
+	for size in args.sizes:
+		vidsize = tuple(int(n) for n in size.split("x"))
+		if args.no_resize:
+			destsize = vidsize
+		else:
+			# Fit the frames to the window, as the plugin does by default
+			scale = min(windowsize[0] / vidsize[0], windowsize[1] / vidsize[1])
+			destsize = (int(vidsize[0] * scale), int(vidsize[1] * scale))
+		videofile = synthetic_clip(args.clip_dir, vidsize, 30, audio=False,
+			duration=args.frames / 30.0)
+		clip = VideoFileClip(videofile, audio=False)
+		frames = {}
+		for pixel_format in set(variant[2] for variant in variants):
+			clip.reader.close()
+			decoder = player.StreamDecoder(clip.reader, pixel_format=pixel_format)
+			frames[pixel_format] = [decoder.get_frame(frame_no).copy()
+				for frame_no in range(min(args.frames, clip.reader.nframes))]
+			decoder.close()
+		clip.close()
+
+		for name, gl_upload, pixel_format, legacy_render in variants:
+			label = "{0} handler, {1}x{2} {3} frames drawn at {4}x{5}".format(name,
+				vidsize[0], vidsize[1], pixel_format, *destsize)
+			if gl_upload:
+				label += ", {0} upload".format(gl_upload)
+			if legacy_render:
+				label += ", {0} rendering".format(legacy_render)
+			main_player = StubMainPlayer(vidsize, windowsize, destsize,
+				args.repeat * len(frames[pixel_format]), pixel_format, gl_upload or "pbo",
+				legacy_render or "zerocopy")
+			if name == "legacy":
+				if not os.environ.get("DISPLAY") and not sys.platform.startswith(("win", "darwin")):
+					os.environ.setdefault("SDL_VIDEODRIVER", "offscreen")
+				pygame.display.init()
+				screen = pygame.display.set_mode(windowsize, getattr(pygame, "HIDDEN", 0), 32)
+			else:
+				create_gl_context(windowsize)
+				screen = None
+				if name == "psychopy":
+					try:
+						import pyglet.gl
+					except ImportError:
+						print("{0}: skipped, pyglet is not installed".format(label))
+						pygame.display.quit()
+						continue
+					# Stands in for the PsychoPy window, of which the handler
+					# only uses flip()
+					screen = argparse.Namespace(flip=pygame.display.flip)
+			handler = handlers[name + "_handler"](main_player, screen)
+			handler.prepare_for_playback()
+			timings = main_player.player.timings
+			for i in range(main_player.player.nframes):
+				handler.handle_videoframe(frames[pixel_format][i % len(frames[pixel_format])])
+				start = player.monotonic_time()
+				handler.draw_frame()
+				start = timings.record("draw", start)
+				handler.swap_buffers()
+				timings.record("flip", start)
+			handler.playback_finished()
+			pygame.display.quit()
+
+			print(label)
+			if name == "legacy":
+				# The legacy handler draws frames without uploading them
+				print("\tCopying and blitting: {0}".format(summarize(
+					handler.render_times[:handler.n_renders])))
+			else:
+				print("\tUploading: {0}".format(summarize(timings.durations("upload"))))
+			print("\tDrawing: {0}".format(summarize(timings.durations("draw"))))
+			print("\tFlipping: {0}".format(summarize(timings.durations("flip"))))
+
+def benchmark_cache(args):
+	""" Measures the time it takes to prepare a player for a trial, with and
+	without the clip cache. The clip is loaded (and with --preload decoded
+	completely) once for every trial, as the plugin does in prepare(), and the
+	distribution of the prepare times and the cache statistics are reported. """
+	for use_cache in [False, True]:
+		cache = player.ClipCache() if use_cache else None
+		prepare_times = np.zeros(args.trials)
+		for trial in range(args.trials):
+			start = player.monotonic_time()
+			mplayer = player.Player(args.videofile, decode_mode="stream",
+				clip_cache=cache, preload=args.preload)
+			if args.preload:
+				mplayer.preload_frames()
+			prepare_times[trial] = player.monotonic_time() - start
+			# The trial is over, so the next player can check out the clip
+			mplayer.release()
+		print("with clip cache" if use_cache else "without clip cache")
+		print("\tPrepare time: {0}".format(summarize(prepare_times)))
+		if cache:
+			print("\tCache: {hits} hits, {misses} misses, {busy} busy, {evictions} evictions, "
+				"{bytes} bytes".format(**cache.stats))
+
+def benchmark_preload(args):
+	""" Compares playing a clip that is decoded during playback with playing
+	it from memory after preloading it completely. Decoding is slowed down to
+	simulate decode jitter. For both modes the frame delivery delay and frame
+	counters are reported, together with the preload time and the growth of
+	the resident memory of the process. """
+	for preload in [False, True]:
+		rss_start = player.resident_memory()
+		mplayer, lateness = play_headless(args.videofile, args.decode_spike / 1000.0,
+			clock_mode="monotonic", decode_mode="stream", prefetch_depth=args.prefetch_depth,
+			preload=preload, preload_memmap=args.memmap * 1024**2 if args.memmap else None)
+		rss = player.resident_memory()
+		print("preloaded" if preload else "decoded during playback")
+		print("\tFrames: {rendered} rendered, {dropped} dropped, {repeated} repeated, "
+			"{late} late".format(**mplayer.frame_stats))
+		print("\tDelivery delay: {0}".format(summarize(lateness)))
+		if mplayer.preload_stats:
+			print("\tPreloaded {0:.1f} MB in {1:.3f} s{2}".format(mplayer.preload_stats["bytes"] / 1e6,
+				mplayer.preload_stats["time"], " (memory-mapped)" if mplayer.preload_stats["memmap"] else ""))
+			if mplayer.preload_stats["memory"] is not None:
+				print("\tPreloading grew the resident memory by {0:.1f} MB".format(
+					mplayer.preload_stats["memory"] / 1e6))
+		if rss is not None:
+			print("\tResident memory grew by {0:.1f} MB".format((rss - rss_start) / 1e6))
+
+def benchmark_framecache(args):
+	""" Measures the time it takes to get a clip ready for playback with the
+	on-disk frame cache. The first (cold) load decodes the clip into the cache
+	file, later (warm) loads only validate and map it. For comparison, the
+	time to preload the clip into memory without the cache is reported too. """
+	import shutil
+	import tempfile
+	cache_dir = args.dir or tempfile.mkdtemp()
+	try:
+		for name, kwargs in [("preload without frame cache", {'preload': True}),
+			("cold frame cache", {'frame_cache_dir': cache_dir}),
+			("warm frame cache", {'frame_cache_dir': cache_dir})]:
+			times = np.zeros(args.trials if name.startswith("warm") else 1)
+			for i in range(len(times)):
+				mplayer = player.Player(args.videofile, decode_mode="stream", **kwargs)
+				mplayer.preload_frames()
+				times[i] = mplayer.preload_stats["time"]
+			print(name)
+			print("\tReady for playback after: {0}".format(summarize(times)))
+			print("\tFrames and audio: {0:.1f} MB".format(mplayer.preload_stats["bytes"] / 1e6))
+	finally:
+		if not args.dir:
+			shutil.rmtree(cache_dir)
+
+def benchmark_seek(args):
+	""" Measures how long seek() takes to deliver a frame, for random targets
+	and for targets in increasing order (like consecutive segments of a clip).
+	The "stream" decode mode uses the keyframe index of the clip, the "time"
+	decode mode is moviepy's own seeking. The time to scan the keyframes of
+	the clip and to load the stored index is reported as well. """
+	import shutil
+	import tempfile
+	# Scan into a folder of our own, so an index the user has stored next to
+	# the video is left alone
+	index_dir = tempfile.mkdtemp()
+	try:
+		fps = player.Player(args.videofile, play_audio=False).fps
+		start = time.time()
+		index = player.KeyframeIndex.load(args.videofile, fps, index_dir)
+		print("Keyframe index: {0} keyframes, scanned in {1:.3f} s".format(len(index),
+			time.time() - start))
+		start = time.time()
+		player.KeyframeIndex.load(args.videofile, fps, index_dir)
+		print("\tLoaded from {0} in {1:.3f} ms".format(player.KeyframeIndex.path(
+			args.videofile, index_dir), 1000 * (time.time() - start)))
+	finally:
+		shutil.rmtree(index_dir)
+
+	rng = np.random.RandomState(args.seed)
+	for order in ["random", "increasing"]:
+		for decode_mode in ["stream", "time"]:
+			mplayer = player.Player(args.videofile, play_audio=False, decode_mode=decode_mode)
+			# Use the index that was scanned above
+			mplayer.keyframe_index = index
+			targets = rng.randint(0, mplayer.nframes, args.targets)
+			if order == "increasing":
+				targets.sort()
+			times = np.zeros(len(targets))
+			distances = np.zeros(len(targets))
+			for i, frame_no in enumerate(targets):
+				mplayer.seek(frame_no, unit="frames")
+				times[i] = mplayer.seek_stats["time"]
+				if mplayer.seek_stats["keyframe"] is not None:
+					distances[i] = frame_no - mplayer.seek_stats["keyframe"]
+			# Step forward through consecutive frames from a random frame
+			steps = np.zeros(min(args.targets, mplayer.nframes - 1))
+			mplayer.seek(rng.randint(0, mplayer.nframes - len(steps)), unit="frames")
+			for i in range(len(steps)):
+				mplayer.step()
+				steps[i] = mplayer.seek_stats["time"]
+			print("{0} targets, {1} decode mode".format(order, decode_mode))
+			print("\tSeek: {0}".format(summarize(times)))
+			print("\tStep: {0}".format(summarize(steps)))
+			if mplayer.decoder_stats:
+				print("\tFrames past the keyframe: mean {0:.1f}, {decoded} decoded, "
+					"{skipped} skipped, {seeks} seeks".format(distances.mean(), **mplayer.decoder_stats))
+
+def benchmark_loop(args):
+	""" Measures the gap between the last frame of a clip and the first frame
+	of its next repetition. The clip is repeated with the loop option of the
+	player and as a playlist of queued clips, which both prepare the next
+	repetition in the background, and by loading and playing the clip again
+	after it ended, as was needed before. For all three, the intervals
+	between consecutive frames within a repetition and the gaps between
+	repetitions are reported; a gap of one frame interval is gapless.
+
+	For the loop option and the playlist, the benchmark fails (with exit
+	status 1) if a gap is longer than one frame interval, if the frames of a
+	repetition are not played in order, or if times_played does not match
+	the number of repetitions that were played. """
+	failures = []
+	for mode in ["loop", "playlist", "reload"]:
+		frame_times = []
+		frame_numbers = []
+		repetitions = []
+		restarts = [0]
+		def videorenderfunc(frame):
+			frame_times.append(player.monotonic_time())
+			frame_numbers.append(mplayer.rendered_frame_no)
+			repetitions.append(restarts[0] if mode == "reload" else mplayer.times_played)
+
+		mplayer = player.Player(args.videofile, videorenderfunc=videorenderfunc,
+			play_audio=False, decode_mode=args.decode_mode, loop=mode == "loop")
+		if mode == "playlist":
+			for repetition in range(args.repetitions - 1):
+				mplayer.queue(args.videofile)
+		mplayer.play()
+		# The playlist and the reloaded clip play until their last repetition
+		# has ended, the loop until enough frames have been played
+		while mode != "loop" or len(frame_times) < args.repetitions * mplayer.nframes:
+			time.sleep(0.001)
+			if not mplayer.status in [player.PLAYING, player.PAUSED]:
+				if mode != "reload" or restarts[0] == args.repetitions - 1:
+					break
+				restarts[0] += 1
+				mplayer.load_video(args.videofile)
+				mplayer.play()
+		mplayer.stop()
+		if mplayer.renderloop:
+			mplayer.renderloop.join()
+
+		intervals = np.diff(frame_times)
+		boundaries = np.diff(repetitions) != 0
+		print({"loop": "loop option", "playlist": "playlist",
+			"reload": "load and play again"}[mode])
+		print("\tFrame interval within a repetition: {0}".format(summarize(intervals[~boundaries])))
+		print("\tGap between repetitions: {0}".format(summarize(intervals[boundaries])))
+		if mode == "reload":
+			continue
+		print("\tFirst frames late by: {0}".format(summarize(mplayer.transitions[:,1])))
+
+		# Gapless repetitions that are played completely and in order
+		frame_interval = 1.0 / mplayer.fps
+		errors = []
+		if len(mplayer.transitions) and mplayer.transitions[:,0].max() > frame_interval:
+			errors.append("gap of {0:.1f} ms is longer than the frame interval ({1:.1f} ms)".format(
+				1000 * mplayer.transitions[:,0].max(), 1000 * frame_interval))
+		if np.any(np.diff(repetitions) < 0) or np.any(np.diff(repetitions) > 1):
+			errors.append("repetitions were not played in order")
+		if np.any(np.diff(frame_numbers)[~boundaries] <= 0) or \
+			np.any(np.asarray(frame_numbers[1:])[boundaries] != 0):
+			errors.append("frames within a repetition were not played in order")
+		played = repetitions[-1] + (1 if mode == "playlist" else 0)
+		if mode == "playlist" and played != args.repetitions:
+			errors.append("{0} of {1} clips were played".format(played, args.repetitions))
+		if mplayer.times_played != played or len(mplayer.transitions) != repetitions[-1]:
+			errors.append("times_played is {0}, but {1} repetitions were played".format(
+				mplayer.times_played, played))
+		for error in errors:
+			print("\tFAILED: {0}".format(error))
+		failures += errors
+	if failures:
+		sys.exit(1)
+
+def benchmark_multiprocess(args):
+	""" Plays a (preferably 4K) clip with the frames decoded in this process
+	(the "stream" decode mode with a prefetch thread) and in a separate
+	decoder process (the "process" decode mode), while other threads keep the
+	interpreter busy, as the render loop and the audio thread do in an
+	experiment. For both, the missed (dropped, repeated or late) frames, the
+	frame delivery delay and the CPU time of this process are reported, as
+	well as how much work the busy threads got done. The difference shows on
+	machines with more cores than busy threads. """
+	import threading
+	for name, decode_mode in [("decoded in this process", "stream"),
+		("decoded in a separate process", "process")]:
+		stopped = threading.Event()
+		iterations = [0] * args.load_threads
+		def busy(i):
+			# Keep the interpreter busy for load of every 10 ms
+			while not stopped.is_set():
+				start = time.time()
+				while time.time() - start < 0.01 * args.load:
+					sum(range(100))
+					iterations[i] += 1
+				time.sleep(0.01 * (1 - args.load))
+		threads = [threading.Thread(target=busy, args=(i,)) for i in range(args.load_threads)]
+		for thread in threads:
+			thread.start()
+		start = time.time()
+		cpu_start = cpu_time()
+		try:
+			mplayer, lateness = play_headless(args.videofile, decode_mode=decode_mode,
+				prefetch_depth=args.prefetch_depth, pixel_format=args.pixel_format,
+				clock_mode="monotonic")
+		finally:
+			stopped.set()
+			for thread in threads:
+				thread.join()
+		duration = time.time() - start
+		cpu = cpu_time() - cpu_start
+		if mplayer.decoder:
+			mplayer.decoder.close()
+		stats = mplayer.frame_stats
+		print(name)
+		print("\tFrames: {rendered} rendered, {dropped} dropped, {repeated} repeated, "
+			"{late} late".format(**stats))
+		print("\tMissed: {0} of {1} frames".format(stats['dropped'] + stats['repeated'] +
+			stats['late'], mplayer.nframes))
+		print("\tDelivery delay: {0}".format(summarize(lateness)))
+		print("\tCPU time of this process: {0:.0f}% of {1:.1f} s".format(
+			100 * cpu / duration, duration))
+		if args.load_threads:
+			print("\tBusy threads: {0:.0f} iterations/s".format(sum(iterations) / duration))
+
+def benchmark_runloop(args):
+	""" Runs the plugin's item, with its run loop waiting for the frames the
+	player hands over and processing input input_poll_rate times per second
+	in between, for each of the given input poll rates. Frames are handed to
+	a stand-in handler that does not draw them. For each rate, the CPU time
+	of the process, the latency between the hand-over of a frame and the
+	moment the run loop draws it, how often input was processed and the
+	frame counters of the player are reported. """
+	for input_poll_rate in args.input_poll_rate:
+		run = run_plugin(args.videofile, decode_mode=args.decode_mode,
+			prefetch_depth=args.prefetch_depth, clock_mode="monotonic",
+			input_poll_rate=input_poll_rate)
+		print("input polled {0:g} times/s".format(input_poll_rate))
+		print("\tCPU time: {0:.0f}% of {1:.1f} s".format(100 * run.cpu / run.duration,
+			run.duration))
+		print("\tFrame pick-up latency: {0}".format(summarize(run.handler.latencies)))
+		print("\tFrames: {rendered} rendered, {dropped} dropped, {repeated} repeated, "
+			"{late} late".format(**run.item.player.frame_stats))
+		print("\tInput processed {0:.0f} times/s".format(run.handler.polls / run.duration))
+
+def benchmark_timings(args):
+	""" Plays a clip with and without recording the duration of every stage of
+	playback (see player.StageTimings), and reports the durations of the
+	stages, the cost of recording a duration and of checking whether timings
+	are recorded at all (which is all that is left when they are not), and
+	the CPU time of both playbacks. Optionally writes the durations to a CSV
+	or NPZ file. """
+	n = 100000
+	timings = player.StageTimings(["stage"], capacity=1000)
+	start = player.monotonic_time()
+	for _ in range(n):
+		timings.record("stage", player.monotonic_time())
+	record_cost = (player.monotonic_time() - start) / n
+	disabled = None
+	start = player.monotonic_time()
+	for _ in range(n):
+		if disabled is not None:
+			pass
+	check_cost = (player.monotonic_time() - start) / n
+	print("Cost per recorded duration: {0:.3f} us, when disabled: {1:.3f} us".format(
+		1e6 * record_cost, 1e6 * check_cost))
+
+	for timings in [None, player.StageTimings()]:
+		audio_device = SimulatedAudioDevice(44100) if args.audio else None
+		start = time.time()
+		cpu_start = cpu_time()
+		mplayer, lateness = play_headless(args.videofile, audio_device=audio_device,
+			timings=timings, decode_mode=args.decode_mode, prefetch_depth=args.prefetch_depth,
+			clock_mode="monotonic")
+		duration = time.time() - start
+		cpu = cpu_time() - cpu_start
+		print("with timings" if timings else "without timings")
+		print("\tCPU time: {0:.0f}% of {1:.1f} s".format(100 * cpu / duration, duration))
+		print("\tFrames: {rendered} rendered, {dropped} dropped, {repeated} repeated, "
+			"{late} late".format(**mplayer.frame_stats))
+		if timings:
+			for stage in timings.stages:
+				print("\t{0}: {1} x, {2}".format(stage, timings.count(stage),
+					summarize(timings.durations(stage))))
+			if args.output:
+				timings.save(args.output)
+				print("Durations written to {0}".format(args.output))
+
+def measure_pipeline(videofile, args):
+	""" Measures the decoding throughput of videofile, and plays it with null
+	video and audio sinks. Runs in a separate process for every clip of the
+	pipeline benchmark, so the peak memory use is that of a single clip.
+
+	Returns:
+	dict with the measurements
+	"""
+	# Decode all frames as fast as possible, in the way the stream and process
+	# decode modes do
+	clip = VideoFileClip(videofile, audio=False)
+	decoder = player.StreamDecoder(clip.reader, pixel_format=args.pixel_format)
+	nframes = clip.reader.nframes
+	out = np.empty(decoder.frame_shape, dtype=np.uint8)
+	start = time.time()
+	for frame_no in range(nframes):
+		decoder.get_frame(frame_no, out)
+	decode_fps = nframes / (time.time() - start)
+	decoder.close()
+	clip.close()
+
+	# Play it in real time
+	audio_device = SimulatedAudioDevice(44100) if args.audio != "no" else None
+	start = time.time()
+	cpu_start = cpu_time()
+	ffmpeg_cpu_start = children_cpu_time()
+	mplayer, lateness = play_headless(videofile, audio_device=audio_device,
+		decode_mode=args.decode_mode, prefetch_depth=args.prefetch_depth,
+		pixel_format=args.pixel_format, clock_mode="monotonic")
+	duration = time.time() - start
+	if mplayer.decoder:
+		mplayer.decoder.close()
+	mplayer.clip.close()
+	cpu = cpu_time() - cpu_start
+	if ffmpeg_cpu_start is not None:
+		cpu += children_cpu_time() - ffmpeg_cpu_start
+	stats = mplayer.frame_stats
+	lateness = np.asarray(lateness)
+	rss, child_rss = peak_memory()
+	return {
+		"frames": mplayer.nframes,
+		"decode_fps": decode_fps,
+		"missed": stats["dropped"] + stats["repeated"] + stats["late"],
+		"dropped": stats["dropped"],
+		"jitter_ms": 1000 * lateness.std() if len(lateness) else None,
+		"lateness_p95_ms": 1000 * np.percentile(lateness, 95) if len(lateness) else None,
+		"cpu_percent": 100 * cpu / duration,
+		"peak_rss_mb": rss / 1024.0**2 if rss else None,
+		"peak_ffmpeg_rss_mb": child_rss / 1024.0**2 if child_rss else None,
+	}
+
+def benchmark_pipeline(args):
+	""" Generates synthetic clips in every combination of the given sizes,
+	frame rates, codecs and with and without audio, and plays each of them
+	headlessly with null video and audio sinks, in a separate process. For
+	every clip, the decoding throughput (frames per second when decoding as
+	fast as possible), the jitter (sd) and 95th percentile of the frame
+	delivery delay, the missed and dropped frames, the CPU use of the player
+	and ffmpeg during playback and the peak memory use are reported. Needs
+	nothing but ffmpeg, so results can be compared between releases. """
+	if args.measure:
+		# Measure a single clip in this (child) process
+		print(json.dumps(measure_pipeline(args.measure, args)))
+		return
+
+	audio_options = {"yes": [True], "no": [False], "both": [False, True]}[args.audio]
+	clips = []
+	print("Generating clips in {0}".format(args.clip_dir))
+	for size in args.sizes:
+		size = tuple(int(n) for n in size.split("x"))
+		for fps in args.fps:
+			for codec in args.codecs:
+				for audio in audio_options:
+					clips.append(synthetic_clip(args.clip_dir, size, fps, codec, audio,
+						args.duration))
+
+	columns = [("decode_fps", "decode fps", "{0:.0f}"), ("missed", "missed", "{0}"),
+		("dropped", "dropped", "{0}"), ("jitter_ms", "jitter ms", "{0:.2f}"),
+		("lateness_p95_ms", "p95 delay ms", "{0:.2f}"), ("cpu_percent", "CPU %", "{0:.0f}"),
+		("peak_rss_mb", "RSS MB", "{0:.0f}"), ("peak_ffmpeg_rss_mb", "ffmpeg RSS MB", "{0:.0f}")]
+	print("Playing with decode mode {0}, prefetch depth {1}, pixel format {2}".format(
+		args.decode_mode, args.prefetch_depth, args.pixel_format))
+	print("\t".join(["clip"] + [title for key, title, fmt in columns]))
+	results = []
+	for videofile in clips:
+		output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+			"pipeline", "--measure", videofile, "--decode-mode", args.decode_mode,
+			"--prefetch-depth", str(args.prefetch_depth), "--pixel-format",
+			args.pixel_format, "--audio", "yes" if "_audio_" in videofile else "no"])
+		# The player prints status messages before the result
+		result = json.loads(output.decode("utf8").strip().splitlines()[-1])
+		result["clip"] = os.path.splitext(os.path.basename(videofile))[0]
+		results.append(result)
+		print("\t".join([result["clip"]] + ["-" if result[key] is None else fmt.format(result[key])
+			for key, title, fmt in columns]))
+
+	if args.output:
+		keys = ["clip", "frames"] + [key for key, title, fmt in columns]
+		with open(args.output, "w") as f:
+			f.write(",".join(keys) + "\n")
+			for result in results:
+				f.write(",".join("" if result[key] is None else str(result[key])
+					for key in keys) + "\n")
+		print("Results written to {0}".format(args.output))
+
+def benchmark_presentation(args):
+	""" Runs the plugin's item on a simulated display with vertical sync, with
+	frames flipped as soon as the player hands them over ("frame") and at the
+	refresh they are due at ("vsync", with frames handed over a refresh in
+	advance), the two presentation modes of the plugin. For both, the number
+	of refreshes each frame stayed on screen (which for 24 fps on 60 Hz should
+	alternate between 3 and 2) and the delay of the flips relative to the
+	time each frame is due at are reported. """
+	from collections import Counter
+	for presentation in ["frame", "vsync"]:
+		StubHandler.display = SimulatedDisplay(args.refresh_rate)
+		try:
+			run = run_plugin(args.videofile, decode_mode="stream", prefetch_depth=4,
+				clock_mode="monotonic", presentation=presentation,
+				refresh_rate=args.refresh_rate)
+		finally:
+			StubHandler.display = None
+
+		# The onsets are on the player's clock (in ms), on which the clip
+		# starts at 0. At best a frame appears at the first refresh after it
+		# is due, which is up to one refresh interval late.
+		onsets = run.frame_onsets / [1, 1000.0]
+		refresh_interval = 1.0 / args.refresh_rate
+		refreshes = np.round(np.diff(onsets[:,1]) / refresh_interval).astype(int)
+		delays = onsets[:,1] - onsets[:,0] / run.fps
+		print(presentation)
+		print("\tFrames on screen: {0} of {1}".format(len(onsets), run.nframes))
+		print("\tRefreshes per frame: {0}".format(", ".join("{0}: {1}x".format(n, count)
+			for n, count in sorted(Counter(refreshes).items()))))
+		print("\tCadence of the first frames: {0}".format(" ".join(str(n) for n in refreshes[:12])))
+		print("\tFlip delay: {0}".format(summarize(delays)))
+
+def main():
+	parser = argparse.ArgumentParser(description="Media player benchmarks")
+	subparsers = parser.add_subparsers(dest="benchmark")
+
+	clock_parser = subparsers.add_parser("clock", help=benchmark_clock.__doc__.split(".")[0])
+	clock_parser.add_argument("--clocks", type=int, default=4,
+		help="number of clocks running simultaneously (default: 4)")
+	clock_parser.add_argument("--duration", type=float, default=5.0,
+		help="duration of the measurement per clock mode in seconds (default: 5)")
+	clock_parser.add_argument("--fps", type=float, default=60.0,
+		help="frame rate set in the clocks (default: 60)")
+	clock_parser.add_argument("--poll-interval", type=float, default=0.005,
+		help="interval at which the clock is polled in seconds (default: 0.005)")
+	clock_parser.set_defaults(func=benchmark_clock)
+
+	prefetch_parser = subparsers.add_parser("prefetch", help=benchmark_prefetch.__doc__.split(".")[0])
+	prefetch_parser.add_argument("videofile", help="video file to play")
+	prefetch_parser.add_argument("--depths", type=int, nargs="+", default=[0, 4, 8],
+		help="prefetch depths to compare (default: 0 4 8)")
+	prefetch_parser.add_argument("--decode-spike", type=float, default=0.0,
+		help="simulate a decoder that takes this many extra ms for every 10th frame")
+	prefetch_parser.set_defaults(func=benchmark_prefetch)
+
+	decode_parser = subparsers.add_parser("decode", help=benchmark_decode.__doc__.split(".")[0])
+	decode_parser.add_argument("videofile", help="video file to play")
+	decode_parser.add_argument("--prefetch-depth", type=int, default=0,
+		help="prefetch depth to use for both decode modes (default: 0)")
+	decode_parser.set_defaults(func=benchmark_decode)
+
+	sync_parser = subparsers.add_parser("sync", help=benchmark_sync.__doc__.split(".")[0])
+	sync_parser.add_argument("videofile", help="video file to play")
+	sync_parser.add_argument("--prefetch-depth", type=int, default=4,
+		help="prefetch depth to use for all policies (default: 4)")
+	sync_parser.add_argument("--decode-spike", type=float, default=100.0,
+		help="simulate a decoder that takes this many extra ms for every 10th frame (default: 100)")
+	sync_parser.set_defaults(func=benchmark_sync)
+
+	schedule_parser = subparsers.add_parser("schedule", help=benchmark_schedule.__doc__.split(".")[0])
+	schedule_parser.add_argument("videofile", help="video file to play")
+	schedule_parser.add_argument("--prefetch-depth", type=int, default=4,
+		help="prefetch depth to use (default: 4)")
+	schedule_parser.add_argument("--spin-waits", type=float, nargs="+", default=[0.0, 0.5, 1.0],
+		help="spin-wait durations to compare, in ms (default: 0 0.5 1)")
+	schedule_parser.set_defaults(func=benchmark_schedule)
+
+	audio_parser = subparsers.add_parser("audio", help=benchmark_audio.__doc__.split(".")[0])
+	audio_parser.add_argument("videofile", help="video file with an audio track")
+	audio_parser.add_argument("--block-size", type=int, default=1024,
+		help="number of samples per block for the stream reader (default: 1024)")
+	audio_parser.set_defaults(func=benchmark_audio)
+
+	avsync_parser = subparsers.add_parser("avsync", help=benchmark_avsync.__doc__.split(".")[0])
+	avsync_parser.add_argument("videofile", help="video file with an audio track")
+	avsync_parser.add_argument("--drift", type=float, default=-1.0,
+		help="deviation of the simulated audio device clock in percent (default: -1)")
+	avsync_parser.add_argument("--latency", type=float, default=20.0,
+		help="output latency of the simulated audio device in ms (default: 20)")
+	avsync_parser.set_defaults(func=benchmark_avsync)
+
+	quad_parser = subparsers.add_parser("quad", help=benchmark_quad.__doc__.split(".")[0])
+	quad_parser.add_argument("--frames", type=int, default=2000,
+		help="number of frames to draw per path (default: 2000)")
+	quad_parser.add_argument("--width", type=int, default=1024,
+		help="width of the window in pixels (default: 1024)")
+	quad_parser.add_argument("--height", type=int, default=768,
+		help="height of the window in pixels (default: 768)")
+	quad_parser.set_defaults(func=benchmark_quad)
+
+	pixelformat_parser = subparsers.add_parser("pixelformat", help=benchmark_pixelformat.__doc__.split(".")[0])
+	pixelformat_parser.add_argument("videofile", help="video file to decode")
+	pixelformat_parser.add_argument("--no-upload", action="store_true",
+		help="only decode the frames, without uploading them to OpenGL textures")
+	pixelformat_parser.set_defaults(func=benchmark_pixelformat)
+
+	scale_parser = subparsers.add_parser("scale", help=benchmark_scale.__doc__.split(".")[0])
+	scale_parser.add_argument("videofile", help="video file to decode")
+	scale_parser.add_argument("--factor", type=float, default=0.5,
+		help="factor to scale the frames down with (default: 0.5)")
+	scale_parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+		help="size to scale the frames down to, instead of a factor")
+	scale_parser.set_defaults(func=benchmark_scale)
+
+	legacy_parser = subparsers.add_parser("legacy", help=benchmark_legacy.__doc__.split(".")[0])
+	legacy_parser.add_argument("videofile", help="video file to take the frames from")
+	legacy_parser.add_argument("--frames", type=int, default=60,
+		help="number of frames to decode and keep in memory (default: 60)")
+	legacy_parser.add_argument("--repeat", type=int, default=5,
+		help="number of times to draw every frame (default: 5)")
+	legacy_parser.add_argument("--width", type=int, default=1024,
+		help="width of the window in pixels (default: 1024)")
+	legacy_parser.add_argument("--height", type=int, default=768,
+		help="height of the window in pixels (default: 768)")
+	legacy_parser.set_defaults(func=benchmark_legacy)
+
+	handlers_parser = subparsers.add_parser("handlers", help=benchmark_handlers.__doc__.split(".")[0])
+	handlers_parser.add_argument("--sizes", nargs="+", default=["640x360", "1280x720", "1920x1080"],
+		help="sizes of the frames as WIDTHxHEIGHT (default: 640x360 1280x720 1920x1080)")
+	handlers_parser.add_argument("--window", default="1920x1080",
+		help="size of the offscreen window as WIDTHxHEIGHT (default: 1920x1080)")
+	handlers_parser.add_argument("--no-resize", action="store_true",
+		help="draw the frames at their own size instead of fitting them to the window")
+	handlers_parser.add_argument("--handlers", nargs="+", choices=["expyriment", "psychopy", "legacy"],
+		default=["expyriment", "psychopy", "legacy"], help="handlers to benchmark (default: all)")
+	handlers_parser.add_argument("--frames", type=int, default=60,
+		help="number of frames to decode and keep in memory (default: 60)")
+	handlers_parser.add_argument("--repeat", type=int, default=3,
+		help="number of times to draw every frame (default: 3)")
+	handlers_parser.add_argument("--clip-dir",
+		default=os.path.join(tempfile.gettempdir(), "media_player_benchmark"),
+		help="folder to keep the generated clips in (default: media_player_benchmark "
+		"in the temporary folder)")
+	handlers_parser.set_defaults(func=benchmark_handlers)
+
+	cache_parser = subparsers.add_parser("cache", help=benchmark_cache.__doc__.split(".")[0])
+	cache_parser.add_argument("videofile", help="video file to load")
+	cache_parser.add_argument("--trials", type=int, default=20,
+		help="number of trials to prepare (default: 20)")
+	cache_parser.add_argument("--preload", action="store_true",
+		help="decode all frames of the clip in every trial")
+	cache_parser.set_defaults(func=benchmark_cache)
+
+	preload_parser = subparsers.add_parser("preload", help=benchmark_preload.__doc__.split(".")[0])
+	preload_parser.add_argument("videofile", help="video file to play")
+	preload_parser.add_argument("--prefetch-depth", type=int, default=0,
+		help="prefetch depth to use when decoding during playback (default: 0)")
+	preload_parser.add_argument("--decode-spike", type=float, default=50.0,
+		help="simulate a decoder that takes this many extra ms for every 10th frame (default: 50)")
+	preload_parser.add_argument("--memmap", type=float, default=0,
+		help="memory-map preloaded clips larger than this many MB (default: never)")
+	preload_parser.set_defaults(func=benchmark_preload)
+
+	framecache_parser = subparsers.add_parser("framecache", help=benchmark_framecache.__doc__.split(".")[0])
+	framecache_parser.add_argument("videofile", help="video file to cache")
+	framecache_parser.add_argument("--dir",
+		help="directory for the cache files (default: a temporary directory that is removed afterwards)")
+	framecache_parser.add_argument("--trials", type=int, default=10,
+		help="number of warm loads (default: 10)")
+	framecache_parser.set_defaults(func=benchmark_framecache)
+
+	seek_parser = subparsers.add_parser("seek", help=benchmark_seek.__doc__.split(".")[0])
+	seek_parser.add_argument("videofile", help="video file to seek in")
+	seek_parser.add_argument("--targets", type=int, default=50,
+		help="number of frames to seek to per order and decode mode (default: 50)")
+	seek_parser.add_argument("--seed", type=int, default=0,
+		help="seed for the random targets (default: 0)")
+	seek_parser.set_defaults(func=benchmark_seek)
+
+	loop_parser = subparsers.add_parser("loop", help=benchmark_loop.__doc__.split(".")[0])
+	loop_parser.add_argument("videofile", help="video file to repeat")
+	loop_parser.add_argument("--repetitions", type=int, default=3,
+		help="number of times to play the clip (default: 3)")
+	loop_parser.add_argument("--decode-mode", choices=player.DECODE_MODES, default="stream",
+		help="decode mode of the player (default: stream)")
+	loop_parser.set_defaults(func=benchmark_loop)
+
+	multiprocess_parser = subparsers.add_parser("multiprocess",
+		help=benchmark_multiprocess.__doc__.split(".")[0])
+	multiprocess_parser.add_argument("videofile", help="video file to play, e.g. a 4K clip")
+	multiprocess_parser.add_argument("--load-threads", type=int, default=2,
+		help="number of threads that keep the interpreter busy during playback (default: 2)")
+	multiprocess_parser.add_argument("--load", type=float, default=0.5,
+		help="fraction of the time the threads are busy (default: 0.5)")
+	multiprocess_parser.add_argument("--prefetch-depth", type=int, default=8,
+		help="number of frames decoded ahead in both modes (default: 8)")
+	multiprocess_parser.add_argument("--pixel-format", choices=player.PIXEL_FORMATS,
+		default="rgb24", help="pixel format to decode the frames in (default: rgb24)")
+	multiprocess_parser.set_defaults(func=benchmark_multiprocess)
+
+	runloop_parser = subparsers.add_parser("runloop", help=benchmark_runloop.__doc__.split(".")[0])
+	runloop_parser.add_argument("videofile", help="video file to play")
+	runloop_parser.add_argument("--input-poll-rate", type=float, nargs="+", default=[50, 200, 1000],
+		help="times per second input is processed while waiting for a frame "
+		"(default: 50 200 1000)")
+	runloop_parser.add_argument("--decode-mode", choices=player.DECODE_MODES, default="stream",
+		help="decode mode of the player (default: stream)")
+	runloop_parser.add_argument("--prefetch-depth", type=int, default=4,
+		help="prefetch depth of the player (default: 4)")
+	runloop_parser.set_defaults(func=benchmark_runloop)
+
+	timings_parser = subparsers.add_parser("timings", help=benchmark_timings.__doc__.split(".")[0])
+	timings_parser.add_argument("videofile", help="video file to play")
+	timings_parser.add_argument("--decode-mode", choices=player.DECODE_MODES, default="stream",
+		help="decode mode of the player (default: stream)")
+	timings_parser.add_argument("--prefetch-depth", type=int, default=4,
+		help="prefetch depth of the player (default: 4)")
+	timings_parser.add_argument("--audio", action="store_true",
+		help="play the audio on a simulated audio device")
+	timings_parser.add_argument("--output",
+		help="file to write the durations to (.csv or .npz)")
+	timings_parser.set_defaults(func=benchmark_timings)
+
+	pipeline_parser = subparsers.add_parser("pipeline", help=benchmark_pipeline.__doc__.split(".")[0])
+	pipeline_parser.add_argument("--sizes", nargs="+", default=["640x360", "1280x720", "1920x1080"],
+		help="sizes of the clips as WIDTHxHEIGHT (default: 640x360 1280x720 1920x1080)")
+	pipeline_parser.add_argument("--fps", type=int, nargs="+", default=[30, 60],
+		help="frame rates of the clips (default: 30 60)")
+	pipeline_parser.add_argument("--codecs", nargs="+", choices=sorted(SYNTHETIC_CODECS),
+		default=["libx264", "mjpeg"], help="codecs of the clips (default: libx264 mjpeg)")
+	pipeline_parser.add_argument("--audio", choices=["yes", "no", "both"], default="both",
+		help="whether the clips have audio (default: both)")
+	pipeline_parser.add_argument("--duration", type=float, default=5.0,
+		help="duration of the clips in seconds (default: 5)")
+	pipeline_parser.add_argument("--clip-dir",
+		default=os.path.join(tempfile.gettempdir(), "media_player_benchmark"),
+		help="folder to keep the generated clips in, so they are only generated "
+		"once (default: media_player_benchmark in the temporary folder)")
+	pipeline_parser.add_argument("--decode-mode", choices=player.DECODE_MODES, default="stream",
+		help="decode mode of the player (default: stream)")
+	pipeline_parser.add_argument("--prefetch-depth", type=int, default=4,
+		help="prefetch depth of the player (default: 4)")
+	pipeline_parser.add_argument("--pixel-format", choices=player.PIXEL_FORMATS,
+		default="rgb24", help="pixel format to decode the frames in (default: rgb24)")
+	pipeline_parser.add_argument("--output", help="CSV file to write the results to")
+	pipeline_parser.add_argument("--measure", help=argparse.SUPPRESS)
+	pipeline_parser.set_defaults(func=benchmark_pipeline)
+
+	presentation_parser = subparsers.add_parser("presentation",
+		help=benchmark_presentation.__doc__.split(".")[0])
+	presentation_parser.add_argument("videofile", help="video file to play, e.g. a 24 fps clip")
+	presentation_parser.add_argument("--refresh-rate", type=float, default=60.0,
+		help="refresh rate of the simulated display in Hz (default: 60)")
+	presentation_parser.set_defaults(func=benchmark_presentation)
+
+	args = parser.parse_args()
+	if not hasattr(args, "func"):
+		parser.print_help()
+		sys.exit(1)
+	args.func(args)
+
+if __name__ == "__main__":
+	main()
@@ -41,6 +41,10 @@ from openexp.color import color
 
 import os
 import sys
+import time
+import ctypes
+import threading
+from collections import deque
 
 # Rendering components
 import pygame
@@ -66,15 +70,48 @@ class SoundrendererPygame(object):
 
 		pygame.mixer.quit()
 		print "Using pygame mixer with {0}".format(audioformat)
-		pygame.mixer.init(fps, -8 * nbytes, nchannels, 1024)
+		# Use the block size of the player's audio stream as mixer buffer size
+		pygame.mixer.init(fps, -8 * nbytes, nchannels, audioformat["blocksize"])
+
+		self.fps = fps
+		# Number of samples in the chunks that have been written
+		self.samples_written = 0
+		self.queued_samples = 0
+		# Sample position and time at which the chunk that is currently
+		# playing started
+		self.playing_start_sample = None
+		self.playing_start_time = None
 
 	def write(self, frame):
 		""" write frame to output channel """
 		chunk = pygame.sndarray.make_sound(frame)
 		if not hasattr(self,"channel"):
 			self.channel = chunk.play()
+			self.playing_start_sample = 0
+			self.playing_start_time = player.monotonic_time()
 		else:
+			# The channel can only hold one queued chunk, so wait for the
+			# queued chunk to start playing before replacing it. Only when it
+			# is seen to start is the position synchronized to it; the first
+			# chunk is still playing when the second one is queued.
+			if self.channel.get_queue() is not None:
+				while self.channel.get_queue() is not None:
+					time.sleep(0.001)
+				self.playing_start_sample = self.samples_written - self.queued_samples
+				self.playing_start_time = player.monotonic_time()
 			self.channel.queue(chunk)
+		self.queued_samples = len(frame)
+		self.samples_written += len(frame)
+
+	def get_position(self):
+		""" Returns the playback position in seconds. pygame does not report
+		this, so it is estimated from the moment the chunk that is currently
+		playing was found to have started. """
+		if self.playing_start_time is None:
+			return None
+		position = self.playing_start_sample / float(self.fps) + \
+			player.monotonic_time() - self.playing_start_time
+		return min(position, self.samples_written / float(self.fps))
 
 	def close_stream(self):
 		""" Cleanup (done by pygame.quit() in main loop) """
@@ -95,15 +132,141 @@ class SoundrendererPyAudio(object):
 			output 	= True
 		)
 
+		self.fps = fps
+		self.samples_written = 0
+		# Stream time at which the last write() returned
+		self.write_time = None
+
+	@property
+	def output_latency(self):
+		""" Output latency of the audio device in seconds """
+		return self.stream.get_output_latency()
+
 	def write(self, frame):
 		""" write frame to output channel """
 		self.stream.write(frame.data)
+		self.samples_written += len(frame)
+		self.write_time = self.stream.get_time()
+
+	def get_position(self):
+		""" Returns the playback position in seconds, based on the stream time
+		of the audio device. When write() returns, the samples written last are
+		still output_latency away from being played. """
+		if self.write_time is None:
+			return None
+		written = self.samples_written / float(self.fps)
+		position = written - self.output_latency + self.stream.get_time() - self.write_time
+		return max(0.0, min(position, written))
 
 	def close_stream(self):
 		""" cleanup """
 		self.stream.stop_stream()
 		self.stream.close()
 
+class SoundrendererPyAudioCallback(object):
+	""" Uses pyaudio in callback (non-blocking) mode to play sound. Written
+	frames are put in a lock-free ring buffer, from which the audio device
+	pulls samples whenever it needs them. """
+	def __init__(self, audioformat, buffer_blocks=8):
+		"""
+		Constructor
+
+		Arguments:
+		audioformat -- dict with the audio format as supplied by the player
+
+		Keyword arguments:
+		buffer_blocks -- size of the ring buffer, in blocks of the player's
+			audio stream (default: 8)
+		"""
+		fps 		= audioformat["fps"]
+		nchannels 	= audioformat["nchannels"]
+		nbytes   	= audioformat["nbytes"]
+		blocksize 	= audioformat["blocksize"]
+
+		self.fps = fps
+		self.buffer = player.SampleRingBuffer(blocksize * buffer_blocks, nchannels)
+		# Preallocated array the callback copies samples to
+		self.out = np.zeros((blocksize, nchannels), dtype=np.int16)
+		# Number of times the device itself reported running out of samples
+		self.device_underruns = 0
+		# Number of samples that had been played and the stream time at which
+		# the first sample of the last callback's buffer reaches the speakers
+		self.callback_sample = None
+		self.callback_dac_time = None
+
+		self.pyaudio = pyaudio.PyAudio()
+		self.stream = self.pyaudio.open(
+			channels  		= nchannels,
+			rate 			= fps,
+			format 		= pyaudio.get_format_from_width(nbytes),
+			output 		= True,
+			frames_per_buffer 	= blocksize,
+			stream_callback 	= self.__callback,
+			start 			= False
+		)
+
+	@property
+	def output_latency(self):
+		""" Output latency of the audio device in seconds """
+		return self.stream.get_output_latency()
+
+	@property
+	def stats(self):
+		""" Underruns of the ring buffer and the device, and the device's output latency """
+		return {
+			'buffer_underruns':	self.buffer.underruns,
+			'device_underruns':	self.device_underruns,
+			'output_latency':	self.output_latency,
+		}
+
+	def write(self, frame):
+		""" write frame to output channel """
+		self.buffer.write(frame)
+		# Only start pulling samples once there is something to play
+		if not self.stream.is_active():
+			self.stream.start_stream()
+
+	def __callback(self, in_data, frame_count, time_info, status):
+		""" Called by pyaudio whenever the device needs new samples """
+		if status & pyaudio.paOutputUnderflow:
+			self.device_underruns += 1
+		if len(self.out) != frame_count:
+			self.out = np.zeros((frame_count, self.out.shape[1]), dtype=np.int16)
+		sample = self.buffer.n_read
+		self.buffer.read_into(self.out)
+		# Some host APIs do not report the DAC time, estimate it in that case
+		dac_time = time_info["output_buffer_dac_time"]
+		if not dac_time:
+			dac_time = time_info["current_time"] + self.stream.get_output_latency()
+		self.callback_sample, self.callback_dac_time = sample, dac_time
+		return (self.out.tobytes(), pyaudio.paContinue)
+
+	def get_position(self):
+		""" Returns the playback position in seconds, based on the stream time
+		of the audio device, or None if it is not known (anymore) """
+		if self.callback_dac_time is None:
+			return None
+		played_all = self.buffer.n_read / float(self.fps)
+		position = self.callback_sample / float(self.fps) + \
+			self.stream.get_time() - self.callback_dac_time
+		# Stop reporting once the last samples have been played, so the
+		# player's clock can continue on its own
+		if self.buffer.end_of_stream and not self.buffer.fill and position >= played_all:
+			return None
+		return max(0.0, min(position, played_all))
+
+	def close_stream(self):
+		""" Let the remaining samples play out and cleanup """
+		self.buffer.end_of_stream = True
+		# Wait at most the duration of a full buffer for the device to drain it
+		deadline = player.monotonic_time() + self.buffer.capacity / float(self.fps)
+		while self.buffer.fill and self.stream.is_active() and \
+			player.monotonic_time() < deadline:
+			time.sleep(0.001)
+		self.stream.stop_stream()
+		self.stream.close()
+		self.pyaudio.terminate()
+
 
 #---------------------------------------------------------------------
 # Base classes (should be subclassed by backend-specific classes)
@@ -267,6 +430,29 @@ class OpenGL_renderer(object):
 	By inheriting from this class, they only need to be defined once in here.
 	"""
 
+	# Shaders that convert planar YUV 4:2:0 frames to RGB, using the BT.601
+	# limited range coefficients that ffmpeg also uses for the conversion
+	YUV_VERTEX_SHADER = """
+		void main() {
+			gl_TexCoord[0] = gl_MultiTexCoord0;
+			gl_FrontColor = gl_Color;
+			gl_Position = ftransform();
+		}
+	"""
+	YUV_FRAGMENT_SHADER = """
+		uniform sampler2D y_plane;
+		uniform sampler2D u_plane;
+		uniform sampler2D v_plane;
+		void main() {
+			vec2 pos = gl_TexCoord[0].st;
+			float y = 1.1643 * (texture2D(y_plane, pos).r - 0.0625);
+			float u = texture2D(u_plane, pos).r - 0.5;
+			float v = texture2D(v_plane, pos).r - 0.5;
+			gl_FragColor = gl_Color * vec4(y + 1.5958 * v,
+				y - 0.39173 * u - 0.8129 * v, y + 2.017 * u, 1.0);
+		}
+	"""
+
 	def __init__(self):
 		raise osexception("This class should only be subclassed on not be instantiated directly!")
 
@@ -285,18 +471,148 @@ class OpenGL_renderer(object):
 		GL.glOrtho(0.0,  self.main_player.experiment.width,  self.main_player.experiment.height, 0.0, 0.0, 1.0)
 		GL.glMatrixMode(GL.GL_MODELVIEW)
 
-		# Create black empty texture to start with, to prevent artifacts
-		img = np.zeros([self.main_player.vidsize[0], self.main_player.vidsize[1],3], dtype=np.uint8)
-		img.fill(0)
-
 		GL.glEnable(GL.GL_TEXTURE_2D)
 		GL.glBindTexture(GL.GL_TEXTURE_2D, self.texid)
-		GL.glTexImage2D( GL.GL_TEXTURE_2D, 0, GL.GL_RGB, self.main_player.vidsize[0], self.main_player.vidsize[1], 0, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, img.tostring())
-		GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
-		GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+		# The texture (and pixel buffers) are kept between runs, and only need
+		# to be (re)allocated when the video size or pixel format changes
+		texture_format = (tuple(self.main_player.vidsize), self.main_player.player.pixel_format)
+		if (getattr(self, "texture_size", None), getattr(self, "pixel_format", None)) != texture_format:
+			self.allocate_texture(*texture_format)
+		# The same goes for the quad the texture is projected on, which only
+		# needs to be rebuilt when the size or position of the video changes
+		quad_geometry = (tuple(self.main_player.destsize), tuple(self.main_player.vidPos))
+		if getattr(self, "quad_geometry", None) != quad_geometry:
+			self.build_quad(*quad_geometry)
 
 		GL.glClear(GL.GL_COLOR_BUFFER_BIT|GL.GL_DEPTH_BUFFER_BIT)
 
+		# Don't draw the last frame of a previous run
+		self.frame = None
+		self.uploaded_frame = None
+		# Time spent on uploading each frame to the GPU
+		self.upload_times = np.zeros(self.main_player.player.nframes)
+		self.n_uploads = 0
+
+	def allocate_texture(self, size, pixel_format=u"rgb24"):
+		"""
+		Allocates the texture(s) (and pixel buffers) the frames are uploaded to
+
+		Arguments:
+		size -- (width, height) of the video frames
+
+		Keyword arguments:
+		pixel_format -- format of the frames delivered by the player. "rgb24"
+			frames go to a single RGB texture, the planes of "yuv420p" frames
+			each go to a luminance texture of their own and are converted to
+			RGB by a shader (default: "rgb24")
+		"""
+		GL = self.GL
+		(w,h) = size
+
+		# (texture, width, height, format, offset in the frame, black value)
+		# for each plane of a frame
+		if pixel_format == u"yuv420p":
+			if self.yuv_program is None:
+				self.yuv_program = self.compile_program(self.YUV_VERTEX_SHADER,
+					self.YUV_FRAGMENT_SHADER)
+				GL.glUseProgram(self.yuv_program)
+				for unit, name in enumerate([b"y_plane", b"u_plane", b"v_plane"]):
+					GL.glUniform1i(GL.glGetUniformLocation(self.yuv_program, name), unit)
+				GL.glUseProgram(0)
+			while len(self.plane_texids) < 2:
+				self.plane_texids.append(self.gen_texture())
+			self.planes = [
+				(self.texid, w, h, GL.GL_LUMINANCE, 0, 16),
+				(self.plane_texids[0], w//2, h//2, GL.GL_LUMINANCE, w*h, 128),
+				(self.plane_texids[1], w//2, h//2, GL.GL_LUMINANCE, w*h + (w//2)*(h//2), 128),
+			]
+		else:
+			self.planes = [(self.texid, w, h, GL.GL_RGB, 0, 0)]
+
+		frame_nbytes = 0
+		for (texid, plane_w, plane_h, fmt, offset, black) in self.planes:
+			# Create black empty texture to start with, to prevent artifacts
+			img = np.empty([plane_h, plane_w, 3 if fmt == GL.GL_RGB else 1], dtype=np.uint8)
+			img.fill(black)
+			GL.glBindTexture(GL.GL_TEXTURE_2D, texid)
+			GL.glTexImage2D( GL.GL_TEXTURE_2D, 0, fmt, plane_w, plane_h, 0, fmt, GL.GL_UNSIGNED_BYTE, img.tobytes())
+			GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+			GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+			frame_nbytes += img.nbytes
+		GL.glBindTexture(GL.GL_TEXTURE_2D, self.texid)
+		# Rows of RGB frames (and chroma planes) are not necessarily aligned to 4 bytes
+		GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+
+		for pbo in self.pbos:
+			GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, pbo)
+			GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, frame_nbytes, None, GL.GL_STREAM_DRAW)
+		GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+		self.pbo_index = 0
+
+		self.texture_size = size
+		self.pixel_format = pixel_format
+
+	def build_quad(self, destsize, pos):
+		"""
+		Compiles the quad on which the frame texture is projected into a
+		display list, so it can be drawn with a single call for every frame
+
+		Arguments:
+		destsize -- (width, height) of the quad on the screen
+		pos -- (x, y) position of the top left corner of the quad
+		"""
+		GL = self.GL
+		(w,h) = destsize
+		(x,y) = pos
+
+		if getattr(self, "quad_list", None) is None:
+			self.quad_list = GL.glGenLists(1)
+
+		GL.glNewList(self.quad_list, GL.GL_COMPILE)
+		GL.glBegin(GL.GL_QUADS)
+		GL.glTexCoord2f(0.0, 0.0); GL.glVertex3i(x, y, 0)
+		GL.glTexCoord2f(1.0, 0.0); GL.glVertex3i(x+w, y, 0)
+		GL.glTexCoord2f(1.0, 1.0); GL.glVertex3i(x+w, y+h, 0)
+		GL.glTexCoord2f(0.0, 1.0); GL.glVertex3i(x, y+h, 0)
+		GL.glEnd()
+		GL.glEndList()
+
+		self.quad_geometry = (destsize, pos)
+
+	def upload_frame(self):
+		"""
+		Copies the current frame to the texture(s). With pixel buffer objects, the
+		frame is copied to one of two alternating buffers from which the driver
+		transfers it to the texture asynchronously. Otherwise, the frame is
+		uploaded directly (synchronously) from the numpy array.
+		"""
+		GL = self.GL
+		frame = np.ascontiguousarray(self.frame)
+
+		if not self.pbos:
+			flat = frame.reshape(-1)
+			for (texid, w, h, fmt, offset, black) in self.planes:
+				GL.glBindTexture(GL.GL_TEXTURE_2D, texid)
+				GL.glTexSubImage2D( GL.GL_TEXTURE_2D, 0, 0, 0, w, h, fmt, GL.GL_UNSIGNED_BYTE, flat[offset:])
+			GL.glBindTexture(GL.GL_TEXTURE_2D, self.texid)
+			return
+
+		GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self.pbos[self.pbo_index])
+		self.pbo_index = (self.pbo_index + 1) % len(self.pbos)
+		# Orphan the previous contents of the buffer, so we never have to wait
+		# for a transfer from it that is still pending
+		GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, frame.nbytes, None, GL.GL_STREAM_DRAW)
+		ptr = GL.glMapBuffer(GL.GL_PIXEL_UNPACK_BUFFER, GL.GL_WRITE_ONLY)
+		if ptr:
+			ctypes.memmove(ptr, frame.ctypes.data, frame.nbytes)
+			GL.glUnmapBuffer(GL.GL_PIXEL_UNPACK_BUFFER)
+			# With a pixel buffer bound, the last argument is an offset into it
+			for (texid, w, h, fmt, offset, black) in self.planes:
+				GL.glBindTexture(GL.GL_TEXTURE_2D, texid)
+				GL.glTexSubImage2D( GL.GL_TEXTURE_2D, 0, 0, 0, w, h, fmt, GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(offset))
+			GL.glBindTexture(GL.GL_TEXTURE_2D, self.texid)
+		GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
 	def playback_finished(self):
 		""" Restore previous OpenGL context as before playback """
 		GL = self.GL
@@ -312,25 +628,35 @@ class OpenGL_renderer(object):
 		"""
 		GL = self.GL
 
-		# Get desired format from main player
-		(w,h) = self.main_player.destsize
-		(x,y) = self.main_player.vidPos
-
 		# Frame should blend with color white
 		GL.glColor4f(1,1,1,1)
 
-		# Only if a frame has been set, blit it to the texture
+		# Only if a new frame has been set, blit it to the texture. A frame that
+		# is drawn again (at the next refresh) is still in the texture.
 		if hasattr(self,"frame") and not self.frame is None:
 			GL.glLoadIdentity()
-			GL.glTexSubImage2D( GL.GL_TEXTURE_2D, 0, 0, 0, self.main_player.vidsize[0], self.main_player.vidsize[1], GL.GL_RGB, GL.GL_UNSIGNED_BYTE, self.frame)
+			if not self.frame is self.uploaded_frame:
+				t0 = player.monotonic_time()
+				self.upload_frame()
+				self.uploaded_frame = self.frame
+				if self.n_uploads < len(self.upload_times):
+					self.upload_times[self.n_uploads] = player.monotonic_time() - t0
+					self.n_uploads += 1
+				if self.main_player.player.timings is not None:
+					self.main_player.player.timings.record(u"upload", t0)
 
 		# Drawing of the quad on which the frame texture is projected
-		GL.glBegin(GL.GL_QUADS)
-		GL.glTexCoord2f(0.0, 0.0); GL.glVertex3i(x, y, 0)
-		GL.glTexCoord2f(1.0, 0.0); GL.glVertex3i(x+w, y, 0)
-		GL.glTexCoord2f(1.0, 1.0); GL.glVertex3i(x+w, y+h, 0)
-		GL.glTexCoord2f(0.0, 1.0); GL.glVertex3i(x, y+h, 0)
-		GL.glEnd()
+		if self.pixel_format == u"yuv420p":
+			# Let the shader combine the planes into RGB
+			GL.glUseProgram(self.yuv_program)
+			for unit, plane in enumerate(self.planes):
+				GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+				GL.glBindTexture(GL.GL_TEXTURE_2D, plane[0])
+			GL.glActiveTexture(GL.GL_TEXTURE0)
+			GL.glCallList(self.quad_list)
+			GL.glUseProgram(0)
+		else:
+			GL.glCallList(self.quad_list)
 
 		# Make sure there are no pending drawing operations and flip front and backbuffer
 		GL.glFlush()
@@ -358,6 +684,12 @@ class legacy_handler(pygame_handler):
 		"""
 		# Call constructor of super class
 		super(legacy_handler, self).__init__(main_player, screen, custom_event_code )
+		self.create_surfaces()
+
+	def create_surfaces(self):
+		"""
+		Creates the surfaces the frames are drawn to, at the current video size
+		"""
 		# Surface that is a 1:1 representation of the numpy array in which the frame is delivered		
 		self.src_surface = pygame.Surface(self.main_player.vidsize, pygame.HWSURFACE, 24, (255, 65280, 16711680, 0))
 		# Surface that is scaled to the destination size in which the frame is to be presented (if video has to be resized to full-screen)
@@ -373,7 +705,17 @@ class legacy_handler(pygame_handler):
 		
 		# Fill surface with background color
 		self.screen.fill(c.backend_color)
-		self.last_drawn_frame_no = 0
+		# No frame has been drawn yet, not even the first one
+		self.last_drawn_frame = None
+		# Time spent on drawing each frame to the screen
+		self.render_times = np.zeros(self.main_player.player.nframes)
+		self.n_renders = 0
+
+		# The handler is reused between runs, so recreate the surfaces if the
+		# video size has changed
+		if self.src_surface.get_size() != tuple(self.main_player.vidsize) or \
+			self.dest_surface.get_size() != tuple(self.main_player.destsize):
+			self.create_surfaces()
 
 	def draw_frame(self):
 		"""
@@ -383,19 +725,44 @@ class legacy_handler(pygame_handler):
 		if hasattr(self,"frame") and not self.frame is None:
 			# Only draw each frame to screen once, to give the pygame (software-based) rendering engine
 			# some breathing space
-			if self.last_drawn_frame_no != self.main_player.frame_no:
-				
-				pygame.surfarray.blit_array(self.src_surface, self.frame.swapaxes(0,1))
-				
-				if self.main_player.var.resizeVideo == u"yes":
-					pygame.transform.scale(self.src_surface, self.main_player.destsize, self.dest_surface)
-					# If resize option is selected, resize frame to screen/window dimensions and blit
-					self.screen.blit(self.dest_surface, self.main_player.vidPos)
+			if not self.frame is self.last_drawn_frame:
+				t0 = player.monotonic_time()
+
+				if self.main_player.var.legacy_render == u"zerocopy":
+					self.draw_frame_zerocopy()
 				else:
-				# In case movie needs to be displayed 1-on-1 blit directly to screen
-					self.screen.blit(self.src_surface, self.main_player.vidPos)
+					pygame.surfarray.blit_array(self.src_surface, self.frame.swapaxes(0,1))
+
+					if tuple(self.main_player.vidsize) != tuple(self.main_player.destsize):
+						pygame.transform.scale(self.src_surface, self.main_player.destsize, self.dest_surface)
+						# If the frame has to be resized, resize it to screen/window dimensions and blit
+						self.screen.blit(self.dest_surface, self.main_player.vidPos)
+					else:
+					# In case movie needs to be displayed 1-on-1 (or has been scaled
+					# by the decoder already) blit directly to screen
+						self.screen.blit(self.src_surface, self.main_player.vidPos)
+
+				if self.n_renders < len(self.render_times):
+					self.render_times[self.n_renders] = player.monotonic_time() - t0
+					self.n_renders += 1
+				self.last_drawn_frame = self.frame
+
+	def draw_frame_zerocopy(self):
+		"""
+		Draws the frame without copying it to an intermediate surface first. The
+		frame is wrapped in a surface that uses the memory of the numpy array,
+		which is blitted to the screen directly, or scaled straight into the
+		destination surface if the frame has to be resized.
+		"""
+		frame = self.frame
+		if not frame.flags.c_contiguous:
+			frame = np.ascontiguousarray(frame)
+		frame_surface = pygame.image.frombuffer(frame, tuple(self.main_player.vidsize), "RGB")
 
-				self.last_drawn_frame_no = self.main_player.frame_no
+		if tuple(self.main_player.vidsize) != tuple(self.main_player.destsize):
+			pygame.transform.scale(frame_surface, self.main_player.destsize, self.dest_surface)
+			frame_surface = self.dest_surface
+		self.screen.blit(frame_surface, self.main_player.vidPos)
 
 
 class expyriment_handler(OpenGL_renderer, pygame_handler):
@@ -411,7 +778,27 @@ class expyriment_handler(OpenGL_renderer, pygame_handler):
 
 		# GL context to use by the OpenGL_renderer class
 		self.GL = GL
-		self.texid = GL.glGenTextures(1)
+		self.texid = self.gen_texture()
+		# Textures of the chroma planes and the shader that converts YUV frames
+		# to RGB, which are created when they are needed
+		self.plane_texids = []
+		self.yuv_program = None
+
+		# Pixel buffer objects for asynchronous texture uploads (if supported)
+		self.pbos = []
+		if main_player.var.gl_upload == u"pbo" and bool(GL.glGenBuffers):
+			self.pbos = [GL.glGenBuffers(1) for i in range(2)]
+
+	def gen_texture(self):
+		""" Returns the id of a new texture """
+		return self.GL.glGenTextures(1)
+
+	def compile_program(self, vertex_shader, fragment_shader):
+		""" Compiles and links a GLSL program and returns its id """
+		from OpenGL.GL import shaders
+		return shaders.compileProgram(
+			shaders.compileShader(vertex_shader, self.GL.GL_VERTEX_SHADER),
+			shaders.compileShader(fragment_shader, self.GL.GL_FRAGMENT_SHADER))
 
 
 class psychopy_handler(OpenGL_renderer):
@@ -430,7 +817,6 @@ class psychopy_handler(OpenGL_renderer):
 		Keyword arguments:
 		custom_event_code -- (Compiled) code that is to be called after every frame
 		"""
-		import ctypes
 		import pyglet.gl
 
 		self.main_player = main_player
@@ -441,8 +827,34 @@ class psychopy_handler(OpenGL_renderer):
 		# GL context to be used by the OpenGL_renderer class
 		# Create texture to render frames to later
 		GL = self.GL = pyglet.gl
-		self.texid = GL.GLuint()
-		GL.glGenTextures(1, ctypes.byref(self.texid))
+		self.texid = self.gen_texture()
+		# Textures of the chroma planes and the shader that converts YUV frames
+		# to RGB, which are created when they are needed
+		self.plane_texids = []
+		self.yuv_program = None
+
+		# Pixel buffer objects for asynchronous texture uploads (if supported)
+		self.pbos = []
+		if main_player.var.gl_upload == u"pbo" and pyglet.gl.gl_info.have_version(2, 1):
+			for i in range(2):
+				pbo = GL.GLuint()
+				GL.glGenBuffers(1, ctypes.byref(pbo))
+				self.pbos.append(pbo)
+
+	def gen_texture(self):
+		""" Returns the id of a new texture """
+		texid = self.GL.GLuint()
+		self.GL.glGenTextures(1, ctypes.byref(texid))
+		return texid
+
+	def compile_program(self, vertex_shader, fragment_shader):
+		""" Compiles and links a GLSL program and returns its id """
+		try:
+			from psychopy.visual.shaders import compileProgram
+		except ImportError:
+			# Older versions of PsychoPy
+			from psychopy._shadersPyglet import compileProgram
+		return compileProgram(vertex_shader, fragment_shader)
 
 	def handle_videoframe(self, frame):
 		"""
@@ -545,7 +957,11 @@ class media_player_mpy(item):
 	
 	@property
 	def frame_no(self):
-		return self.player.current_frame
+		return self.player.current_frame_no
+
+	@property
+	def times_played(self):
+		return self.player.times_played
 
 	def reset(self):
 		"""
@@ -560,10 +976,47 @@ class media_player_mpy(item):
 		self.var.loop 				= u"no"
 		self.var.event_handler_trigger = u"on keypress"
 		self.var.event_handler 		= u""
-		self.var.soundrenderer 		= "pyaudio"
-
-		# Set default internal variables
-		self.__frame_updated 		= False
+		self.var.soundrenderer 		= u"pyaudio"
+		self.var.audio_buffer_blocks 	= 8
+		self.var.gl_upload 			= u"direct"
+		self.var.pixel_format 		= u"rgb24"
+		self.var.decode_scaling 	= u"no"
+		self.var.legacy_render 		= u"copy"
+		self.var.clip_cache 		= u"no"
+		self.var.preload 			= u"no"
+		# Sizes in MB above which clips are not preloaded, or preloaded into a
+		# memory-mapped temporary file instead of memory
+		self.var.preload_limit 		= 1024
+		self.var.preload_memmap 	= 256
+		# Directory to keep decoded frames in between sessions (empty: don't)
+		self.var.frame_cache_dir 	= u""
+		# Position in seconds to start playback at, so that a segment of a clip
+		# (together with the duration) can be used as a stimulus
+		self.var.video_start 		= 0
+		self.var.clock_mode 		= u"thread"
+		self.var.prefetch_depth 	= 0
+		self.var.decode_mode 		= u"time"
+		self.var.sync_policy 		= u"drop"
+		self.var.spin_wait 			= 0.0
+		# Times per second that input is processed while waiting for a frame
+		self.var.input_poll_rate 	= 200
+		# When frames are put on screen: as soon as the player hands them over
+		# ("frame"), or at the display refresh they are due at ("vsync")
+		self.var.presentation 		= u"frame"
+		self.var.refresh_rate 		= 60
+		# Record how long decoding, audio, uploading, drawing and flipping take
+		# for every frame, and the file to write these timings to after each
+		# run (.csv or .npz, relative to the folder of the log file; empty:
+		# don't write them)
+		self.var.timings 			= u"no"
+		self.var.timings_file 		= u""
+
+		# Set default internal variables. The player's render thread signals
+		# the run loop when it has handed over a new frame.
+		self.__frame_ready 			= threading.Event()
+		self.__frame_lock 			= threading.Lock()
+		# The last two (frame number, frame) tuples that were handed over
+		self.__handover 			= deque(maxlen=2)
 
 		# Debugging output is only visible when OpenSesame is started with the
 		# --debug argument.
@@ -581,6 +1034,7 @@ class media_player_mpy(item):
 		"""
 		# Call parent functions.
 		item.prepare(self)
+		prepare_start = player.monotonic_time()
 
 		# Byte-compile the event handling code (if any)
 		if self.var.event_handler.strip() != u"":
@@ -593,8 +1047,43 @@ class media_player_mpy(item):
 		else:
 			playaudio = False
 
+		# Determine the handler of frames and user input
+		if type(self.var.canvas_backend) in [unicode,str]:
+			if self.var.canvas_backend == u"legacy" or self.var.canvas_backend == u"droid":
+				handler_class, screen = legacy_handler, self.experiment.surface
+			if self.var.canvas_backend == u"psycho":
+				handler_class, screen = psychopy_handler, self.experiment.window
+			if self.var.canvas_backend == u"xpyriment":
+				# Expyriment uses OpenGL in fullscreen mode, but just pygame
+				# (legacy) display mode otherwise
+				if self.experiment.fullscreen:
+					handler_class, screen = expyriment_handler, self.experiment.window
+				else:
+					handler_class, screen = legacy_handler, self.experiment.window
+		else:
+			# Give a sensible error message if the proper back-end has not been selected
+			raise osexception(u"The media_player plug-in could not determine which backend was used!")
+
+		# Only the OpenGL renderers can convert YUV frames (on the GPU)
+		if issubclass(handler_class, OpenGL_renderer):
+			pixel_format = self.var.pixel_format
+		else:
+			pixel_format = u"rgb24"
+
+		# Give the clip of the previous run back to the clip cache, in case it
+		# was prepared but never played
+		if getattr(self, u"player", None) is not None:
+			self.player.release()
+
 		# Initialize player object
-		self.player = player.Player(play_audio=playaudio)
+		self.player = player.Player(play_audio=playaudio, clock_mode=self.var.clock_mode,
+			prefetch_depth=self.var.prefetch_depth, decode_mode=self.var.decode_mode,
+			sync_policy=self.var.sync_policy, spin_wait=self.var.spin_wait,
+			pixel_format=pixel_format, preload=self.var.preload == u"yes",
+			preload_limit=self.var.preload_limit * 1024**2,
+			preload_memmap=self.var.preload_memmap * 1024**2,
+			frame_cache_dir=self.var.frame_cache_dir or None,
+			loop=self.var.loop == u"yes", clip_cache=player.clip_cache if self.var.clip_cache == u"yes" else None)
 
 		# Load video file to play
 		if self.var.video_src == u"":
@@ -616,6 +1105,9 @@ class media_player_mpy(item):
 				self.audio_handler = SoundrendererPygame(self.player.audioformat)
 			elif self.var.soundrenderer == u"pyaudio":
 				self.audio_handler = SoundrendererPyAudio(self.player.audioformat)
+			elif self.var.soundrenderer == u"pyaudio_callback":
+				self.audio_handler = SoundrendererPyAudioCallback(self.player.audioformat,
+					self.var.audio_buffer_blocks)
 
 		self.vidsize = self.player.clip.size
 		self.windowsize = self.experiment.resolution()
@@ -627,25 +1119,70 @@ class media_player_mpy(item):
 
 		self.vidPos = ((self.windowsize[0] - self.destsize[0]) / 2, (self.windowsize[1] - self.destsize[1]) / 2)
 
-		# Set handler of frames and user input
-		if type(self.var.canvas_backend) in [unicode,str]:
-			if self.var.canvas_backend == u"legacy" or self.var.canvas_backend == u"droid":
-				self.handler = legacy_handler(self, self.experiment.surface, custom_event_handler)
-			if self.var.canvas_backend == u"psycho":
-				self.handler = psychopy_handler(self, self.experiment.window, custom_event_handler)
-			if self.var.canvas_backend == u"xpyriment":
-				# Expyriment uses OpenGL in fullscreen mode, but just pygame
-				# (legacy) display mode otherwise
-				if self.experiment.fullscreen:
-					self.handler = expyriment_handler(self, self.experiment.window, custom_event_handler)
-				else:
-					self.handler = legacy_handler(self, self.experiment.window, custom_event_handler)
+		# Let ffmpeg scale the frames down while decoding them, so smaller
+		# frames need to be copied and scaled (or uploaded) afterwards
+		if self.var.decode_scaling == u"destsize":
+			decode_size = self.destsize
+		elif self.var.decode_scaling == u"no":
+			decode_size = None
 		else:
-			# Give a sensible error message if the proper back-end has not been selected
-			raise osexception(u"The media_player plug-in could not determine which backend was used!")
+			try:
+				factor = float(self.var.decode_scaling)
+			except ValueError:
+				raise osexception(u"Invalid decode_scaling: {0} (use no, destsize or a "
+					u"scaling factor)".format(self.var.decode_scaling))
+			decode_size = (int(self.vidsize[0] * factor), int(self.vidsize[1] * factor))
+		# Frames are never enlarged by the decoder
+		if decode_size and decode_size[0] * decode_size[1] < self.vidsize[0] * self.vidsize[1]:
+			self.vidsize = self.player.set_decode_size(decode_size)
+
+		# Decode the whole clip now (or map it from the frame cache), instead of
+		# during playback
+		if self.var.preload == u"yes" or self.var.frame_cache_dir:
+			self.player.preload_frames()
+
+		# Seek to the start of the segment now, so the first frame is decoded
+		# (and the decoder process has been started) before the trial starts
+		if self.var.video_start or self.var.decode_mode == u"process":
+			self.player.seek(self.var.video_start)
+
+		# Reuse the handler of previous runs of this item, so that resources like
+		# OpenGL textures are only created once
+		if type(getattr(self, u"handler", None)) == handler_class:
+			self.handler.custom_event_code = custom_event_handler
+		else:
+			self.handler = handler_class(self, screen, custom_event_handler)
 
 		self.player.set_videoframerender_callback(self.__update_videoframe)
 		self.player.set_audioframerender_callback(self.__render_audioframe)
+		if self.player.audioformat:
+			# Let the audio renderer's playback position drive the clock (with
+			# the audio_master sync policy) and measure the A/V offset. Keep
+			# the renderer ahead of the clock by its output latency.
+			self.player.set_audioposition_callback(self.audio_handler.get_position)
+			if hasattr(self.audio_handler, u"output_latency"):
+				self.player.audio_lead = self.audio_handler.output_latency + \
+					self.player.audioformat["chunkduration"]
+		else:
+			self.player.set_audioposition_callback(None)
+
+		# The player records its own stages, and the run loop adds those of the
+		# handler
+		if self.var.timings == u"yes":
+			self.player.timings = player.StageTimings(player.TIMING_STAGES +
+				[u"upload", u"draw", u"flip"])
+
+		if not self.var.presentation in [u"frame", u"vsync"]:
+			raise osexception(u"Invalid presentation: {0} (use frame or vsync)".format(
+				self.var.presentation))
+		if self.var.presentation == u"vsync":
+			# Let the player hand over frames a refresh ahead of time, so each
+			# can be drawn before the refresh it is due at
+			self.player.video_lead = 1.0 / self.var.refresh_rate
+
+		# Time it took to prepare this trial, to verify that the clip cache
+		# shortens the inter-trial interval
+		self.prepare_time = player.monotonic_time() - prepare_start
 
 		# Report success
 		return True
@@ -664,17 +1201,79 @@ class media_player_mpy(item):
 
 		### Main player loop. While True, the movie is playing
 		start_time = self.experiment.clock.time()
+		self.__frame_ready.clear()
+		self.__handover.clear()
 		self.player.play()
 
+		# The number of every frame that was put on screen, and the time of the
+		# flip that did so (in ms, on the experiment clock)
+		self.frame_onsets = np.zeros((self.player.nframes, 2))
+		self.n_frame_onsets = 0
+
 		# While video is playing, render frames
+		timings = self.player.timings
+		poll_interval = 1.0 / self.var.input_poll_rate
+		refresh_interval = 1.0 / self.var.refresh_rate
+		last_flip = None
+		shown = None
 		while self.player.status in [player.PLAYING, player.PAUSED]:
-			if self.__frame_updated:
-				# Draw current frame to screen
-				self.handler.draw_frame()
+			if self.var.presentation == u"vsync":
+				# Flip at every refresh, and draw the last frame that is due at
+				# the next one. Frames are handed over a refresh in advance.
+				if last_flip is None:
+					last_flip = self.player.current_playtime
+				due = self.player.frame_no_at(last_flip + refresh_interval)
+				with self.__frame_lock:
+					self.__frame_ready.clear()
+					handover = [entry for entry in self.__handover if entry[0] <= due]
+					new_frame = bool(handover) and handover[-1] is not shown
+					if new_frame:
+						shown = handover[-1]
+						self.handler.handle_videoframe(shown[1])
+					if shown is not None:
+						if timings is not None:
+							draw_start = player.monotonic_time()
+						self.handler.draw_frame()
+						if timings is not None:
+							timings.record(u"draw", draw_start)
+				if shown is None:
+					# Nothing to show yet
+					self.__frame_ready.wait(poll_interval)
+					last_flip = None
+				else:
+					if timings is not None:
+						flip_start = player.monotonic_time()
+					self.handler.swap_buffers()
+					if timings is not None:
+						timings.record(u"flip", flip_start)
+					if new_frame:
+						self.__log_frame_onset(shown[0])
+					flip = self.player.current_playtime
+					if flip - last_flip < refresh_interval / 2:
+						# The flip did not wait for the refresh, so sleep until
+						# it is due. Frames that are handed over in the meantime
+						# must not end the wait early.
+						time.sleep(max(0.0, last_flip + refresh_interval - flip))
+						flip = self.player.current_playtime
+					last_flip = flip
+			# Otherwise, sleep until the player hands over a new frame, but
+			# wake up regularly to process input
+			elif self.__frame_ready.wait(poll_interval):
+				# Draw current frame to screen. The lock keeps the player from
+				# replacing the frame while it is being drawn.
+				with self.__frame_lock:
+					self.__frame_ready.clear()
+					frame_no = self.__handover[-1][0]
+					if timings is not None:
+						draw_start = player.monotonic_time()
+					self.handler.draw_frame()
+					if timings is not None:
+						flip_start = timings.record(u"draw", draw_start)
 				# Swap buffers to show drawn stuff on screen
 				self.handler.swap_buffers()
-				# Reset updated flag
-				self.__frame_updated = False
+				if timings is not None:
+					timings.record(u"flip", flip_start)
+				self.__log_frame_onset(frame_no)
 
 #			# Handle input events
 #			if self._event_handler_always:
@@ -690,8 +1289,97 @@ class media_player_mpy(item):
 		# Restore OpenGL context to state before playback
 		self.handler.playback_finished()
 
+		# Log how many frames were rendered, dropped, repeated and shown late
+		# (e.g. dropped_frames_[item name]) alongside the other trial data
+		for counter, value in self.player.frame_stats.items():
+			self.experiment.var.set(u"{0}_frames_{1}".format(counter, self.name), value)
+
 		if self.player.audioformat:
 			self.audio_handler.close_stream()
+			# Report audio underruns and device latency, to help tuning the
+			# audio buffer size for this machine
+			if hasattr(self.audio_handler, u"stats"):
+				for key, value in self.audio_handler.stats.items():
+					self.experiment.var.set(u"audio_{0}_{1}".format(key, self.name), value)
+				debug.msg(u"audio renderer: {0}".format(self.audio_handler.stats))
+
+		# Log the time it took to upload frames to the GPU in ms
+		if hasattr(self.handler, u"upload_times") and self.handler.n_uploads:
+			upload_times = self.handler.upload_times[:self.handler.n_uploads]
+			self.experiment.var.set(u"upload_time_mean_{0}".format(self.name),
+				1000 * upload_times.mean())
+			self.experiment.var.set(u"upload_time_max_{0}".format(self.name),
+				1000 * upload_times.max())
+
+		# Log the time it took the legacy renderer to draw frames in ms
+		if hasattr(self.handler, u"render_times") and self.handler.n_renders:
+			render_times = self.handler.render_times[:self.handler.n_renders]
+			self.experiment.var.set(u"render_time_mean_{0}".format(self.name),
+				1000 * render_times.mean())
+			self.experiment.var.set(u"render_time_max_{0}".format(self.name),
+				1000 * render_times.max())
+
+		# Log the prepare time in ms and how often clips were found in the cache
+		self.experiment.var.set(u"prepare_time_{0}".format(self.name), 1000 * self.prepare_time)
+		if self.player.seek_stats:
+			self.experiment.var.set(u"seek_time_{0}".format(self.name),
+				1000 * self.player.seek_stats["time"])
+		if self.player.preload_stats:
+			self.experiment.var.set(u"preload_time_{0}".format(self.name),
+				1000 * self.player.preload_stats["time"])
+			self.experiment.var.set(u"preload_size_{0}".format(self.name),
+				self.player.preload_stats["bytes"] / 1024.0**2)
+			if self.player.preload_stats["memory"] is not None:
+				self.experiment.var.set(u"preload_memory_{0}".format(self.name),
+					self.player.preload_stats["memory"] / 1024.0**2)
+		resident_memory = player.resident_memory()
+		if resident_memory is not None:
+			self.experiment.var.set(u"resident_memory_{0}".format(self.name),
+				resident_memory / 1024.0**2)
+		if self.player.clip_cache:
+			for key, value in self.player.clip_cache.stats.items():
+				self.experiment.var.set(u"clip_cache_{0}_{1}".format(key, self.name), value)
+
+		# Log the gap between the last frame of a clip and the first frame of
+		# the next (or of the clip itself when looping) in ms
+		transitions = self.player.transitions
+		if len(transitions):
+			self.experiment.var.set(u"transition_gap_max_{0}".format(self.name),
+				1000 * transitions[:,0].max())
+
+		# Log the A/V offset (audio position minus video position) in ms
+		av_offsets = self.player.av_offsets
+		if len(av_offsets):
+			self.experiment.var.set(u"av_offset_mean_{0}".format(self.name),
+				1000 * av_offsets[:,1].mean())
+			self.experiment.var.set(u"av_offset_max_{0}".format(self.name),
+				1000 * np.abs(av_offsets[:,1]).max())
+
+		# Log the median, 95th and 99th percentile and the maximum duration of
+		# each stage of playback in ms (e.g. timing_decode_p95_[item name]),
+		# and write all durations to the timings file
+		if timings is not None:
+			for stage, stats in timings.summary().items():
+				for key in [u"p50", u"p95", u"p99", u"max"]:
+					self.experiment.var.set(u"timing_{0}_{1}_{2}".format(stage, key,
+						self.name), 1000 * stats[key])
+			if self.var.timings_file:
+				path = os.path.join(os.path.dirname(os.path.abspath(
+					self.experiment.logfile)), self.var.timings_file)
+				timings.save(path)
+				debug.msg(u"stage timings written to {0}".format(path))
+
+		# Log the longest time a frame stayed on screen in ms, and return the
+		# onsets of all frames (which stay available as frame_onsets)
+		self.frame_onsets = self.frame_onsets[:self.n_frame_onsets]
+		if len(self.frame_onsets) > 1:
+			self.experiment.var.set(u"onset_interval_max_{0}".format(self.name),
+				np.diff(self.frame_onsets[:,1]).max())
+
+		# Give the clip back to the clip cache, so that other items that play
+		# the same file can use it
+		self.player.release()
+		return self.frame_onsets
 
 	def calculate_scaled_resolution(self, screen_res, image_res):
 		"""Calculate image size so it fits the screen
@@ -715,8 +1403,21 @@ class media_player_mpy(item):
 		self.audio_handler.write(frame)
 
 	def __update_videoframe(self, frame):
-		self.handler.handle_videoframe(frame)
-		self.__frame_updated = True
+		# Called from the render thread of the player. With vsync presentation,
+		# the run loop passes the frame to the handler once it is due.
+		with self.__frame_lock:
+			self.__handover.append((self.player.rendered_frame_no, frame))
+			if self.var.presentation != u"vsync":
+				self.handler.handle_videoframe(frame)
+			self.__frame_ready.set()
+
+	def __log_frame_onset(self, frame_no):
+		# Grow the log when clips are looped or queued
+		if self.n_frame_onsets == len(self.frame_onsets):
+			self.frame_onsets = np.concatenate([self.frame_onsets,
+				np.zeros((self.player.nframes, 2))])
+		self.frame_onsets[self.n_frame_onsets] = (frame_no, self.experiment.clock.time())
+		self.n_frame_onsets += 1
 
 
 	def stop(self):
@@ -730,7 +1431,7 @@ class media_player_mpy(item):
 			self.player.pause()
 			self.paused = True
 		else:
-			print "Player not in pausable state"
+			print(u"Player not in pausable state")
 
 class qtmedia_player_mpy(media_player_mpy, qtautoplugin):
 	def __init__(self, name, experiment, script=None):
@@ -7,7 +7,9 @@ from __future__ import unicode_literals
 # MoviePy
 try:
 	from moviepy.video.io.VideoFileClip import VideoFileClip
+	from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
 	from moviepy.tools import cvsecs
+	from moviepy.config import get_setting
 	import numpy as np
 except ImportError as e:
 	print("""Error importing dependencies:
@@ -24,8 +26,22 @@ Please make sure that they are installed.""".format(e))
 # Other modules
 import os
 import sys
+import json
 import time
+import re
+import hashlib
+import tempfile
+import subprocess
 import threading
+import multiprocessing
+import weakref
+from collections import deque, OrderedDict
+
+try:
+	from multiprocessing import shared_memory
+except ImportError:
+	# Python < 3.8
+	shared_memory = None
 
 # constants to indicate player status
 UNINITIALIZED = 0	# No video file loaded
@@ -39,6 +55,13 @@ RUNNING = 5		# Clock is ticking
 # Clock uses PAUSED status from player variables above
 STOPPED = 6		# Clock has been stopped and is reset
 
+# High resolution monotonic time source used by MonotonicTimer. Python 2 has
+# no time.perf_counter(), so fall back to time.time() there.
+try:
+	monotonic_time = time.perf_counter
+except AttributeError:
+	monotonic_time = time.time
+
 class Timer(object):
 	""" Timer serves as a stopwatch to measure time from an arbitrary
 	starting point. It runs in a separate thread and time can be polled
@@ -67,13 +90,15 @@ class Timer(object):
 			self.interval_start = time.time()
 			self.status = RUNNING
 
-	def start(self):
-		""" Start the clock from 0. Uses a separate thread to handle the timing
-		functionalities. """
-		if not hasattr(self,"thread") or not self.thread.isAlive():
+	def start(self, start_time=0.0):
+		""" Start the clock from start_time (in seconds, default 0). Uses a
+		separate thread to handle the timing functionalities. """
+		if not hasattr(self,"thread") or not self.thread.is_alive():
 			self.thread = threading.Thread(target=self.__run)
 			self.status = RUNNING
 			self.reset()
+			if start_time:
+				self.previous_intervals.append(start_time)
 			self.thread.start()
 		else:
 			print("Clock already running!")
@@ -164,11 +189,1644 @@ class Timer(object):
 			return "Clock [current time: {0}]".format(self.time)
 
 
+class MonotonicTimer(Timer):
+	""" Drop-in replacement for Timer that does not need a separate thread.
+	The time is calculated on demand from a monotonic high resolution clock
+	whenever clock.time is polled. The duration of finished (paused) intervals
+	is kept in a single accumulator instead of a list. """
+
+	def __init__(self, fps=None, max_duration=None):
+		""" Constructor """
+		self.lock = threading.Lock()
+		super(MonotonicTimer, self).__init__(fps, max_duration)
+
+	def reset(self):
+		""" Reset the clock to 0 """
+		with self.lock:
+			self.elapsed = 0.0
+			self.interval_start = monotonic_time()
+
+	def pause(self):
+		""" Pauses the clock to continue running later, or resumes it if
+		it is currently paused. """
+		with self.lock:
+			now = monotonic_time()
+			if self.status == RUNNING:
+				self.elapsed += now - self.interval_start
+				self.status = PAUSED
+			elif self.status == PAUSED:
+				self.interval_start = now
+				self.status = RUNNING
+
+	def start(self, start_time=0.0):
+		""" Start the clock from start_time (in seconds, default 0) """
+		if self.status == RUNNING:
+			print("Clock already running!")
+			return
+		self.reset()
+		with self.lock:
+			self.elapsed = start_time
+			self.interval_start = monotonic_time()
+			self.status = RUNNING
+
+	def stop(self):
+		""" Stop the clock. Also resets the internal timers """
+		with self.lock:
+			self.status = STOPPED
+		self.reset()
+
+	@property
+	def time(self):
+		""" Returns the current logged time of the clock """
+		with self.lock:
+			if self.status == RUNNING:
+				return self.elapsed + (monotonic_time() - self.interval_start)
+			return self.elapsed
+
+
+class AudioClock(MonotonicTimer):
+	""" Clock that is slaved to the playback position of the audio renderer.
+	It runs on the monotonic clock, but whenever the renderer reports its
+	position, the clock is set to that position (plus the time the clock was
+	started at, as the renderer counts from the start of playback). When the
+	renderer stops reporting positions (e.g. because the audio track has
+	ended), the clock continues from the last reported position. The time
+	never decreases: when a reported position lies behind the time that was
+	returned before, the clock holds still until the position has caught up. """
+
+	def __init__(self, fps=None, max_duration=None):
+		""" Constructor """
+		# Function returning the audio playback position in seconds, or None
+		# if it is not known
+		self.position_func = None
+		super(AudioClock, self).__init__(fps, max_duration)
+
+	def reset(self):
+		""" Reset the clock to 0 """
+		super(AudioClock, self).reset()
+		with self.lock:
+			self.offset = 0.0
+			self.start_time = 0.0
+			self.last_time = 0.0
+
+	def start(self, start_time=0.0):
+		""" Start the clock from start_time (in seconds, default 0) """
+		super(AudioClock, self).start(start_time)
+		with self.lock:
+			self.start_time = start_time
+
+	@property
+	def time(self):
+		""" Returns the current logged time of the clock """
+		t = super(AudioClock, self).time
+		with self.lock:
+			position_func = self.position_func if self.status == RUNNING else None
+		# The renderer is asked outside of the lock, as this can take a while
+		position = position_func() if position_func else None
+		with self.lock:
+			if not position is None:
+				self.offset = self.start_time + position - t
+			self.last_time = max(t + self.offset, self.last_time)
+			return self.last_time
+
+
+# Clock implementations that can be selected with the clock_mode argument of
+# Player
+CLOCK_MODES = {
+	"thread": Timer,
+	"monotonic": MonotonicTimer,
+}
+
+
+def resident_memory():
+	""" Returns the resident set size (the physical memory used) of this
+	process in bytes, or None if it cannot be determined on this platform """
+	try:
+		with open("/proc/self/statm") as statm:
+			return int(statm.read().split()[1]) * os.sysconf(str("SC_PAGE_SIZE"))
+	except (IOError, OSError, ValueError, AttributeError):
+		return None
+
+def memory_growth(start):
+	""" Returns how many bytes the resident memory of this process has grown
+	since it was start bytes (as returned by resident_memory()), or None if it
+	cannot be determined """
+	if start is None:
+		return None
+	current = resident_memory()
+	return None if current is None else current - start
+
+
+def read_into(stream, out):
+	""" Reads from stream (e.g. the stdout pipe of an ffmpeg process) directly
+	into the numpy array out, until out is full or the stream ends.
+
+	Returns:
+	The number of bytes read. If the stream ended prematurely, the remainder
+	of out is left untouched.
+	"""
+	view = memoryview(out.reshape(-1)).cast("B") if sys.version_info[0] > 2 \
+		else memoryview(out.reshape(-1))
+	n_read = 0
+	while n_read < out.nbytes:
+		n = stream.readinto(view[n_read:])
+		if not n:
+			break
+		n_read += n
+	return n_read
+
+
+# Pixel formats in which frames can be decoded, see the pixel_format argument
+# of Player
+PIXEL_FORMATS = ["rgb24", "yuv420p"]
+
+def frame_shape(size, pixel_format="rgb24"):
+	""" Returns the shape of the numpy array that holds a frame.
+
+	Arguments:
+	size	--  (width, height) of the frame
+
+	Keyword arguments:
+	pixel_format	--  one of PIXEL_FORMATS (default: "rgb24"). Planar
+				"yuv420p" frames are stored in a single (height * 3/2,
+				width) array: the Y plane at full resolution, followed by
+				the U and V planes at half the width and height
+	"""
+	(w, h) = size
+	if pixel_format == "yuv420p":
+		return (h * 3 // 2, w)
+	return (h, w, 3)
+
+def yuv420_planes(frame):
+	""" Returns (Y, U, V) views of the planes of a "yuv420p" frame, as
+	returned by frame_shape() """
+	h = frame.shape[0] * 2 // 3
+	w = frame.shape[1]
+	n = (h // 2) * (w // 2)
+	flat = frame.reshape(-1)
+	return (frame[:h], flat[w*h:w*h+n].reshape(h // 2, w // 2),
+		flat[w*h+n:].reshape(h // 2, w // 2))
+
+
+class StreamDecoder(object):
+	""" Reads the frames of a clip in order from the ffmpeg pipe of its reader,
+	instead of looking them up by timestamp. The pipe is only reopened at a
+	different position (a seek) when a frame before the current position, or
+	far after it, is requested. """
+
+	# With a keyframe index, the decoder estimates whether reading ahead or
+	# seeking reaches a frame sooner. A seek restarts ffmpeg, which decodes
+	# from the preceding keyframe without passing the frames through the pipe.
+	# Both costs are expressed in frames read from the pipe and thrown away.
+	SEEK_COST = 15.0
+	SEEK_DECODE_COST = 0.25
+
+	def __init__(self, reader, max_skip=100, pixel_format=None, keyframes=None):
+		"""
+		Constructor
+
+		Arguments:
+		reader		--  the FFMPEG_VideoReader of the clip (clip.reader)
+
+		Keyword arguments:
+		max_skip	--  maximum number of frames to read and throw away to reach
+					a requested frame, before seeking is considered to be
+					faster (default: 100)
+		pixel_format	--  pixel format (one of PIXEL_FORMATS) to request from
+					ffmpeg, or None to use that of the reader. The reader is
+					switched back to its own format by close() (default: None)
+		keyframes	--  KeyframeIndex of the clip, which replaces max_skip
+					by an estimate of the cost of seeking (default: None)
+		"""
+		self.reader = reader
+		self.max_skip = max_skip
+		self.keyframes = keyframes
+		self.closed = False
+		(w, h) = reader.size
+
+		self.reader_pix_fmt = None
+		if pixel_format is None:
+			self.frame_shape = (h, w, reader.depth)
+		else:
+			if not pixel_format in PIXEL_FORMATS:
+				raise ValueError("Invalid pixel_format: {0} (choose from {1})".format(
+					pixel_format, ", ".join(PIXEL_FORMATS)))
+			if pixel_format == "yuv420p" and (w % 2 or h % 2):
+				raise ValueError("yuv420p requires an even frame width and height, "
+					"not {0}x{1}".format(w, h))
+			self.frame_shape = frame_shape(reader.size, pixel_format)
+			if pixel_format != reader.pix_fmt:
+				# The frame moviepy has read ahead is in the wrong format, so the
+				# pipe needs to be reopened
+				self.reader_pix_fmt = reader.pix_fmt
+				reader.close()
+				reader.pix_fmt = pixel_format
+		self.frame_nbytes = int(np.prod(self.frame_shape))
+
+		# MoviePy has already read the first frame (or the frame at reader.pos)
+		# from the pipe, which we can reuse
+		if reader.proc and hasattr(reader, "lastread"):
+			self.next_frame_no = reader.pos
+			self.lastread = reader.lastread
+		else:
+			self.next_frame_no = None
+			self.lastread = None
+
+		# Statistics
+		self.decoded = 0
+		self.skipped = 0
+		self.seeks = 0
+		self.rereads = 0
+		self.highest_decoded = self.next_frame_no - 1 if self.lastread is not None else -1
+
+	@property
+	def stats(self):
+		""" Dictionary with the number of decoded frames, frames that were read
+		but thrown away, seeks and frames that were decoded more than once """
+		return {
+			'decoded':	self.decoded,
+			'skipped':	self.skipped,
+			'seeks':	self.seeks,
+			'rereads':	self.rereads,
+		}
+
+	def seek(self, frame_no):
+		""" Reopens the pipe of the reader at frame frame_no """
+		self.reader.initialize(frame_no / self.reader.fps)
+		self.next_frame_no = frame_no
+		self.lastread = None
+		self.seeks += 1
+
+	def frames(self, start=0):
+		""" Generator that yields (frame_no, frame) tuples for all frames from
+		start onwards, until the end of the stream """
+		frame_no = start
+		while frame_no < self.reader.nframes:
+			yield frame_no, self.get_frame(frame_no)
+			frame_no += 1
+
+	def get_frame(self, frame_no, out=None):
+		""" Returns frame frame_no as a numpy array.
+
+		Arguments:
+		frame_no	--  the number of the frame to retrieve
+
+		Keyword arguments:
+		out		--  preallocated numpy array to read the frame into. A new
+					array is created if this is not specified (default: None)
+		"""
+		# The last frame that was read into an array of our own can be served again
+		if self.lastread is not None and frame_no == self.next_frame_no - 1:
+			if out is None:
+				return self.lastread
+			out[...] = self.lastread
+			return out
+
+		if self.next_frame_no is None or frame_no < self.next_frame_no or \
+			self.__should_seek(frame_no):
+			self.seek(frame_no)
+		elif frame_no > self.next_frame_no:
+			self.__skip(frame_no - self.next_frame_no)
+
+		if out is None:
+			out = np.empty(self.frame_shape, dtype=np.uint8)
+			self.lastread = out
+		else:
+			self.lastread = None
+		read_into(self.reader.proc.stdout, out)
+
+		if frame_no <= self.highest_decoded:
+			self.rereads += 1
+		self.highest_decoded = max(self.highest_decoded, frame_no)
+		self.decoded += 1
+		self.next_frame_no = frame_no + 1
+		return out
+
+	def close(self):
+		""" Hands the reader back in a consistent state, so it can be used
+		by moviepy again """
+		self.closed = True
+		if self.reader_pix_fmt is not None:
+			self.reader.close()
+			self.reader.pix_fmt = self.reader_pix_fmt
+		elif self.lastread is not None and self.next_frame_no is not None:
+			self.reader.pos = self.next_frame_no
+			self.reader.lastread = self.lastread
+		else:
+			# Force moviepy to reopen the pipe the next time it needs a frame
+			self.reader.close()
+
+	def __should_seek(self, frame_no):
+		""" Whether seeking reaches frame_no (which lies after the current
+		position) sooner than reading ahead to it """
+		n_skip = frame_no - self.next_frame_no
+		if self.keyframes is None:
+			return n_skip > self.max_skip
+		keyframe = self.keyframes.previous(frame_no)
+		return n_skip > self.SEEK_COST + (frame_no - keyframe) * self.SEEK_DECODE_COST
+
+	def __skip(self, n):
+		""" Reads and throws away the next n frames. ffmpeg has decoded and
+		converted these frames already, so this only saves copying them; only
+		seeking (see __should_seek()) avoids decoding them. """
+		for i in range(n):
+			self.reader.proc.stdout.read(self.frame_nbytes)
+		self.next_frame_no += n
+		self.skipped += n
+
+
+class AudioStream(object):
+	""" Reads the 16 bit PCM samples of an audio track in order from the ffmpeg
+	pipe of its reader, straight into a preallocated ring of fixed-size
+	blocks. No per-block index arrays or float conversions are needed. """
+
+	def __init__(self, reader, block_size=1024, n_blocks=8):
+		"""
+		Constructor
+
+		Arguments:
+		reader		--  the FFMPEG_AudioReader of the clip (clip.audio.reader)
+
+		Keyword arguments:
+		block_size	--  number of samples (per channel) in a block (default: 1024)
+		n_blocks	--  number of blocks in the ring (default: 8)
+		"""
+		if reader.nbytes != 2:
+			raise ValueError("AudioStream only supports 16 bit audio")
+		self.reader = reader
+		self.block_size = block_size
+		self.ring = np.zeros((n_blocks, block_size, reader.nchannels), dtype=np.int16)
+		self.blocks_read = 0
+		self.eos = False
+
+	@property
+	def block_duration(self):
+		""" Duration of a block in seconds """
+		return self.block_size / float(self.reader.fps)
+
+	def seek(self, t):
+		""" Reopens the pipe of the reader at time t (in seconds) """
+		self.reader.initialize(t)
+		self.eos = False
+
+	def read_block(self):
+		""" Returns the next block of samples as an (n_samples, n_channels) int16
+		array, or None if the end of the stream has been reached. The array is a
+		view on the ring buffer that remains valid until n_blocks more blocks
+		have been read. Only the last block of the stream can be shorter than
+		block_size. """
+		if self.eos:
+			return None
+		block = self.ring[self.blocks_read % len(self.ring)]
+		n_samples = read_into(self.reader.proc.stdout, block) // block[0].nbytes
+		# Keep the position of the reader up to date, so moviepy can still
+		# use it afterwards
+		self.reader.pos += n_samples
+		if n_samples < self.block_size:
+			self.eos = True
+			if not n_samples:
+				return None
+			block = block[:n_samples]
+		self.blocks_read += 1
+		return block
+
+
+class PreloadedAudioStream(object):
+	""" Serves blocks of audio samples that have already been decoded into
+	memory completely, with the same interface as AudioStream """
+
+	def __init__(self, samples, fps, block_size=1024):
+		"""
+		Constructor
+
+		Arguments:
+		samples		--  (n_samples, n_channels) int16 array with all samples
+		fps		--  the sample rate of the audio
+
+		Keyword arguments:
+		block_size	--  number of samples (per channel) in a block (default: 1024)
+		"""
+		self.samples = samples
+		self.fps = fps
+		self.block_size = block_size
+		self.pos = 0
+		self.blocks_read = 0
+		self.eos = False
+
+	@property
+	def block_duration(self):
+		""" Duration of a block in seconds """
+		return self.block_size / float(self.fps)
+
+	def seek(self, t):
+		""" Continues reading at time t (in seconds) """
+		self.pos = int(round(t * self.fps))
+		self.eos = False
+
+	def read_block(self):
+		""" Returns the next block of samples as a view on the samples array, or
+		None if the end of the stream has been reached. Only the last block can
+		be shorter than block_size. """
+		if self.pos >= len(self.samples):
+			self.eos = True
+			return None
+		block = self.samples[self.pos:self.pos + self.block_size]
+		self.pos += self.block_size
+		self.blocks_read += 1
+		return block
+
+
+class SampleRingBuffer(object):
+	""" Ring buffer for audio samples with a single producer (the thread that
+	writes decoded audio) and a single consumer (e.g. an audio device
+	callback). The producer only advances the write counter and the consumer
+	only the read counter, so neither side ever has to take a lock and the
+	consumer never has to wait for the producer. """
+
+	def __init__(self, capacity, nchannels):
+		"""
+		Constructor
+
+		Arguments:
+		capacity	--  the number of samples (per channel) the buffer can hold
+		nchannels	--  the number of audio channels
+		"""
+		self.capacity = capacity
+		self.data = np.zeros((capacity, nchannels), dtype=np.int16)
+		# Total number of samples written and read since the start
+		self.n_written = 0
+		self.n_read = 0
+		# Number of reads that could not be served completely
+		self.underruns = 0
+		# Set when the producer has written its last samples, so running dry
+		# is no longer counted as an underrun
+		self.end_of_stream = False
+
+	@property
+	def fill(self):
+		""" Number of samples that have been written but not read yet """
+		return self.n_written - self.n_read
+
+	def write(self, samples, timeout=None):
+		""" Copies samples into the buffer. If the buffer is full, waits for the
+		consumer to make room.
+
+		Arguments:
+		samples		--  (n_samples, n_channels) array of int16 samples
+
+		Keyword arguments:
+		timeout		--  maximum time in seconds to wait for room in the buffer,
+					or None to wait indefinitely (default: None)
+
+		Returns:
+		The number of samples written
+		"""
+		if timeout is not None:
+			deadline = monotonic_time() + timeout
+		done = 0
+		while done < len(samples):
+			free = self.capacity - self.fill
+			if not free:
+				if timeout is not None and monotonic_time() > deadline:
+					break
+				time.sleep(0.001)
+				continue
+			n = min(free, len(samples) - done)
+			pos = self.n_written % self.capacity
+			first = min(n, self.capacity - pos)
+			self.data[pos:pos+first] = samples[done:done+first]
+			self.data[:n-first] = samples[done+first:done+n]
+			# Only publish the samples once they have been copied
+			self.n_written += n
+			done += n
+		return done
+
+	def read_into(self, out):
+		""" Copies as many samples as are available (up to the length of out)
+		into out and fills the remainder of out with silence.
+
+		Arguments:
+		out		--  (n_samples, n_channels) int16 array to copy the samples to
+
+		Returns:
+		The number of samples copied
+		"""
+		n = min(len(out), self.fill)
+		pos = self.n_read % self.capacity
+		first = min(n, self.capacity - pos)
+		out[:first] = self.data[pos:pos+first]
+		out[first:n] = self.data[:n-first]
+		out[n:] = 0
+		self.n_read += n
+		if n < len(out) and not self.end_of_stream:
+			self.underruns += 1
+		return n
+
+
+class FramePrefetcher(object):
+	""" Decodes video frames ahead of playback in a separate thread. The frames
+	are written into a fixed-size ring of preallocated numpy buffers, so the
+	render loop only has to pick up the next frame that is ready instead of
+	waiting for the decoder. """
+
+	# Possible states of a slot in the ring
+	FREE = 0	# Slot can be (over)written by the decoder
+	READY = 1	# Slot contains a decoded frame that has not been delivered yet
+	HELD = 2	# Slot contains a frame that has been passed on to the renderer
+
+	def __init__(self, decode_func, frame_shape, n_frames, depth=4, hold=2, skip_late=False):
+		"""
+		Constructor
+
+		Arguments:
+		decode_func	--  function that decodes a frame. It should accept the
+					arguments:
+						- frame_no (int): the number of the frame to decode
+						- out (numpy array): the buffer to write the frame into
+		frame_shape	--  shape of a single frame: (height, width, depth)
+		n_frames	--  the total number of frames in the clip
+
+		Keyword arguments:
+		depth		--  number of buffers in the ring (default: 4)
+		hold		--  number of most recently delivered frames that are
+					protected from being overwritten, as renderers might
+					still be busy drawing them (default: 2)
+		skip_late	--  do not deliver frames that are older than the frame that
+					was last requested by the render loop, but continue with
+					that frame. ffmpeg still decodes the frames in between,
+					unless the decoder seeks past them (default: False)
+		"""
+		if depth <= hold:
+			raise ValueError("prefetch depth needs to be greater than {0}".format(hold))
+
+		self.decode_func = decode_func
+		self.n_frames = n_frames
+		self.depth = depth
+		self.hold = hold
+		self.skip_late = skip_late
+		# The most recent frame number the render loop has asked for
+		self.wanted_frame_no = 0
+
+		self.buffers = np.zeros((depth,) + tuple(frame_shape), dtype=np.uint8)
+		self.slot_state = [self.FREE] * depth
+		self.slot_frame = [-1] * depth
+		self.held_slots = deque()
+		self.read_pos = 0
+		self.write_pos = 0
+
+		self.cond = threading.Condition()
+		self.stopped = False
+		self.finished = False
+		self.error = None
+
+		# Statistics
+		self.decoded = 0
+		self.delivered = 0
+		self.discarded = 0
+		self.skipped = 0
+		self.underruns = 0
+
+	@property
+	def fill(self):
+		""" Number of decoded frames that are waiting to be delivered """
+		return self.slot_state.count(self.READY)
+
+	@property
+	def stats(self):
+		""" Dictionary with the fill level and counters of the ring buffer """
+		return {
+			'depth':	self.depth,
+			'fill':		self.fill,
+			'decoded':	self.decoded,
+			'delivered':	self.delivered,
+			'discarded':	self.discarded,
+			'skipped':	self.skipped,
+			'underruns':	self.underruns,
+		}
+
+	def start(self, start_frame=0):
+		""" Start decoding frames from start_frame onwards """
+		self.thread = threading.Thread(target=self.__run, args=(start_frame,))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		""" Stop the decoding thread and wait for it to exit """
+		with self.cond:
+			self.stopped = True
+			self.cond.notify_all()
+		if hasattr(self, "thread"):
+			self.thread.join()
+
+	def fetch(self, frame_no, block=False):
+		""" Returns the buffer containing frame frame_no, or None if this frame
+		is not available. Decoded frames before frame_no that were never picked
+		up are discarded. The returned buffer is only valid until the decoder
+		overwrites it, which happens at the earliest after another 'hold' frames
+		have been fetched.
+
+		Arguments:
+		frame_no	--  number of the frame to retrieve
+
+		Keyword arguments:
+		block		--  wait for the decoder if the frame is not ready yet,
+					instead of counting an underrun (default: False)
+		"""
+		with self.cond:
+			self.wanted_frame_no = max(self.wanted_frame_no, frame_no)
+			while True:
+				if self.error:
+					raise self.error
+				# Throw away frames that have become too late to be shown
+				while self.slot_state[self.read_pos] == self.READY and \
+					self.slot_frame[self.read_pos] < frame_no:
+					self.slot_state[self.read_pos] = self.FREE
+					self.read_pos = (self.read_pos + 1) % self.depth
+					self.discarded += 1
+					self.cond.notify_all()
+
+				slot = self.read_pos
+				if self.slot_state[slot] == self.READY:
+					if self.slot_frame[slot] != frame_no:
+						return None
+					return self.__deliver(slot)
+
+				if self.finished or self.stopped or frame_no >= self.n_frames:
+					return None
+				if not block:
+					self.underruns += 1
+					return None
+				self.cond.wait()
+
+	def __deliver(self, slot):
+		""" Marks slot as held by the renderer and releases the oldest held slot.
+		Should only be called while holding the lock. """
+		self.slot_state[slot] = self.HELD
+		self.held_slots.append(slot)
+		if len(self.held_slots) > self.hold:
+			self.slot_state[self.held_slots.popleft()] = self.FREE
+		self.read_pos = (slot + 1) % self.depth
+		self.delivered += 1
+		self.cond.notify_all()
+		return self.buffers[slot]
+
+	def __run(self, frame_no):
+		""" Internal function that is run in a separate thread. Do not call directly. """
+		try:
+			while frame_no < self.n_frames:
+				with self.cond:
+					while not self.stopped and self.slot_state[self.write_pos] != self.FREE:
+						self.cond.wait()
+					if self.stopped:
+						break
+					slot = self.write_pos
+					# Jump ahead if the render loop has already passed this frame,
+					# so that late frames are not copied into the ring
+					if self.skip_late and self.wanted_frame_no > frame_no:
+						self.skipped += min(self.wanted_frame_no, self.n_frames) - frame_no
+						frame_no = self.wanted_frame_no
+				if frame_no >= self.n_frames:
+					break
+
+				# Decode outside of the lock, so the render loop is never kept
+				# waiting for the decoder
+				self.decode_func(frame_no, self.buffers[slot])
+
+				with self.cond:
+					self.slot_frame[slot] = frame_no
+					self.slot_state[slot] = self.READY
+					self.write_pos = (slot + 1) % self.depth
+					self.decoded += 1
+					self.cond.notify_all()
+				frame_no += 1
+		except Exception as e:
+			self.error = e
+		with self.cond:
+			self.finished = True
+			self.cond.notify_all()
+
+
+class DecoderProcess(object):
+	""" Decodes the frames of a clip in a separate process, so that decoding
+	does not compete with the render loop (and the audio thread) for the GIL.
+	The process reads the frames in order with a StreamDecoder of its own and
+	writes them into a ring of buffers in shared memory, from which the render
+	loop picks them up. It can be used in place of a FramePrefetcher (with the
+	same fetch() semantics), and in place of a StreamDecoder by seek(). The
+	process keeps running, waiting for a new start position, until close() is
+	called. Requires Python 3.8 or newer. """
+
+	# Possible states of a slot in the ring, see FramePrefetcher
+	FREE = FramePrefetcher.FREE
+	READY = FramePrefetcher.READY
+	HELD = FramePrefetcher.HELD
+
+	# Fields of the header in front of the ring, which the main process and
+	# the decoder process use to tell each other what to do
+	GENERATION = 0		# Incremented whenever decoding (re)starts or stops
+	START_FRAME = 1		# Frame to start decoding at, or -1 to stop
+	WANTED_FRAME = 2	# Most recent frame the render loop has asked for
+	WRITE_POS = 3		# Slot to write the first frame of a generation into
+	FINISHED = 4		# Generation for which the last frame has been decoded
+	ERROR = 5		# Set when the decoder process failed
+	EXIT = 6		# Set to let the decoder process exit
+	DECODED = 7		# Frames written into the ring
+	SKIPPED = 8		# Frames skipped because they were already too late
+	# Statistics of the StreamDecoder of the process
+	DECODER_STATS = 9
+	HEADER_FIELDS = 13
+
+	# Frames that have been passed on might still be in use when the process
+	# is closed. Their shared memory is released when the next one is closed.
+	unreleased = []
+
+	def __init__(self, videofile, size, n_frames, pixel_format="rgb24", depth=8, hold=2,
+		skip_late=False, keyframes=None):
+		"""
+		Constructor
+
+		Arguments:
+		videofile	--  path to the video file
+		size		--  (width, height) to decode the frames at
+		n_frames	--  the total number of frames in the clip
+
+		Keyword arguments:
+		pixel_format	--  one of PIXEL_FORMATS (default: "rgb24")
+		depth		--  number of buffers in the ring (default: 8)
+		hold		--  number of most recently delivered frames that are
+					protected from being overwritten (default: 2)
+		skip_late	--  do not deliver frames that are older than the frame that
+					was last requested by the render loop, but continue with
+					that frame. ffmpeg still decodes the frames in between,
+					unless the decoder seeks past them (default: False)
+		keyframes	--  KeyframeIndex of the clip for the StreamDecoder of the
+					process (default: None)
+		"""
+		if shared_memory is None:
+			raise RuntimeError("Decoding in a separate process requires Python 3.8 or newer")
+		if depth <= hold:
+			raise ValueError("prefetch depth needs to be greater than {0}".format(hold))
+
+		self.n_frames = n_frames
+		self.depth = depth
+		self.hold = hold
+		self.frame_shape = frame_shape(size, pixel_format)
+		self.shm = shared_memory.SharedMemory(create=True,
+			size=self.ring_size(depth, self.frame_shape))
+		self.header, self.slot_state, self.slot_frame, self.buffers = \
+			self.map_ring(self.shm.buf, depth, self.frame_shape)
+		self.header[:] = 0
+		self.header[self.START_FRAME] = -1
+		self.slot_state[:] = self.FREE
+		self.slot_frame[:] = -1
+
+		context = self.context()
+		self.cond = context.Condition()
+		self.errors = context.Queue()
+		self.process = context.Process(target=run_decoder_process,
+			args=(self.shm.name, depth, self.frame_shape, self.cond, self.errors,
+			videofile, tuple(size), n_frames, pixel_format, skip_late, keyframes))
+		self.process.daemon = True
+		self.process.start()
+		# Also clean up if the player is discarded (or the program exits)
+		# without closing the decoder, e.g. the next clip of a loop
+		self.finalizer = weakref.finalize(self, DecoderProcess.release, self.process, self.shm)
+
+		self.generation = 0
+		self.read_pos = 0
+		self.held_slots = deque()
+		# Slot and number of the frame that was delivered last
+		self.last_slot = None
+		self.last_frame_no = -1
+		# The frame the next call of fetch() is expected to ask for, or None
+		# if decoding has been stopped
+		self.next_frame_no = None
+		self.closed = False
+		self.error = None
+		self.final_header = None
+
+		# Statistics
+		self.delivered = 0
+		self.discarded = 0
+		self.underruns = 0
+
+	@staticmethod
+	def context():
+		""" Returns the multiprocessing context to start decoder processes with.
+		A forked process would inherit the pipes of the ffmpeg processes of
+		this one, which then never see them closed, so the processes are
+		started by a fork server (with this module already imported) or, where
+		that is not available, spawned. As with any spawned process, the main
+		module of the program is imported in them, so it should only start
+		playback under an if __name__ == "__main__": guard. """
+		if "forkserver" in multiprocessing.get_all_start_methods():
+			context = multiprocessing.get_context("forkserver")
+			context.set_forkserver_preload(["__main__", __name__])
+			return context
+		return multiprocessing.get_context("spawn")
+
+	@staticmethod
+	def ring_size(depth, frame_shape):
+		""" Number of bytes of shared memory taken up by the header, the state
+		of the slots and the frame buffers of a ring """
+		return 8 * (DecoderProcess.HEADER_FIELDS + 2 * depth) + depth * int(np.prod(frame_shape))
+
+	@staticmethod
+	def map_ring(buf, depth, frame_shape):
+		""" Returns (header, slot_state, slot_frame, buffers) numpy views on the
+		shared memory buf of a ring """
+		fields = np.ndarray((DecoderProcess.HEADER_FIELDS + 2 * depth,), dtype=np.int64, buffer=buf)
+		buffers = np.ndarray((depth,) + tuple(frame_shape), dtype=np.uint8, buffer=buf,
+			offset=fields.nbytes)
+		n = DecoderProcess.HEADER_FIELDS
+		return fields[:n], fields[n:n+depth], fields[n+depth:], buffers
+
+	@property
+	def fill(self):
+		""" Number of decoded frames that are waiting to be delivered """
+		if self.closed:
+			return 0
+		return int(np.count_nonzero(self.slot_state == self.READY))
+
+	@property
+	def stats(self):
+		""" Dictionary with the fill level and counters of the ring buffer """
+		header = self.final_header if self.closed else self.header
+		return {
+			'depth':	self.depth,
+			'fill':		self.fill,
+			'decoded':	int(header[self.DECODED]),
+			'delivered':	self.delivered,
+			'discarded':	self.discarded,
+			'skipped':	int(header[self.SKIPPED]),
+			'underruns':	self.underruns,
+		}
+
+	@property
+	def decoder_stats(self):
+		""" Statistics of the StreamDecoder of the process, see
+		StreamDecoder.stats """
+		header = self.final_header if self.closed else self.header
+		return dict(zip(['decoded', 'skipped', 'seeks', 'rereads'],
+			[int(value) for value in header[self.DECODER_STATS:self.DECODER_STATS+4]]))
+
+	def start(self, start_frame=0):
+		""" Start decoding frames from start_frame onwards. Frames that were
+		decoded for another position are thrown away, unless decoding already
+		continues from start_frame. """
+		if self.closed:
+			raise RuntimeError("The decoder process has been closed")
+		with self.cond:
+			if self.next_frame_no is not None and (start_frame == self.next_frame_no or
+				start_frame == self.last_frame_no == self.next_frame_no - 1):
+				return
+			self.__restart(start_frame)
+			self.next_frame_no = start_frame
+
+	def stop(self):
+		""" Stop decoding. The decoder process waits for the next call of
+		start(). """
+		if self.closed:
+			return
+		with self.cond:
+			self.__restart(-1)
+			self.next_frame_no = None
+
+	def fetch(self, frame_no, block=False):
+		""" Returns the buffer containing frame frame_no, or None if this frame
+		is not available. See FramePrefetcher.fetch(). """
+		with self.cond:
+			# The frame that was delivered last can be served again
+			if frame_no == self.last_frame_no and self.last_slot is not None and \
+				self.slot_state[self.last_slot] == self.HELD:
+				return self.buffers[self.last_slot]
+			self.header[self.WANTED_FRAME] = max(self.header[self.WANTED_FRAME], frame_no)
+			while True:
+				if self.header[self.ERROR]:
+					self.__raise_error()
+				# Throw away frames that have become too late to be shown
+				while self.slot_state[self.read_pos] == self.READY and \
+					self.slot_frame[self.read_pos] < frame_no:
+					self.slot_state[self.read_pos] = self.FREE
+					self.read_pos = (self.read_pos + 1) % self.depth
+					self.discarded += 1
+					self.cond.notify_all()
+
+				slot = self.read_pos
+				if self.slot_state[slot] == self.READY:
+					if self.slot_frame[slot] != frame_no:
+						return None
+					return self.__deliver(slot)
+
+				if self.next_frame_no is None or frame_no >= self.n_frames or \
+					self.header[self.FINISHED] == self.generation:
+					return None
+				if not block:
+					self.underruns += 1
+					return None
+				if not self.cond.wait(0.1) and not self.process.is_alive():
+					raise RuntimeError("The decoder process has exited unexpectedly")
+
+	def get_frame(self, frame_no, out=None):
+		""" Returns frame frame_no as a numpy array, decoding from it onwards.
+		See StreamDecoder.get_frame(). """
+		self.start(frame_no)
+		frame = self.fetch(frame_no, block=True)
+		if frame is None:
+			raise ValueError("Frame {0} could not be decoded".format(frame_no))
+		if out is None:
+			return frame.copy()
+		out[...] = frame
+		return out
+
+	def close(self):
+		""" Lets the decoder process exit and releases the shared memory """
+		if self.closed:
+			return
+		with self.cond:
+			self.header[self.EXIT] = 1
+			self.cond.notify_all()
+		self.process.join(1.0)
+		self.closed = True
+		self.final_header = self.header.copy()
+		self.header = self.slot_state = self.slot_frame = self.buffers = None
+		self.finalizer()
+		DecoderProcess.unreleased.append(self.shm)
+		for shm in list(DecoderProcess.unreleased):
+			try:
+				shm.close()
+				DecoderProcess.unreleased.remove(shm)
+			except BufferError:
+				# A renderer still holds on to one of its frames
+				pass
+
+	@staticmethod
+	def release(process, shm):
+		""" Terminates process if it has not exited, and removes the shared
+		memory shm, so it is freed once it is no longer mapped """
+		if process.is_alive():
+			process.terminate()
+			process.join()
+		shm.unlink()
+
+	def __restart(self, start_frame):
+		""" Throws away the frames that have not been delivered yet, and lets
+		the decoder process continue at start_frame (or stop, if it is -1).
+		Should only be called while holding the lock. """
+		for slot in range(self.depth):
+			if self.slot_state[slot] == self.READY:
+				self.slot_state[slot] = self.FREE
+		# Frames are written in order from the first slot that is not held
+		self.header[self.WRITE_POS] = self.read_pos
+		self.header[self.START_FRAME] = start_frame
+		self.header[self.WANTED_FRAME] = start_frame
+		self.header[self.GENERATION] += 1
+		self.generation = self.header[self.GENERATION]
+		self.cond.notify_all()
+
+	def __deliver(self, slot):
+		""" Marks slot as held by the renderer and releases the oldest held slot.
+		Should only be called while holding the lock. """
+		self.slot_state[slot] = self.HELD
+		self.held_slots.append(slot)
+		if len(self.held_slots) > self.hold:
+			self.slot_state[self.held_slots.popleft()] = self.FREE
+		self.read_pos = (slot + 1) % self.depth
+		self.last_slot = slot
+		self.last_frame_no = int(self.slot_frame[slot])
+		self.next_frame_no = self.last_frame_no + 1
+		self.delivered += 1
+		self.cond.notify_all()
+		return self.buffers[slot]
+
+	def __raise_error(self):
+		""" Raises the error the decoder process has reported """
+		if self.error is None:
+			try:
+				self.error = self.errors.get(timeout=1.0)
+			except Exception:
+				self.error = "unknown error"
+		raise RuntimeError("The decoder process failed: {0}".format(self.error))
+
+
+def run_decoder_process(shm_name, depth, frame_shape, cond, errors, videofile, size,
+	n_frames, pixel_format, skip_late, keyframes):
+	""" Main function of the process of a DecoderProcess, which decodes frames
+	into the ring in the shared memory shm_name. Do not call directly. """
+	try:
+		shm = shared_memory.SharedMemory(shm_name, track=False)
+	except TypeError:
+		# Python < 3.13
+		shm = shared_memory.SharedMemory(shm_name)
+	header, slot_state, slot_frame, buffers = DecoderProcess.map_ring(shm.buf, depth, frame_shape)
+	reader = decoder = None
+	generation = 0
+	frame_no = -1
+	write_pos = 0
+	try:
+		reader = FFMPEG_VideoReader(videofile)
+		if tuple(reader.size) != tuple(size):
+			reader.size = size
+			reader.close()
+		decoder = StreamDecoder(reader, pixel_format=pixel_format, keyframes=keyframes)
+		while True:
+			with cond:
+				# Wait until there is a free slot to decode the next frame into,
+				# or decoding has to continue somewhere else
+				while True:
+					if header[DecoderProcess.EXIT]:
+						return
+					if header[DecoderProcess.GENERATION] != generation:
+						generation = header[DecoderProcess.GENERATION]
+						frame_no = int(header[DecoderProcess.START_FRAME])
+						write_pos = int(header[DecoderProcess.WRITE_POS])
+					if skip_late and header[DecoderProcess.WANTED_FRAME] > frame_no >= 0:
+						header[DecoderProcess.SKIPPED] += min(header[DecoderProcess.WANTED_FRAME],
+							n_frames) - frame_no
+						frame_no = int(header[DecoderProcess.WANTED_FRAME])
+					if frame_no >= n_frames and header[DecoderProcess.FINISHED] != generation:
+						header[DecoderProcess.FINISHED] = generation
+						cond.notify_all()
+					if 0 <= frame_no < n_frames and slot_state[write_pos] == DecoderProcess.FREE:
+						break
+					cond.wait()
+				slot = write_pos
+
+			decoder.get_frame(frame_no, buffers[slot])
+
+			with cond:
+				# Frames of a previous generation are thrown away
+				if header[DecoderProcess.GENERATION] == generation:
+					slot_frame[slot] = frame_no
+					slot_state[slot] = DecoderProcess.READY
+					write_pos = (slot + 1) % depth
+					frame_no += 1
+					header[DecoderProcess.DECODED] += 1
+					stats = decoder.stats
+					header[DecoderProcess.DECODER_STATS:DecoderProcess.DECODER_STATS+4] = [
+						stats['decoded'], stats['skipped'], stats['seeks'], stats['rereads']]
+					cond.notify_all()
+	except Exception as e:
+		errors.put("{0}: {1}".format(type(e).__name__, e))
+		with cond:
+			header[DecoderProcess.ERROR] = 1
+			cond.notify_all()
+	finally:
+		if decoder is not None:
+			decoder.close()
+		if reader is not None:
+			reader.close()
+		del header, slot_state, slot_frame, buffers
+		shm.close()
+
+
+class CachedClip(object):
+	""" Entry of the ClipCache: an opened clip, and optionally all of its
+	(video and audio) frames decoded in memory """
+
+	def __init__(self, clip):
+		self.clip = clip
+		# Decoded frames, and the (size, pixel_format) they were decoded at
+		self.frames = None
+		self.frames_format = None
+		self.audio = None
+		# KeyframeIndex of the file, once it has been loaded
+		self.keyframes = None
+		# Whether a player has checked out the clip (see ClipCache.get())
+		self.in_use = False
+
+	@property
+	def nbytes(self):
+		""" Memory taken up by the decoded frames """
+		return sum(a.nbytes for a in [self.frames, self.audio] if a is not None)
+
+
+class ClipCache(object):
+	""" Keeps clips open (and optionally their decoded frames in memory) after
+	they have been played, so that playing the same file again does not
+	require probing it and starting ffmpeg again. Clips are identified by
+	their path and modification time, so a file that has changed is opened
+	anew. When the cache holds more than max_clips clips, or the decoded frames
+	take up more than max_bytes, the least recently used clips are evicted.
+
+	A clip is checked out by the player that gets it from the cache, until
+	that player releases it again. The reader of a clip can only be at one
+	position (and decode at one size) at a time, so other players that load
+	the file in the meantime have to open a clip of their own. """
+
+	def __init__(self, max_clips=8, max_bytes=512 * 1024 * 1024):
+		"""
+		Constructor
+
+		Keyword arguments:
+		max_clips	--  maximum number of clips to keep open (default: 8)
+		max_bytes	--  maximum amount of memory in bytes the decoded frames of
+					all clips may take up (default: 512 MB)
+		"""
+		self.max_clips = max_clips
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+		# Statistics
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.busy = 0
+
+	@property
+	def nbytes(self):
+		""" Memory taken up by the decoded frames of all clips in the cache """
+		return sum(entry.nbytes for entry in self.entries.values())
+
+	@property
+	def stats(self):
+		""" Dictionary with the number of cache hits, misses and evictions, the
+		number of times a clip was requested while it was checked out, and the
+		number of clips and bytes in the cache """
+		return {
+			'hits':		self.hits,
+			'misses':	self.misses,
+			'evictions':	self.evictions,
+			'busy':		self.busy,
+			'clips':	len(self.entries),
+			'bytes':	self.nbytes,
+		}
+
+	def get(self, videofile, audio=True):
+		""" Checks out the CachedClip of videofile, which is opened if it is not
+		in the cache (or has changed since it was cached). The clip should be
+		given back with release() once it is no longer used.
+
+		Arguments:
+		videofile	--  path to the video file
+
+		Keyword arguments:
+		audio		--  whether the audio track should be loaded (default: True)
+
+		Returns:
+		The CachedClip, or None if it is checked out by another player
+		"""
+		path = os.path.abspath(videofile)
+		key = (path, os.path.getmtime(path), bool(audio))
+		with self.lock:
+			entry = self.entries.pop(key, None)
+			if entry is not None:
+				# Move the entry to the most recently used end
+				self.entries[key] = entry
+				if entry.in_use:
+					self.busy += 1
+					return None
+				entry.in_use = True
+				self.hits += 1
+				return entry
+			self.misses += 1
+			# Older versions of the file will never be used again
+			for stale_key in [k for k in self.entries if k[0] == path]:
+				self.__evict(stale_key)
+
+		entry = CachedClip(VideoFileClip(path, audio=audio))
+		entry.in_use = True
+		with self.lock:
+			self.entries[key] = entry
+			self.__enforce_limits(entry)
+		return entry
+
+	def release(self, entry):
+		""" Gives back a CachedClip that was checked out with get(), so that
+		other players can use it """
+		with self.lock:
+			entry.in_use = False
+
+	def store_frames(self, entry, frames, frames_format, audio=None):
+		""" Stores the decoded frames of a clip in its cache entry, unless they
+		do not fit in max_bytes. Other clips are evicted to make room for them
+		if necessary.
+
+		Arguments:
+		entry		--  the CachedClip the frames belong to
+		frames		--  numpy array with all decoded frames of the clip
+		frames_format	--  (size, pixel_format) of the frames
+
+		Keyword arguments:
+		audio		--  numpy array with all audio samples of the clip (default: None)
+
+		Returns:
+		True if the frames were stored, False if they are too large
+		"""
+		if frames.nbytes + (0 if audio is None else audio.nbytes) > self.max_bytes:
+			return False
+		with self.lock:
+			entry.frames = frames
+			entry.frames_format = frames_format
+			entry.audio = audio
+			self.__enforce_limits(entry)
+		return True
+
+	def evict(self, videofile=None):
+		""" Removes videofile (all versions of it), or all clips if videofile
+		is None, from the cache. The ffmpeg processes of a clip are ended once
+		no player uses it anymore. """
+		with self.lock:
+			if videofile is None:
+				keys = list(self.entries)
+			else:
+				path = os.path.abspath(videofile)
+				keys = [k for k in self.entries if k[0] == path]
+			for key in keys:
+				self.__evict(key)
+
+	def __enforce_limits(self, keep):
+		""" Evicts the least recently used clips (except keep) until the cache
+		is within its limits. Should only be called while holding the lock. """
+		for key in list(self.entries):
+			if len(self.entries) <= self.max_clips and self.nbytes <= self.max_bytes:
+				break
+			if self.entries[key] is not keep:
+				self.__evict(key)
+
+	def __evict(self, key):
+		""" Removes an entry. Should only be called while holding the lock. """
+		del self.entries[key]
+		self.evictions += 1
+
+# Process-wide cache that players can share (see the clip_cache argument of Player)
+clip_cache = ClipCache()
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+	""" Returns the SHA-1 hex digest of the contents of the file at path """
+	sha1 = hashlib.sha1()
+	with open(path, "rb") as f:
+		chunk = f.read(chunk_size)
+		while chunk:
+			sha1.update(chunk)
+			chunk = f.read(chunk_size)
+	return sha1.hexdigest()
+
+def describe_source(videofile, with_hash=True):
+	""" Returns a dictionary that identifies the contents of videofile (its
+	path, size, modification time and SHA-1 hash), to check later on whether
+	data derived from it is still up to date """
+	stat = os.stat(videofile)
+	source = {'path': os.path.abspath(videofile), 'size': stat.st_size,
+		'mtime': stat.st_mtime}
+	if with_hash:
+		source['sha1'] = file_hash(videofile)
+	return source
+
+def source_unchanged(source, videofile):
+	""" Checks whether videofile still has the contents described by source
+	(see describe_source()). When its size is the same but its modification
+	time has changed, the contents are compared by hash. """
+	current = describe_source(videofile, with_hash=False)
+	if source["size"] != current["size"]:
+		return False
+	return source["mtime"] == current["mtime"] or source["sha1"] == file_hash(videofile)
+
+
+class FrameCacheFile(object):
+	""" Raw file on disk with all decoded (video and audio) frames of a clip,
+	which is memory-mapped for playback. The file starts with a header of
+	HEADER_SIZE bytes: MAGIC followed by a JSON object that describes the
+	frames (size, fps, pixel format, ...) and the source file they were
+	decoded from (size, modification time and SHA-1 hash). The video frames
+	follow the header, and the int16 audio samples (if any) start at
+	audio_offset bytes after it. """
+
+	MAGIC = b"MPYFRAMES\n"
+	HEADER_SIZE = 4096
+
+	def __init__(self, path):
+		"""
+		Constructor
+
+		Arguments:
+		path		--  location of the cache file
+		"""
+		self.path = path
+
+	def read_header(self):
+		""" Returns the header of the file as a dictionary, or None if the file
+		does not exist or is not a frame cache file """
+		try:
+			with open(self.path, "rb") as f:
+				header = f.read(self.HEADER_SIZE)
+		except (IOError, OSError):
+			return None
+		if not header.startswith(self.MAGIC):
+			return None
+		try:
+			return json.loads(header[len(self.MAGIC):].decode("utf-8"))
+		except ValueError:
+			return None
+
+	def is_valid(self, videofile, frames_format):
+		""" Checks whether the file holds frames of videofile in frames_format.
+		When the size or modification time of videofile have changed since
+		the frames were cached, its contents are compared by hash.
+
+		Arguments:
+		videofile	--  path to the source video file
+		frames_format	--  dictionary with the header fields that describe the
+					format of the frames, which all need to match
+		"""
+		header = self.read_header()
+		if header is None:
+			return False
+		for key, value in frames_format.items():
+			if header.get(key) != value:
+				return False
+		return source_unchanged(header["source"], videofile)
+
+	def create(self, nbytes):
+		""" Creates a temporary file next to path with room for nbytes of
+		frames, and returns a writable memory-mapped uint8 array of them. The
+		file only replaces path when commit() is called. """
+		with open(self.path + ".tmp", "wb") as f:
+			f.truncate(self.HEADER_SIZE + nbytes)
+		return np.memmap(self.path + ".tmp", dtype=np.uint8, mode="r+",
+			offset=self.HEADER_SIZE, shape=(nbytes,))
+
+	def commit(self, header):
+		""" Writes header to the file created by create() and moves it into
+		place. All writes to the memory-mapped frames should be flushed. """
+		data = self.MAGIC + json.dumps(header, sort_keys=True).encode("utf-8")
+		if len(data) > self.HEADER_SIZE:
+			raise ValueError("Frame cache header too large")
+		with open(self.path + ".tmp", "r+b") as f:
+			f.write(data.ljust(self.HEADER_SIZE, b" "))
+		if os.path.exists(self.path):
+			# os.rename does not overwrite on Windows
+			os.remove(self.path)
+		os.rename(self.path + ".tmp", self.path)
+
+	def open(self):
+		""" Maps the file (read-only) and returns (header, frames, audio). Audio
+		is None if the file has no audio samples. """
+		header = self.read_header()
+		data = np.memmap(self.path, dtype=np.uint8, mode="r", offset=self.HEADER_SIZE)
+		frame_shape = tuple(header["frame_shape"])
+		frames = data[:header["nframes"] * int(np.prod(frame_shape))].reshape(
+			(header["nframes"],) + frame_shape)
+		audio = None
+		if header["audio_samples"]:
+			offset = header["audio_offset"]
+			audio = data[offset:offset + header["audio_samples"] * header["audio_nchannels"] * 2]
+			audio = audio.view(np.int16).reshape(-1, header["audio_nchannels"])
+		return header, frames, audio
+
+
+class KeyframeIndex(object):
+	""" The frame numbers of the keyframes of a video file, from which ffmpeg
+	has to start decoding to reach a frame. The index is built by letting
+	ffmpeg decode only the keyframes of the file, and stored as JSON next to
+	the file (the file name plus SUFFIX) or in a cache folder, so this only
+	has to be done once. """
+
+	SUFFIX = ".keyframes.json"
+
+	def __init__(self, keyframes):
+		"""
+		Constructor
+
+		Arguments:
+		keyframes	--  sequence of the frame numbers of the keyframes
+		"""
+		self.keyframes = np.unique(np.asarray(keyframes, dtype=np.int64))
+		if not len(self.keyframes) or self.keyframes[0] != 0:
+			# Decoding can always start at the beginning of the file
+			self.keyframes = np.insert(self.keyframes, 0, 0)
+
+	def __len__(self):
+		return len(self.keyframes)
+
+	def previous(self, frame_no):
+		""" Returns the last keyframe at or before frame_no """
+		return int(self.keyframes[np.searchsorted(self.keyframes, frame_no, side="right") - 1])
+
+	@classmethod
+	def scan(cls, videofile, fps):
+		""" Builds the index of videofile by decoding its keyframes with ffmpeg
+
+		Arguments:
+		videofile	--  path to the video file
+		fps		--  frame rate of the video, to convert the timestamps of
+					the keyframes to frame numbers
+		"""
+		cmd = [get_setting("FFMPEG_BINARY"), "-hide_banner", "-nostats",
+			"-skip_frame", "nokey", "-i", videofile, "-map", "0:v:0",
+			"-vf", "showinfo", "-f", "null", "-"]
+		proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		output = proc.communicate()[1].decode("utf8", "replace")
+		if proc.returncode != 0:
+			raise IOError("Could not scan the keyframes of {0}".format(videofile))
+		keyframes = [int(round(float(t) * fps)) for t, key in
+			re.findall(r"pts_time:(\S+).*?\b(?:is)?key:(\d)", output) if key == "1"]
+		return cls(keyframes)
+
+	@classmethod
+	def path(cls, videofile, cache_dir=None):
+		""" Returns the path of the file the index of videofile is stored in:
+		next to videofile, or in cache_dir if it is specified. In cache_dir,
+		the name includes a hash of the path of videofile, so that videos with
+		the same name in different folders do not share an index. """
+		if cache_dir is None:
+			return videofile + cls.SUFFIX
+		return os.path.join(cache_dir, "{0}-{1}{2}".format(os.path.basename(videofile),
+			hashlib.sha1(os.path.abspath(videofile).encode("utf-8")).hexdigest()[:8],
+			cls.SUFFIX))
+
+	@classmethod
+	def load(cls, videofile, fps, cache_dir=None):
+		""" Returns the index of videofile from the file it is stored in (see
+		path()), or scans videofile if that file does not exist or is out of
+		date. The scanned index is stored if the folder is writable.
+
+		Arguments:
+		videofile	--  path to the video file
+		fps		--  frame rate of the video
+
+		Keyword arguments:
+		cache_dir	--  folder to store the index in, or None to store it next
+					to the video file (default: None)
+		"""
+		path = cls.path(videofile, cache_dir)
+		try:
+			with open(path) as f:
+				stored = json.load(f)
+			if stored["fps"] == fps and source_unchanged(stored["source"], videofile):
+				return cls(stored["keyframes"])
+		except (IOError, OSError, ValueError, KeyError):
+			pass
+
+		index = cls.scan(videofile, fps)
+		try:
+			if cache_dir is not None and not os.path.isdir(cache_dir):
+				os.makedirs(cache_dir)
+			with open(path, "w") as f:
+				json.dump({'source': describe_source(videofile), 'fps': fps,
+					'keyframes': index.keyframes.tolist()}, f)
+		except (IOError, OSError) as e:
+			print("Could not store the keyframe index of {0}: {1}".format(videofile, e))
+		return index
+
+
+# Stages of playback that Player records in its timings (see StageTimings):
+# - "fetch": getting the due frame in the render loop (decoding it, or waiting
+#   for the prefetcher)
+# - "decode": decoding a frame ahead of time in the prefetch thread
+# - "render": the videorenderfunc
+# - "audio_read": reading a block of audio from the clip
+# - "audio_render": the audiorenderfunc
+TIMING_STAGES = ["fetch", "decode", "render", "audio_read", "audio_render"]
+
+class StageTimings(object):
+	""" Records how long each stage of playback takes, every time it runs,
+	e.g. to find out where the time goes when frames are dropped. The
+	durations are stored in arrays that are allocated up front and wrap
+	around once they are full, so recording does not allocate any memory.
+	Each stage should be recorded from a single thread only.
+
+	A stage is timed with
+
+		start = monotonic_time()
+		...
+		timings.record("decode", start)
+	"""
+
+	def __init__(self, stages=TIMING_STAGES, capacity=10000):
+		"""
+		Constructor
+
+		Keyword arguments:
+		stages		--  names of the stages (default: TIMING_STAGES)
+		capacity	--  number of durations that are kept per stage; once
+					there are more, the oldest ones are overwritten
+					(default: 10000)
+		"""
+		if capacity < 1:
+			raise ValueError("Invalid capacity: {0}".format(capacity))
+		self.stages = list(stages)
+		self.capacity = capacity
+		self.__index = dict((stage, i) for i, stage in enumerate(self.stages))
+		self.__durations = np.zeros((len(self.stages), capacity))
+		self.__counts = [0] * len(self.stages)
+
+	def record(self, stage, start):
+		""" Records the time that has passed since start (a monotonic_time())
+		as a duration of stage, and returns the current time, so that the next
+		stage can be timed from there """
+		now = monotonic_time()
+		i = self.__index[stage]
+		self.__durations[i, self.__counts[i] % self.capacity] = now - start
+		self.__counts[i] += 1
+		return now
+
+	def reset(self):
+		""" Discards all recorded durations """
+		self.__counts = [0] * len(self.stages)
+
+	def count(self, stage):
+		""" Number of times stage has been recorded (including the ones that
+		have been overwritten since) """
+		return self.__counts[self.__index[stage]]
+
+	def durations(self, stage):
+		""" Returns the kept durations of stage in seconds, oldest first """
+		i = self.__index[stage]
+		count = self.__counts[i]
+		if count <= self.capacity:
+			return self.__durations[i, :count].copy()
+		return np.roll(self.__durations[i], -(count % self.capacity))
+
+	def summary(self):
+		""" Returns an OrderedDict with for every recorded stage a dict with
+		its number of recordings (n) and the mean, p50, p95, p99 and max of
+		its kept durations in seconds """
+		summary = OrderedDict()
+		for stage in self.stages:
+			durations = self.durations(stage)
+			if not len(durations):
+				continue
+			p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+			summary[stage] = {"n": self.count(stage), "mean": durations.mean(),
+				"p50": p50, "p95": p95, "p99": p99, "max": durations.max()}
+		return summary
+
+	def save(self, path):
+		""" Writes the kept durations to path. A path ending in .npz gets a
+		numpy archive with an array of durations in seconds per stage. Any
+		other path gets a CSV file with a stage,sample,duration_ms row for
+		every duration. """
+		if path.lower().endswith(".npz"):
+			np.savez(path, **dict((str(stage), self.durations(stage))
+				for stage in self.stages))
+			return
+		with open(path, "w") as f:
+			f.write("stage,sample,duration_ms\n")
+			for stage in self.stages:
+				for sample, duration in enumerate(self.durations(stage)):
+					f.write("{0},{1},{2:.6f}\n".format(stage, sample, 1000 * duration))
+
+
+# Units in which the position can be passed to Player.seek()
+SEEK_UNITS = ["seconds", "frames"]
+
+# Ways in which frames can be retrieved from the clip, see the decode_mode
+# argument of Player
+DECODE_MODES = ["time", "stream", "process"]
+
+# Ways in which video playback can deal with frames that are not decoded in
+# time, see the sync_policy argument of Player
+SYNC_POLICIES = ["never_drop", "drop", "audio_master"]
+
+
+class QueuedClip(object):
+	""" A clip in the sequence that a Player plays without gaps (see
+	Player.queue() and the loop argument of Player). It is opened, and its
+	first frame is decoded, in a background thread while the clip before it
+	plays, so that playback can continue with it right away. """
+
+	def __init__(self, videofile, clip=None, cache_entry=None, frames=None, audio=None):
+		"""
+		Constructor
+
+		Arguments:
+		videofile	--  path to the video file
+
+		Keyword arguments:
+		clip		--  the already opened clip of the file (default: None)
+		cache_entry	--  the CachedClip the clip belongs to (default: None)
+		frames		--  preloaded frames of the clip (default: None)
+		audio		--  preloaded audio samples of the clip (default: None)
+		"""
+		self.videofile = os.path.abspath(videofile)
+		self.clip = clip
+		self.cache_entry = cache_entry
+		self.frames = frames
+		self.audio = audio
+		self.decoder = None
+		self.audio_stream = None
+		# Duration of the clip in the playback sequence: the number of frames
+		# divided by the frame rate
+		self.length = None
+		# Set when the clip can be played (or error is set), and when the
+		# audio render thread has passed on all of its audio
+		self.ready = threading.Event()
+		self.audio_done = threading.Event()
+		self.error = None
+
+
 class Player(object):
 	""" This class loads a video file that can be played. It returns video and audioframes, but can also
 	be passed a callback function that can take care of the rendering elsewhere. """
 
-	def __init__(self, videofile=None, videorenderfunc=None, audiorenderfunc=None, play_audio=True):
+	def __init__(self, videofile=None, videorenderfunc=None, audiorenderfunc=None, play_audio=True,
+		clock_mode="thread", prefetch_depth=0, decode_mode="time", sync_policy="drop",
+		spin_wait=0.0, audio_block_size=1024, pixel_format="rgb24", clip_cache=None,
+		preload=False, preload_limit=1024**3, preload_memmap=None, frame_cache_dir=None,
+		loop=False):
 		"""
 		Constructor
 
@@ -187,9 +1845,159 @@ class Player(object):
 					arguments:
 						- frame (numpy array): the audioframe to be rendered
 		play_audio 	--  Whether audio of the clip should be played (default: True)
+		clock_mode	--  The clock that keeps track of the playback time (default: "thread")
+					- "thread": stopwatch that is updated every millisecond in
+					  a separate thread
+					- "monotonic": time is calculated on demand from a monotonic
+					  high resolution clock, without an extra thread
+		prefetch_depth	--  Number of frames that are decoded ahead of playback in a
+					separate thread. Set to 0 to decode each frame in the
+					render loop when it is due (default: 0)
+		decode_mode	--  How frames are retrieved from the clip (default: "time")
+					- "time": each frame is looked up by its timestamp
+					- "stream": frames are read in order from a single
+					  ffmpeg pipe, which is only reopened when playback
+					  jumps to a different position
+					- "process": frames are read as in "stream" mode, but
+					  by a separate process that passes them on through
+					  shared memory (see DecoderProcess), so decoding does
+					  not compete with playback for the GIL. The frames are
+					  always decoded ahead, into a ring of prefetch_depth
+					  (or 8, if that is 0) buffers. Requires Python 3.8
+		sync_policy	--  What to do when the decoder falls behind (default: "drop")
+					- "never_drop": show every frame in order, even if this
+					  means video lags behind the clock (and audio)
+					- "drop": skip frames that are too late, to catch up
+					  with the clock. Skipped frames are not passed on,
+					  but they are still decoded, unless the decoder
+					  seeks past them
+					- "audio_master": like "drop", but the clock follows the
+					  playback position reported by the audio renderer (see
+					  set_audioposition_callback()) instead of clock_mode
+		spin_wait	--  The render loop sleeps until the next frame is due. The
+					last spin_wait seconds before that deadline are spent
+					busy-waiting instead, for more precise timing on
+					platforms with coarse sleep resolution (default: 0.0)
+		audio_block_size --  Number of samples (per channel) in each audio frame that
+					is passed to the audiorenderfunc (default: 1024)
+		pixel_format	--  Format of the frames passed to the videorenderfunc
+					(default: "rgb24")
+					- "rgb24": (height, width, 3) RGB arrays
+					- "yuv420p": planar YUV 4:2:0 arrays as described in
+					  frame_shape(), which take half the memory and leave
+					  the conversion to RGB to the renderer (e.g. on the
+					  GPU). Requires the "stream" or "process" decode_mode.
+		clip_cache	--  ClipCache to open video files through, e.g. the
+					process-wide player.clip_cache, or None to always open
+					them anew (default: None)
+		preload		--  Decode all (video and audio) frames of the clip into
+					memory before playback starts (see preload_frames()), so
+					that no decoding takes place during playback. With a
+					clip_cache, the frames are kept for the next time the file
+					is played (default: False)
+		preload_limit	--  Clips that would take up more than this many bytes
+					are not preloaded, but decoded during playback as
+					usual (default: 1 GB)
+		preload_memmap	--  Clips that take up more than this many bytes are
+					preloaded into a memory-mapped temporary file instead
+					of memory, so the OS can page them out. None means
+					never (default: None)
+		frame_cache_dir	--  Directory in which the decoded frames of clips are
+					stored in raw files (see FrameCacheFile), which are
+					memory-mapped for playback. A clip is decoded only the
+					first time it is preloaded, or when it has changed.
+					Implies preload, but without preload_limit
+					(default: None)
+		loop		--  Play the clip over and over again without a gap, until
+					stop() is called. The clip is opened a second time in
+					the background, and the two alternate (default: False)
 		"""
 		# Create an internal timer
-		self.clock = Timer()
+		if not clock_mode in CLOCK_MODES:
+			raise ValueError("Invalid clock_mode: {0} (choose from {1})".format(
+				clock_mode, ", ".join(sorted(CLOCK_MODES))))
+		if sync_policy == "audio_master":
+			self.clock = AudioClock()
+		else:
+			self.clock = CLOCK_MODES[clock_mode]()
+
+		self.prefetch_depth = prefetch_depth
+		self.prefetcher = None
+
+		if not decode_mode in DECODE_MODES:
+			raise ValueError("Invalid decode_mode: {0} (choose from {1})".format(
+				decode_mode, ", ".join(DECODE_MODES)))
+		if decode_mode == "process" and shared_memory is None:
+			raise RuntimeError("The process decode_mode requires Python 3.8 or newer")
+		self.decode_mode = decode_mode
+		self.decoder = None
+		# Target, keyframe and duration of the last seek (see seek())
+		self.seek_stats = None
+
+		if not sync_policy in SYNC_POLICIES:
+			raise ValueError("Invalid sync_policy: {0} (choose from {1})".format(
+				sync_policy, ", ".join(SYNC_POLICIES)))
+		self.sync_policy = sync_policy
+		self.reset_frame_stats()
+
+		if not pixel_format in PIXEL_FORMATS:
+			raise ValueError("Invalid pixel_format: {0} (choose from {1})".format(
+				pixel_format, ", ".join(PIXEL_FORMATS)))
+		if pixel_format != "rgb24" and decode_mode == "time":
+			raise ValueError("pixel_format {0} requires the stream or process decode_mode".format(
+				pixel_format))
+		self.pixel_format = pixel_format
+
+		self.clip_cache = clip_cache
+		self.cache_entry = None
+		self.preload = preload
+		self.preload_limit = preload_limit
+		self.preload_memmap = preload_memmap
+		self.frame_cache_dir = frame_cache_dir
+		self.frames = None
+		self.audio = None
+		# Size in bytes, whether it is memory-mapped, duration and growth of the
+		# resident memory in bytes (None if unknown) of the last preload (see
+		# preload_frames())
+		self.preload_stats = None
+
+		self.spin_wait = spin_wait
+		# Wake up the render loop and the audio thread when playback is
+		# paused, resumed or stopped
+		self.wakeup = threading.Event()
+		self.audio_wakeup = threading.Event()
+
+		self.audio_block_size = audio_block_size
+		# How far ahead of the clock audio blocks are passed to the renderer,
+		# in seconds. None means a single block.
+		self.audio_lead = None
+		# How far ahead of the clock video frames are passed to the
+		# videorenderfunc, in seconds, so a renderer that presents frames at
+		# display refreshes can draw a frame before the refresh it is due at
+		self.video_lead = 0.0
+		self.__audiopositionfunc = None
+		# Position the audio renderer reported when playback was last started
+		self.__audioposition_start = 0.0
+		self.__av_offsets = np.zeros((0, 2))
+		self.__n_av_offsets = 0
+		# StageTimings to record how long the stages of playback take in
+		# (see TIMING_STAGES), or None to not record them
+		self.timings = None
+
+		self.loop = loop
+		# Number of times a clip has been played to the end
+		self.times_played = 0
+		# The clips that are played after each other: the loaded clip and the
+		# ones queued after it, and the index of the one that is playing
+		self.__sequence = []
+		self.__sequence_lock = threading.Lock()
+		self.__video_index = 0
+		# Clock time at which the first frame of the current clip is due, and
+		# at which the clock started
+		self.__clip_start = 0.0
+		self.__timeline_start = 0.0
+		self.__last_render_time = None
+		self.__transitions = []
 
 		# Load a video file if specified, but allow users to do this later
 		# by initializing all variables to None
@@ -211,7 +2019,24 @@ class Player(object):
 	@property
 	def current_frame_no(self):
 		""" Current frame_no of video """
-		return self.clock.current_frame
+		if not self.clock.fps:
+			return self.clock.current_frame
+		return self.frame_no_at(self.clock.time)
+
+	def frame_no_at(self, time):
+		""" Returns the number of the frame of the current clip that is due at
+		clock time time (see current_playtime) """
+		return int(self.clock.fps * (time - self.__clip_start))
+
+	def frame_time(self, frame_no):
+		""" Returns the clock time at which frame frame_no of the current clip
+		is due (the inverse of frame_no_at()) """
+		return self.__clip_start + frame_no / self.fps
+
+	@property
+	def frame_shape(self):
+		""" Shape of the numpy arrays passed to the videorenderfunc """
+		return frame_shape(self.clip.size, self.pixel_format)
 
 	@property
 	def current_videoframe(self):
@@ -228,12 +2053,53 @@ class Player(object):
 		""" Clocks current runtime in seconds """
 		return self.clock.time
 
+	@property
+	def prefetch_stats(self):
+		""" Fill level and counters (decoded, delivered, discarded and underrun
+		frames) of the prefetch buffer, or None if frames are not prefetched """
+		if self.prefetcher is None:
+			return None
+		return self.prefetcher.stats
+
+	@property
+	def frame_stats(self):
+		""" Counters of the last playback:
+		- rendered: number of frames that were passed on to the renderer
+		- dropped: number of frames that were never shown
+		- repeated: number of frame intervals during which the previous frame
+		  remained on screen because the due frame was not available
+		- late: number of frames that were shown after their interval had ended
+		"""
+		return dict(self.__frame_stats)
+
+	def reset_frame_stats(self):
+		""" Resets the counters in frame_stats """
+		self.__frame_stats = {'rendered': 0, 'dropped': 0, 'repeated': 0, 'late': 0}
+
+	@property
+	def decoder_stats(self):
+		""" Number of decoded and skipped frames, seeks and frames that were
+		decoded more than once during the last playback in "stream" decode
+		mode, or None in "time" decode mode """
+		if self.decoder is None:
+			return None
+		if self.decode_mode == "process":
+			return self.decoder.decoder_stats
+		return self.decoder.stats
+
 	def reset(self):
 		self.clip = None
+		self.cache_entry = None
+		self.frames = None
+		self.audio = None
+		self.keyframe_index = None
 		self.loaded_file = None
+		self.start_frame = 0
+		self.rendered_frame_no = -1
 
 		self.fps = None
 		self.duration = None
+		self.nframes = None
 
 		self.status = UNINITIALIZED
 		self.clock.reset()
@@ -241,35 +2107,267 @@ class Player(object):
 	def load_video(self, videofile, play_audio=True):
 		if not videofile is None:
 			if os.path.isfile(videofile):
-				self.clip = VideoFileClip(videofile,audio=play_audio)
+				self.__close_decoder()
+				self.__discard_queue()
+				self.__release_cache_entries()
+				(clip, cache_entry) = self.__open_clip(videofile, play_audio)
+				self.__set_clip(videofile, clip, cache_entry)
+				self.__sequence = [QueuedClip(videofile, clip, cache_entry)]
+				self.__video_index = 0
+				self.times_played = 0
+				self.frames = None
+				self.audio = None
+				self.keyframe_index = self.cache_entry.keyframes if self.cache_entry else None
+				# Playback starts at the first frame, unless seek() is called
+				self.start_frame = 0
+				self.rendered_frame_no = -1
 
 				if play_audio and self.clip.audio:
 					self.audioformat = {
 						'nbytes':  	  2,
 						'nchannels': 	  self.clip.audio.nchannels,
 						'fps':	 	  self.clip.audio.fps,
-						'chunkduration': 1.0/self.clip.fps
+						'blocksize':	  self.audio_block_size,
+						'chunkduration': self.audio_block_size/float(self.clip.audio.fps)
 					}
 				else:
 					self.audioformat = None
 
-				self.loaded_file = os.path.split(videofile)[1]
-
-				## Timing variables
-				# Clip duration
-				self.duration = self.clip.duration
-				self.clock.max_duration = self.clip.duration
-				# Frames per second of clip
-				self.fps = self.clip.fps
-				self.clock.fps = self.clip.fps
-
 				print("Loaded {0}".format(videofile))
 				self.status = READY
+				if self.cache_entry:
+					# A cached clip might still be scaled for a previous player,
+					# and positioned at the end. Rewind it, so playback can start
+					# without reopening the pipe.
+					self.set_decode_size(None)
+					self.clip.get_frame(0)
 				return True
 			else:
 				raise IOError("File not found: {0}".format(videofile))
 		return False
 
+	def release(self):
+		""" Stops playback and gives the clips of this player back to the clip
+		cache, so that other players can use them. A video has to be loaded
+		again before the player can be used after this. """
+		if self.status in [PLAYING, PAUSED]:
+			self.__stop_playback()
+		self.__close_decoder()
+		self.__discard_queue()
+		self.__release_cache_entries()
+		self.reset()
+
+	def __open_clip(self, videofile, play_audio):
+		""" Returns a (clip, cache_entry) tuple for videofile. The clip is taken
+		from the clip cache if possible; if the cached clip is checked out by
+		another player, a clip of this player's own is opened instead, and
+		cache_entry is None. """
+		cache_entry = self.clip_cache.get(videofile, play_audio) if self.clip_cache else None
+		if cache_entry is not None:
+			return (cache_entry.clip, cache_entry)
+		return (VideoFileClip(videofile, audio=play_audio), None)
+
+	def __release_cache_entries(self):
+		""" Gives the cache entries of the clips in the sequence back to the
+		clip cache """
+		with self.__sequence_lock:
+			entries = []
+			for item in self.__sequence:
+				if item.cache_entry is not None and not any(item.cache_entry is entry
+					for entry in entries):
+					entries.append(item.cache_entry)
+				item.cache_entry = None
+		for entry in entries:
+			self.clip_cache.release(entry)
+		self.cache_entry = None
+
+	def __set_clip(self, videofile, clip, cache_entry):
+		""" Makes clip the current clip, of which the frames are played """
+		self.clip = clip
+		self.cache_entry = cache_entry
+		self.loaded_file = os.path.split(videofile)[1]
+		self.videofile = os.path.abspath(videofile)
+		# Size of the frames in the file, which the decoded frames can
+		# be scaled down from with set_decode_size()
+		self.source_size = tuple(clip.reader.infos["video_size"])
+
+		## Timing variables
+		# Clip duration
+		self.duration = clip.duration
+		self.clock.max_duration = clip.duration
+		# Frames per second of clip
+		self.fps = clip.fps
+		self.clock.fps = clip.fps
+		# Total number of frames in the clip
+		self.nframes = int(self.duration * self.fps)
+
+	def set_decode_size(self, size=None):
+		""" Lets ffmpeg scale the frames to size while decoding them, so smaller
+		frames are passed on to the videorenderfunc (and no scaling is
+		needed afterwards). Can only be called when the video is not playing.
+
+		Keyword arguments:
+		size	--  (width, height) of the decoded frames, or None to decode
+				them at the size of the video file (default: None). With
+				the "yuv420p" pixel_format, the width and height are
+				rounded down to even numbers.
+
+		Returns:
+		The (width, height) the frames will be decoded at
+		"""
+		if self.clip is None:
+			raise RuntimeError("No file loaded")
+		if self.status in [PLAYING, PAUSED]:
+			raise RuntimeError("The decode size cannot be changed during playback")
+		if size is None:
+			size = self.source_size
+		(w, h) = (int(size[0]), int(size[1]))
+		if self.pixel_format == "yuv420p":
+			(w, h) = (w - w % 2, h - h % 2)
+		if w < 1 or h < 1:
+			raise ValueError("Invalid decode size: {0}".format(size))
+
+		if (w, h) != tuple(self.clip.size):
+			self.__close_decoder()
+			self.clip.reader.size = (w, h)
+			self.clip.size = (w, h)
+			# The pipe of the reader still delivers frames at the old size,
+			# so let it be reopened the next time a frame is needed
+			self.clip.reader.close()
+			# Preloaded frames have the wrong size now
+			self.frames = None
+		return (w, h)
+
+	def preload_frames(self):
+		""" Decodes all video frames (at the current decode size and pixel
+		format) and audio samples of the clip into a single contiguous block of
+		memory, from which they are served during playback. With a clip_cache,
+		frames that were decoded for a previous player of the same file are
+		reused. With a frame_cache_dir, the block is a memory-mapped cache file
+		that is only decoded into if it does not hold valid frames yet. Is called
+		by play() if preload (or frame_cache_dir) is set and the frames have not
+		been loaded yet, but can be called earlier to keep the decoding out of
+		the time-critical part of an experiment.
+
+		Returns:
+		True if the clip has been preloaded, False if it would take up more than
+		preload_limit bytes (in which case it is decoded during playback)
+		"""
+		if self.clip is None:
+			raise RuntimeError("No file loaded")
+		start = monotonic_time()
+		memory_start = resident_memory()
+		frames_format = (tuple(self.clip.size), self.pixel_format)
+		if self.cache_entry and self.cache_entry.frames_format == frames_format:
+			self.frames = self.cache_entry.frames
+			self.audio = self.cache_entry.audio
+			self.preload_stats = {'bytes': self.cache_entry.nbytes, 'memmap':
+				isinstance(self.frames, np.memmap), 'time': monotonic_time() - start,
+				'memory': memory_growth(memory_start)}
+			return True
+
+		# The frames are decoded from the same pipe as an idle decoder reads
+		self.__close_decoder()
+
+		# Estimate the size of the block. The audio track can be a few samples
+		# longer than its reported duration, so leave some room.
+		frames_nbytes = self.nframes * int(np.prod(self.frame_shape))
+		# Keep the audio samples aligned
+		frames_nbytes += -frames_nbytes % 16
+		if self.audioformat:
+			n_samples = int(self.clip.audio.duration * self.audioformat["fps"]) + \
+				self.audio_block_size
+			audio_nbytes = n_samples * self.audioformat["nchannels"] * 2
+		else:
+			audio_nbytes = 0
+		nbytes = frames_nbytes + audio_nbytes
+
+		if self.frame_cache_dir:
+			# Decode into the cache file if it does not hold valid frames yet,
+			# and serve the frames from the mapping of the file
+			(w, h) = self.clip.size
+			cache_format = {
+				'frame_shape':		list(self.frame_shape),
+				'pixel_format':		self.pixel_format,
+				'nframes':		self.nframes,
+				'fps':			self.fps,
+				'audio_fps':		self.audioformat["fps"] if self.audioformat else None,
+				'audio_nchannels':	self.audioformat["nchannels"] if self.audioformat else None,
+			}
+			cache_file = FrameCacheFile(os.path.join(self.frame_cache_dir,
+				"{0}-{1}-{2}x{3}-{4}.frames".format(self.loaded_file,
+				hashlib.sha1(self.videofile.encode("utf-8")).hexdigest()[:8], w, h, self.pixel_format)))
+			if not cache_file.is_valid(self.videofile, cache_format):
+				if not os.path.isdir(self.frame_cache_dir):
+					os.makedirs(self.frame_cache_dir)
+				print("Decoding {0} into {1}".format(self.loaded_file, cache_file.path))
+				block = cache_file.create(nbytes)
+				frames, audio = self.__decode_into(block, frames_nbytes)
+				block.flush()
+				header = dict(cache_format)
+				header['source'] = describe_source(self.videofile)
+				header['audio_offset'] = frames_nbytes
+				header['audio_samples'] = 0 if audio is None else len(audio)
+				del block, frames, audio
+				cache_file.commit(header)
+			header, frames, audio = cache_file.open()
+			nbytes = frames.nbytes + (0 if audio is None else audio.nbytes)
+			memmap = True
+		else:
+			if nbytes > self.preload_limit:
+				print("Not preloading {0}: it would take {1:.1f} MB, the limit is {2:.1f} MB".format(
+					self.loaded_file, nbytes / 1e6, self.preload_limit / 1e6))
+				return False
+
+			memmap = self.preload_memmap is not None and nbytes > self.preload_memmap
+			if memmap:
+				# The temporary file is removed as soon as the mapping is closed
+				block = np.memmap(tempfile.TemporaryFile(), dtype=np.uint8, mode="w+",
+					shape=(nbytes,))
+			else:
+				block = np.zeros(nbytes, dtype=np.uint8)
+			frames, audio = self.__decode_into(block, frames_nbytes)
+
+		self.frames = frames
+		self.audio = audio
+		self.preload_stats = {'bytes': nbytes, 'memmap': memmap, 'time': monotonic_time() - start,
+			'memory': memory_growth(memory_start)}
+		if self.cache_entry:
+			self.clip_cache.store_frames(self.cache_entry, frames, frames_format, audio)
+		return True
+
+	def __decode_into(self, block, audio_offset):
+		""" Decodes all video frames of the clip into the start of block, and
+		the audio samples into the part from audio_offset onwards.
+
+		Returns:
+		(frames, audio) tuple of views on block. audio is None if the clip has
+		no audio (or it is not played), and is trimmed to the number of samples
+		that were actually decoded.
+		"""
+		frames = block[:self.nframes * int(np.prod(self.frame_shape))].reshape(
+			(self.nframes,) + self.frame_shape)
+		decoder = StreamDecoder(self.clip.reader, pixel_format=self.pixel_format)
+		for frame_no in range(self.nframes):
+			decoder.get_frame(frame_no, frames[frame_no])
+		decoder.close()
+
+		audio = None
+		if self.audioformat:
+			samples = block[audio_offset:].view(np.int16).reshape(-1, self.audioformat["nchannels"])
+			stream = AudioStream(self.clip.audio.reader, self.audio_block_size)
+			stream.seek(0)
+			n_read = 0
+			while n_read < len(samples):
+				audio_block = stream.read_block()
+				if audio_block is None:
+					break
+				n = min(len(audio_block), len(samples) - n_read)
+				samples[n_read:n_read + n] = audio_block[:n]
+				n_read += n
+			audio = samples[:n_read]
+		return frames, audio
+
 	def set_videoframerender_callback(self, func):
 		# Check if renderfunc is indeed a function
 		if not func is None:
@@ -283,6 +2381,28 @@ class Player(object):
 				raise TypeError("The object passed for audiorenderfunc is not a function")
 		self.__audiorenderfunc = func
 
+	def set_audioposition_callback(self, func):
+		""" Sets the function that reports how much of the audio has been played
+		by the audio renderer. It should return the playback position in seconds,
+		or None if the position is not known. The position is used to measure the
+		A/V offset (see av_offsets) and drives the clock with the "audio_master"
+		sync policy. Positions are taken relative to the one reported when play()
+		is called, so the renderer does not need to be reset between playbacks. """
+		if not func is None:
+			if not hasattr(func, '__call__'):
+				raise TypeError("The object passed for audiopositionfunc is not a function")
+		self.__audiopositionfunc = func
+		if isinstance(self.clock, AudioClock):
+			self.clock.position_func = self.__audio_position if func else None
+
+	@property
+	def av_offsets(self):
+		""" (n, 2) array with for every rendered frame of the last playback for
+		which the audio position was known: the clock time and the audio playback
+		position minus the presentation time of the frame, in seconds. Positive
+		offsets mean that the audio is ahead of the video. """
+		return self.__av_offsets[:self.__n_av_offsets]
+
 	def play(self):
 		### First do some status checks
 
@@ -290,7 +2410,7 @@ class Player(object):
 		if self.status == UNINITIALIZED or self.clip is None:
 			raise RuntimeError("Player uninitialized or no file loaded")
 
-		# Check if playback has already finished (rewind needs to be called first)
+		# Check if playback has already finished (seek() needs to be called first)
 		if self.status == EOS:
 			print("End of stream has been reached")
 			return
@@ -305,14 +2425,58 @@ class Player(object):
 		if self.status == READY:
 			self.status = PLAYING
 
-		self.last_frame_no = 0
-		self.current_time = self.clock.time
-		self.next_audio_refresh_t = self.current_time+self.frame_interval
+		# Start at the frame seek() has moved to
+		self.last_frame_no = self.start_frame
+		self.rendered_frame_no = self.start_frame - 1
+		self.__clip_start = 0.0
+		self.__timeline_start = self.start_frame / self.fps
+		self.__transitions = []
+		self.reset_frame_stats()
+		if self.__audiopositionfunc:
+			self.__av_offsets = np.zeros((self.nframes, 2))
+			self.__audioposition_start = self.__audiopositionfunc() or 0.0
+		self.__n_av_offsets = 0
+		if self.timings is not None:
+			self.timings.reset()
+		self.wakeup.clear()
+		self.audio_wakeup.clear()
+
+		if not hasattr(self,"renderloop") or not self.renderloop.is_alive():
+			if (self.preload or self.frame_cache_dir) and self.frames is None:
+				self.preload_frames()
+
+			# Preloaded frames need no decoder (or prefetcher)
+			if self.frames is not None:
+				self.decoder = None
+				self.prefetcher = None
+			elif self.decode_mode in ["stream", "process"]:
+				# Continue with the decoder seek() has left open, if any
+				self.__open_decoder()
+
+			if self.decode_mode == "process" and self.frames is None:
+				# The decoder process decodes ahead of the render loop itself
+				self.prefetcher = self.decoder
+				self.prefetcher.start(self.start_frame)
+			elif self.prefetch_depth and self.frames is None:
+				# Start decoding frames ahead of the render loop
+				self.prefetcher = FramePrefetcher(self.__decode_videoframe,
+					self.frame_shape, self.nframes, self.prefetch_depth,
+					skip_late=self.sync_policy != "never_drop")
+				self.prefetcher.start(self.start_frame)
+
+			current = self.__sequence[self.__video_index]
+			current.length = self.nframes / self.fps
+			current.audio_done.clear()
+			if self.loop and self.__video_index == len(self.__sequence) - 1:
+				# Open the clip a second time to continue with at the end
+				self.__queue_clip(QueuedClip(self.videofile, frames=self.frames,
+					audio=self.audio, clip=self.clip if self.frames is not None else None))
 
-		if not hasattr(self,"renderloop") or not self.renderloop.isAlive():
 			if self.audioformat:
-				# Create flag to set when new audioframe is available
-				self.new_audioframe_available = threading.Event()
+				# Read audio from the start frame onwards
+				self.audio_stream = self.__open_audio_stream(self.clip, self.audio)
+				if self.audio_stream:
+					self.audio_stream.seek(self.start_frame / self.fps)
 				# Start audiorender loop
 				self.audioframe_handler = threading.Thread(target=self.__audiorender_thread)
 				self.audioframe_handler.start()
@@ -322,6 +2486,33 @@ class Player(object):
 		else:
 			print("Rendering thread already running!")
 
+	def queue(self, videofile):
+		""" Adds videofile to the clips that are played after the current one
+		(and the ones queued before it), without a gap in between. The clip
+		is opened, and its first frame is decoded, in the background right
+		away. Queued clips are decoded at the size of the current clip and are
+		not preloaded. Their audio is only played if it has the same format
+		as that of the loaded clip.
+
+		Arguments:
+		videofile	--  path to the video file
+		"""
+		if self.clip is None:
+			raise RuntimeError("No file loaded")
+		if not os.path.isfile(videofile):
+			raise IOError("File not found: {0}".format(videofile))
+		self.__queue_clip(QueuedClip(videofile))
+
+	@property
+	def transitions(self):
+		""" (n, 2) array with for every switch to the next clip during the last
+		playback (see queue() and the loop argument): the time between passing
+		the last frame of the previous clip and the first frame of the next clip
+		to the videorenderfunc, and how late the first frame was, in seconds.
+		Without a gap, the former equals the frame interval of the previous clip
+		and the latter is 0. """
+		return np.array(self.__transitions, dtype=np.float64).reshape(-1, 2)
+
 	def pause(self):
 		""" Change playback status only if current status is PLAYING or
 		PAUSED (and not READY) """
@@ -331,12 +2522,323 @@ class Player(object):
 		elif self.status == PLAYING:
 			self.status = PAUSED
 			self.clock.pause()
+		self.wakeup.set()
+		self.audio_wakeup.set()
 
 	def stop(self):
 		# Stop the clock
 		self.clock.stop()
 		# Set plauyer status to ready
 		self.status = READY
+		# Play from the start again next time
+		self.start_frame = 0
+		self.wakeup.set()
+		self.audio_wakeup.set()
+
+	def seek(self, position, unit="seconds"):
+		""" Moves to a frame of the clip, which is decoded and passed to the
+		videorenderfunc (so it can be shown as a still), and from which the
+		next call of play() starts. Ongoing playback is stopped; after seeking
+		while playing, playback is resumed from the new position.
+
+		In the "stream" decode mode, a KeyframeIndex of the file is used (see
+		load_keyframe_index()) to decide whether the frame is reached faster
+		by reading on from the current position, or by letting ffmpeg seek to
+		the keyframe before it and decode forward from there.
+
+		Arguments:
+		position	--  where to move to, in unit
+
+		Keyword arguments:
+		unit		--  "seconds" or "frames" (default: "seconds")
+
+		Returns:
+		The number of the frame that was moved to
+		"""
+		if self.clip is None:
+			raise RuntimeError("No file loaded")
+		if not unit in SEEK_UNITS:
+			raise ValueError("Invalid unit: {0} (choose from {1})".format(
+				unit, ", ".join(SEEK_UNITS)))
+		if unit == "seconds":
+			# The frame that is on screen at this time
+			frame_no = int(position * self.fps + 1e-6)
+		else:
+			frame_no = int(position)
+		if frame_no < 0 or frame_no >= self.nframes:
+			raise ValueError("Cannot seek to {0} {1}: the clip has {2} frames "
+				"({3:.3f} seconds)".format(position, unit, self.nframes, self.duration))
+
+		resume = self.status == PLAYING
+		if self.status in [PLAYING, PAUSED, EOS]:
+			self.__stop_playback()
+
+		start = monotonic_time()
+		if (self.preload or self.frame_cache_dir) and self.frames is None:
+			self.preload_frames()
+		keyframe = None
+		if self.frames is not None:
+			frame = self.frames[frame_no]
+		elif self.decode_mode in ["stream", "process"]:
+			if self.keyframe_index is None:
+				self.load_keyframe_index()
+			keyframe = self.keyframe_index.previous(frame_no)
+			frame = self.__open_decoder().get_frame(frame_no)
+		else:
+			frame = self.clip.get_frame(frame_no / self.fps)
+
+		self.rendered_frame_no = frame_no
+		if self.__videorenderfunc:
+			self.__videorenderfunc(frame)
+		self.__current_videoframe = frame
+		self.start_frame = frame_no
+		# Target frame, the keyframe before it (if known) and how long it took
+		# to get the frame to the renderer
+		self.seek_stats = {'frame': frame_no, 'keyframe': keyframe,
+			'time': monotonic_time() - start}
+
+		if resume:
+			self.play()
+		return frame_no
+
+	def step(self, n=1):
+		""" Seeks n frames forward (or backward, if n is negative) from the
+		frame that was shown last. Stops at the first and last frame of the
+		clip. See seek().
+
+		Keyword arguments:
+		n	--  the number of frames to move (default: 1)
+
+		Returns:
+		The number of the frame that was moved to
+		"""
+		if self.clip is None:
+			raise RuntimeError("No file loaded")
+		frame_no = self.rendered_frame_no if self.rendered_frame_no >= 0 else self.start_frame
+		return self.seek(min(max(frame_no + n, 0), self.nframes - 1), unit="frames")
+
+	def load_keyframe_index(self):
+		""" Loads the KeyframeIndex of the clip, which is scanned (once per file)
+		if it has not been stored yet. It is stored in the frame_cache_dir if that
+		is set, and next to the file otherwise. Is called by the first
+		seek() in the "stream" decode mode, but can be called earlier to keep
+		scanning out of the time-critical part of an experiment.
+
+		Returns:
+		The KeyframeIndex
+		"""
+		if self.clip is None:
+			raise RuntimeError("No file loaded")
+		if self.keyframe_index is None:
+			self.keyframe_index = KeyframeIndex.load(self.videofile, self.fps,
+				self.frame_cache_dir)
+			if self.cache_entry:
+				self.cache_entry.keyframes = self.keyframe_index
+			if self.decode_mode == "process":
+				# The decoder process gets the index when it is started
+				if not self.status in [PLAYING, PAUSED]:
+					self.__close_decoder()
+			elif self.decoder is not None:
+				self.decoder.keyframes = self.keyframe_index
+		return self.keyframe_index
+
+	def __queue_clip(self, item, previous=None, previous_decoder=None):
+		""" Appends item to the sequence and prepares it in the background.
+		previous (the clip that has just finished playing) and its decoder are
+		released first, as item might reuse its clip. """
+		# All clips are decoded at the size of the loaded one
+		item.size = tuple(self.clip.size)
+		with self.__sequence_lock:
+			self.__sequence.append(item)
+		thread = threading.Thread(target=self.__prepare_clip,
+			args=(item, previous, previous_decoder))
+		thread.daemon = True
+		thread.start()
+
+	def __prepare_clip(self, item, previous=None, previous_decoder=None):
+		""" Opens a queued clip, decodes its first frame and opens its audio
+		stream. Runs in a separate thread. """
+		try:
+			if previous is not None:
+				self.__release_clip(previous, previous_decoder)
+			if item.clip is None:
+				with self.__sequence_lock:
+					in_use = [other for other in self.__sequence if other is not item
+						and other.videofile == item.videofile and other.clip is not None]
+				if in_use:
+					# A clip can only be decoded for one position at a time
+					item.clip = VideoFileClip(item.videofile, audio=self.play_audio)
+				else:
+					(item.clip, item.cache_entry) = self.__open_clip(item.videofile,
+						self.play_audio)
+			if item.frames is None:
+				if tuple(item.clip.size) != item.size:
+					item.clip.reader.size = item.size
+					item.clip.size = item.size
+					item.clip.reader.close()
+				if self.decode_mode == "stream":
+					item.decoder = StreamDecoder(item.clip.reader, pixel_format=self.pixel_format)
+					item.decoder.get_frame(0)
+				elif self.decode_mode == "process":
+					item.decoder = self.__create_decoder_process(item.videofile, item.size,
+						int(item.clip.duration * item.clip.fps), item.clip.reader)
+					item.decoder.start(0)
+				else:
+					item.clip.get_frame(0)
+			item.length = int(item.clip.duration * item.clip.fps) / item.clip.fps
+			if self.audioformat:
+				item.audio_stream = self.__open_audio_stream(item.clip, item.audio)
+				if item.audio_stream:
+					item.audio_stream.seek(0)
+		except Exception as e:
+			item.error = e
+		item.ready.set()
+
+	def __release_clip(self, item, decoder):
+		""" Closes the decoder of a clip that has finished playing, and the clip
+		itself if no other clip in the sequence uses it (and it does not belong
+		to the clip cache) """
+		if decoder is not None and not decoder.closed:
+			decoder.close()
+		# The audio render thread might still be passing on its last blocks
+		while not item.audio_done.wait(0.01):
+			if not getattr(self, "audioframe_handler", None) or \
+				not self.audioframe_handler.is_alive():
+				break
+		with self.__sequence_lock:
+			in_use = any(other.clip is item.clip for other in self.__sequence if other is not item)
+			if item.frames is None and item.cache_entry is None and not in_use:
+				item.clip.close()
+			# Give the cached clip back, unless it is played again (when looping)
+			release_entry = item.cache_entry is not None and not any(other.cache_entry is
+				item.cache_entry for other in self.__sequence if other is not item)
+			# Keep the clip in the sequence (for the indices of the render
+			# threads), but let go of everything that takes up memory
+			if release_entry:
+				self.clip_cache.release(item.cache_entry)
+			item.clip = item.cache_entry = item.frames = item.audio = None
+			item.decoder = item.audio_stream = None
+
+	def __discard_queue(self):
+		""" Releases the clips that were queued after the current one """
+		with self.__sequence_lock:
+			queued = self.__sequence[self.__video_index + 1:]
+			del self.__sequence[self.__video_index + 1:]
+		for item in queued:
+			item.ready.wait()
+			item.audio_done.set()
+			if item.clip is not None:
+				self.__release_clip(item, item.decoder)
+
+	def __open_audio_stream(self, clip, audio=None):
+		""" Returns a stream of the audio of clip (or of the preloaded samples
+		in audio), or None if the clip has no audio in the format the audio
+		renderer has been set up for """
+		if audio is not None:
+			return PreloadedAudioStream(audio, self.audioformat["fps"], self.audio_block_size)
+		if clip.audio is None or clip.audio.fps != self.audioformat["fps"] or \
+			clip.audio.nchannels != self.audioformat["nchannels"]:
+			print("No audio in the format of the audio renderer in {0}".format(clip.filename))
+			return None
+		return AudioStream(clip.audio.reader, self.audio_block_size)
+
+	def __switch_clip(self):
+		""" Continues playback with the next clip in the sequence, once it has
+		been prepared. Called by the render loop at the end of the current clip.
+
+		Returns:
+		True if playback continues, False if the next clip cannot be played
+		"""
+		item = self.__sequence[self.__video_index + 1]
+		while not item.ready.wait(0.01):
+			if not self.status in [PLAYING, PAUSED]:
+				return False
+		if item.error is not None:
+			print("Cannot play {0}: {1}".format(item.videofile, item.error))
+			return False
+
+		if self.prefetcher:
+			self.prefetcher.stop()
+			self.prefetcher = None
+		previous = self.__sequence[self.__video_index]
+		previous_decoder = self.decoder
+		self.__clip_start += previous.length
+		self.__video_index += 1
+		self.times_played += 1
+
+		self.__set_clip(item.videofile, item.clip, item.cache_entry)
+		self.frames = item.frames
+		self.audio = item.audio
+		self.decoder = item.decoder
+		self.keyframe_index = item.cache_entry.keyframes if item.cache_entry else None
+		self.start_frame = 0
+		self.rendered_frame_no = -1
+		self.last_frame_no = 0
+		if self.__audiopositionfunc:
+			self.__av_offsets = np.concatenate([self.__av_offsets, np.zeros((self.nframes, 2))])
+		if self.decode_mode == "process" and self.frames is None:
+			# Has been decoding since the clip was prepared
+			self.prefetcher = self.decoder
+		elif self.prefetch_depth and self.frames is None:
+			self.prefetcher = FramePrefetcher(self.__decode_videoframe,
+				self.frame_shape, self.nframes, self.prefetch_depth,
+				skip_late=self.sync_policy != "never_drop")
+			self.prefetcher.start()
+
+		# Its first frame is ready, so show it right away
+		last_render_time = self.__last_render_time
+		self.__render_videoframe(0, block=True)
+		self.__transitions.append((self.__last_render_time - last_render_time,
+			self.__last_render_time - self.__clip_start))
+
+		# Release the previous clip in the background. When looping, it is
+		# played again after this one.
+		if self.loop and self.__video_index == len(self.__sequence) - 1:
+			reuse = previous.videofile == item.videofile
+			self.__queue_clip(QueuedClip(item.videofile, frames=item.frames, audio=item.audio,
+				clip=previous.clip if reuse else None,
+				cache_entry=previous.cache_entry if reuse else None), previous, previous_decoder)
+		else:
+			thread = threading.Thread(target=self.__release_clip, args=(previous, previous_decoder))
+			thread.daemon = True
+			thread.start()
+		return True
+
+	def __stop_playback(self):
+		""" Stops playback and waits until the render and audio threads have
+		exited, so the decoder and the readers of the clip can be used again """
+		self.clock.stop()
+		self.status = READY
+		self.wakeup.set()
+		self.audio_wakeup.set()
+		for thread in [getattr(self, "renderloop", None), getattr(self, "audioframe_handler", None)]:
+			if thread is not None and thread is not threading.current_thread():
+				thread.join()
+
+	def __open_decoder(self):
+		""" Returns the StreamDecoder of the clip, which is created if there is
+		none that is still open """
+		if self.decoder is None or self.decoder.closed:
+			if self.decode_mode == "process":
+				self.decoder = self.__create_decoder_process(self.videofile,
+					self.clip.size, self.nframes, self.clip.reader, self.keyframe_index)
+			else:
+				self.decoder = StreamDecoder(self.clip.reader,
+					pixel_format=self.pixel_format, keyframes=self.keyframe_index)
+		return self.decoder
+
+	def __create_decoder_process(self, videofile, size, n_frames, reader, keyframes=None):
+		""" Returns a DecoderProcess for videofile, and closes the ffmpeg pipe
+		of the reader in this process, which it makes redundant """
+		reader.close()
+		return DecoderProcess(videofile, size, n_frames, self.pixel_format,
+			depth=self.prefetch_depth or 8, skip_late=self.sync_policy != "never_drop",
+			keyframes=keyframes)
+
+	def __close_decoder(self):
+		""" Closes the decoder if it is still open, e.g. after seek() """
+		if self.decoder is not None and not self.decoder.closed:
+			self.decoder.close()
 
 	def __render(self):
 		""" Main render loop. Checks clock if new video and audio frames
@@ -344,80 +2846,286 @@ class Player(object):
 		functions that take care of rendering these frames """
 
 		# Render first frame
-		self.__render_videoframe()
+		self.__render_videoframe(self.start_frame, block=True)
 
 		# Start videoclock with start of this thread
-		self.clock.start()
+		self.clock.start(self.start_frame / self.fps)
 
 		# Main rendering loop
 		while self.status in [PLAYING,PAUSED]:
-			current_frame_no = self.clock.current_frame
-
-			# Check if end of clip has been reached
-			if self.clock.time > self.duration:
+			# Frames are passed on video_lead ahead of time
+			current_frame_no = self.frame_no_at(self.clock.time + self.video_lead)
+			clip_time = self.clock.time + self.video_lead - self.__clip_start
+
+			# Continue with the next clip in the sequence once the interval of
+			# the last frame of this one has passed
+			if self.__video_index < len(self.__sequence) - 1:
+				if clip_time >= self.nframes / self.fps and (self.sync_policy != "never_drop"
+					or self.rendered_frame_no >= self.nframes - 1):
+					if not self.__switch_clip():
+						if self.status in [PLAYING, PAUSED]:
+							self.status = EOS
+						break
+					continue
+			# Check if end of clip has been reached. If no frames may be dropped,
+			# playback continues until the last frame has been shown.
+			elif self.sync_policy == "never_drop":
+				if self.rendered_frame_no >= self.nframes - 1:
+					self.status = EOS
+					self.times_played += 1
+					break
+			elif clip_time > self.duration:
 				self.status = EOS
+				self.times_played += 1
 				break
 
 			if self.last_frame_no != current_frame_no:
-				# A new frame is available. Get it from te stream
-				self.current_time = self.clock.time
-				self.next_audio_refresh_t = self.current_time+self.frame_interval
-
-				self.new_audioframe_available.set()
-				self.__render_videoframe()
+				# Count the intervals that have passed without their frame
+				# making it to the screen, during which the previous frame has
+				# been shown (again) instead
+				repeated = current_frame_no - self.last_frame_no - 1
+				if self.rendered_frame_no < self.last_frame_no:
+					repeated += 1
+				self.__frame_stats['repeated'] += max(0, repeated)
+
+			# Render the next frame if it is due. Keep trying if the prefetcher
+			# was not able to deliver it yet
+			if self.sync_policy == "never_drop":
+				next_frame_no = min(self.rendered_frame_no + 1, current_frame_no)
+			else:
+				next_frame_no = current_frame_no
+			frame_pending = False
+			if next_frame_no > self.rendered_frame_no and next_frame_no < self.nframes:
+				frame_pending = not self.__render_videoframe(next_frame_no)
 
 			self.last_frame_no = current_frame_no
-			time.sleep(0.01)
+
+			# Sleep until the next frame is due. If the prefetcher could not
+			# deliver the current frame yet, check back again shortly.
+			if self.status == PAUSED:
+				self.__wait_until(None)
+			elif frame_pending:
+				self.__wait_until(min(self.clock.time + 0.001, self.__clip_start +
+					(current_frame_no + 1) * self.frame_interval - self.video_lead))
+			else:
+				self.__wait_until(self.__clip_start + (current_frame_no + 1) * self.frame_interval -
+					self.video_lead)
 
 		self.clock.stop()
+		if self.prefetcher:
+			self.prefetcher.stop()
+		if self.decoder:
+			self.decoder.close()
 		print("Rendering stopped!")
 
 		# Make  sure audiorender thread exits gracefully and is not waiting
 		# forever
-		self.new_audioframe_available.set()
+		self.audio_wakeup.set()
 
 
-	def __render_videoframe(self):
+	def __wait_until(self, deadline):
+		""" Sleeps until the clock reaches deadline, or until the render loop is
+		woken up because playback was paused, resumed or stopped.
+
+		Arguments:
+		deadline	--  the clock time in seconds to wake up at, or None to
+					sleep until woken up
+		"""
+		if deadline is None:
+			self.wakeup.wait()
+			self.wakeup.clear()
+			return
+
+		remaining = deadline - self.clock.time
+		# The deadline on the monotonic clock, for the spinning below
+		spin_deadline = monotonic_time() + remaining
+		if remaining - self.spin_wait > 0 and self.wakeup.wait(remaining - self.spin_wait):
+			self.wakeup.clear()
+			return
+		if self.spin_wait <= 0:
+			return
+		# Spin for the last part, as sleeping is not precise enough for it. This
+		# uses the monotonic clock, as the thread clock only advances about once
+		# a millisecond, and releases the GIL on every iteration so the clock
+		# and audio threads can keep running.
+		while monotonic_time() < spin_deadline and not self.wakeup.is_set():
+			time.sleep(0)
+
+	def __render_videoframe(self, frame_no, block=False):
 		""" Handles a new videoframe once it's there. Is to be run in a separate
 		thread so it does not break audio playback, if computer is too slow to render
-		video frames at sufficient speed. """
+		video frames at sufficient speed.
+
+		Arguments:
+		frame_no	--  the number of the frame to render
+
+		Keyword arguments:
+		block	--  wait for the prefetcher to decode the frame if it is not
+				available yet (default: False)
+
+		Returns:
+		True if the frame was rendered, False if the prefetcher has not decoded it yet
+		"""
+		timings = self.timings
+		if timings is not None:
+			start = monotonic_time()
+		if self.frames is not None:
+			new_videoframe = self.frames[frame_no]
+		elif self.prefetcher:
+			new_videoframe = self.prefetcher.fetch(frame_no, block)
+			if new_videoframe is None:
+				return False
+		elif self.decoder:
+			new_videoframe = self.decoder.get_frame(frame_no)
+		else:
+			new_videoframe = self.clip.get_frame(frame_no / self.fps)
+		if timings is not None:
+			start = timings.record("fetch", start)
+		# Update the frame counters. The videorenderfunc can look up the number
+		# of the frame it is passed in rendered_frame_no.
+		self.__frame_stats['rendered'] += 1
+		self.__frame_stats['dropped'] += frame_no - self.rendered_frame_no - 1
+		self.rendered_frame_no = frame_no
 
-		new_videoframe = self.clip.get_frame(self.clock.time)
 		# Pass it to the callback function if this is set
 		if self.__videorenderfunc:
 			self.__videorenderfunc(new_videoframe)
+			if timings is not None:
+				timings.record("render", start)
 		# Set current_frame to current frame (...)
 		self.__current_videoframe = new_videoframe
+		# The time at which the frame is presented, in terms of the clock
+		presentation_time = self.clock.time + self.video_lead
+		self.__last_render_time = presentation_time
+		if frame_no < self.frame_no_at(presentation_time):
+			self.__frame_stats['late'] += 1
+
+		# Measure how far audio and video are apart
+		if self.__audiopositionfunc and self.__n_av_offsets < len(self.__av_offsets):
+			position = self.__audio_position()
+			if not position is None:
+				# The renderer counts from the time playback started at
+				self.__av_offsets[self.__n_av_offsets] = (presentation_time,
+					self.__timeline_start + position + self.video_lead - self.__clip_start -
+					frame_no / self.fps)
+				self.__n_av_offsets += 1
+		return True
+
+	def __decode_videoframe(self, frame_no, out):
+		""" Decodes frame frame_no into the buffer out. Used by the prefetcher. """
+		timings = self.timings
+		if timings is not None:
+			start = monotonic_time()
+		if self.decoder:
+			self.decoder.get_frame(frame_no, out)
+		else:
+			out[...] = self.clip.get_frame(frame_no / self.fps)
+		if timings is not None:
+			timings.record("decode", start)
+
+	def __audio_position(self):
+		""" Playback position of the audio renderer since play() was called, in
+		seconds, or None if it is not known """
+		position = self.__audiopositionfunc()
+		if position is None:
+			return None
+		return position - self.__audioposition_start
 
 	def __audiorender_thread(self):
+		""" Passes consecutive blocks of the audio stream on to the audio renderer.
+		The renderer is kept audio_lead (by default one block) ahead of the clock,
+		so it always has the next block queued when the current one finishes.
+		At the end of a clip, the audio of the next clip in the sequence follows
+		on directly, so the renderer does not run dry in between. For (the rest
+		of) a clip without audio, silence is passed on, so the playback position
+		of the renderer keeps up with the video. """
 		print("Starting audio render thread")
+		index = self.__video_index
+		item = self.__sequence[index]
+		stream = self.audio_stream
+		# Time in the clip at which the stream starts, and the clock times at
+		# which the clip and the playback started
+		stream_start = self.start_frame / self.fps
+		clip_start = 0.0
+		start_time = stream_start
+		block_no = 0
+		block_duration = self.audioformat["chunkduration"]
+		silence = np.zeros((self.audio_block_size, self.audioformat["nchannels"]), dtype=np.int16)
+		if self.audio_lead is None:
+			audio_lead = block_duration
+		else:
+			audio_lead = self.audio_lead
 		while self.status in [PLAYING,PAUSED]:
-			# Get current time boundaries for audiochunk to retrieve
-			interval = np.arange(
-				int(self.audioformat['fps']*self.current_time),
-				int(self.audioformat['fps']*(self.next_audio_refresh_t)*1.05),
-			)
-
-			# Retrieve audiochunk
-			new_audioframe = self.clip.audio.to_soundarray(
-				tt = (1.0/self.audioformat['fps'])*interval,
-				buffersize = self.frame_interval*self.clip.audio.fps,
-				quantize=True
-			)
-
-			self.new_audioframe_available.wait()
-			# Clear the flag to wait for the next audioframe in next iteration
-			self.new_audioframe_available.clear()
-
-			# Check again if player still has the right status
-			# after receiving the flag
-			if self.status in [PLAYING,PAUSED]:
-				if self.__audiorenderfunc:
-					self.__audiorenderfunc(new_audioframe)
-				self.__current_audioframe = new_audioframe
-
+			if self.status == PAUSED:
+				self.audio_wakeup.wait()
+				self.audio_wakeup.clear()
+				continue
+
+			block_time = stream_start + block_no * block_duration
+			if block_time >= item.length:
+				# Continue with the audio of the next clip. If there is none (yet),
+				# keep passing on silence until playback ends.
+				item.audio_done.set()
+				stream = None
+				next_item = self.__next_audio_clip(index)
+				if next_item is not None:
+					index += 1
+					clip_start += item.length
+					item = next_item
+					stream = item.audio_stream
+					stream_start = 0.0
+					block_no = 0
+					continue
+
+			# Wait until the block is due to be passed on to the renderer
+			# (the clock is still at 0 when it has not been started yet)
+			remaining = clip_start + block_time - audio_lead - max(self.clock.time, start_time)
+			if remaining > 0:
+				if self.audio_wakeup.wait(remaining):
+					self.audio_wakeup.clear()
+				continue
+
+			timings = self.timings
+			if timings is not None:
+				start = monotonic_time()
+			new_audioframe = None
+			if stream is not None:
+				new_audioframe = stream.read_block()
+				if new_audioframe is None:
+					stream = None
+				elif timings is not None:
+					start = timings.record("audio_read", start)
+			if new_audioframe is None:
+				new_audioframe = silence
+
+			# Audio beyond the last video frame is cut off, so the audio of
+			# the next clip starts together with its first frame
+			n_samples = int(round((item.length - block_time) * self.audioformat["fps"]))
+			if 0 < n_samples < len(new_audioframe):
+				new_audioframe = new_audioframe[:n_samples]
+			if self.__audiorenderfunc:
+				self.__audiorenderfunc(new_audioframe)
+				if timings is not None:
+					timings.record("audio_render", start)
+			self.__current_audioframe = new_audioframe
+			block_no += 1
+
+		item.audio_done.set()
 		print("Stopped audio render thread")
 
+	def __next_audio_clip(self, index):
+		""" Returns the clip after the one at index in the sequence, once it has
+		been prepared, or None if no clip has been queued after it (or it cannot
+		be played, or playback ends first) """
+		with self.__sequence_lock:
+			if index + 1 >= len(self.__sequence):
+				return None
+			item = self.__sequence[index + 1]
+		while not item.ready.wait(0.01):
+			if not self.status in [PLAYING,PAUSED]:
+				return None
+		return None if item.error is not None else item
+
 	# Object specific functions
 	def __repr__(self):
 		""" Create a string representation for when
@@ -0,0 +1,49 @@
+"""
+Fixtures for the tests of the player. The tests do not need a display or an
+audio device: clips are generated with ffmpeg (the one MoviePy uses), and
+played without rendering anything.
+"""
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("moviepy")
+from moviepy.config import get_setting
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Frame rate, number of frames and keyframe interval of the numbered clip
+FPS = 25
+NFRAMES = 50
+GOP = 10
+
+# Increase in brightness from one frame to the next; frame 0 is black
+LUMA_STEP = 4
+
+@pytest.fixture(scope="session")
+def numbered_clip(tmp_path_factory):
+	""" Path to a clip of NFRAMES grey frames that get brighter with every
+	frame, so the number of a decoded frame can be told from its brightness
+	(see frame_number()). It is encoded losslessly with a keyframe every GOP
+	frames, so seeking has to decode from a keyframe. """
+	path = str(tmp_path_factory.mktemp("clips") / "numbered.mkv")
+	subprocess.check_call([get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+		"-f", "lavfi", "-i", "nullsrc=size=64x48:rate={0}:duration={1},"
+		"geq=lum='16+{2}*N':cb=128:cr=128".format(FPS, NFRAMES / FPS, LUMA_STEP),
+		"-c:v", "libx264", "-qp", "0", "-g", str(GOP), "-pix_fmt", "yuv420p", path])
+	return path
+
+def frame_number(frame):
+	""" Returns the number of a decoded RGB frame of the numbered clip. The
+	limited range luma of the clip is expanded to the full range by ffmpeg. """
+	return int(round(frame.mean() * 219 / (LUMA_STEP * 255.0)))
@@ -0,0 +1,102 @@
+""" Tests of player.ClipCache, and of how players share it """
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import player
+
+@pytest.fixture
+def clips(numbered_clip, tmp_path):
+	""" Three copies of the numbered clip, which the cache sees as different
+	files """
+	paths = []
+	for i in range(3):
+		path = str(tmp_path / "clip{0}.mkv".format(i))
+		shutil.copy(numbered_clip, path)
+		paths.append(path)
+	return paths
+
+def test_checkout_and_release(clips):
+	cache = player.ClipCache()
+	entry = cache.get(clips[0], audio=False)
+	assert entry.in_use
+	assert cache.stats["misses"] == 1
+
+	# The clip is checked out, so it cannot be handed out again
+	assert cache.get(clips[0], audio=False) is None
+	assert cache.stats["busy"] == 1
+
+	cache.release(entry)
+	assert not entry.in_use
+	assert cache.get(clips[0], audio=False) is entry
+	assert cache.stats["hits"] == 1
+	assert cache.stats["clips"] == 1
+
+def test_eviction_of_least_recently_used_clips(clips):
+	cache = player.ClipCache(max_clips=2)
+	entries = []
+	for path in clips[:2]:
+		entries.append(cache.get(path, audio=False))
+		cache.release(entries[-1])
+	# Using the first clip again makes the second one the least recently used
+	cache.release(cache.get(clips[0], audio=False))
+	cache.release(cache.get(clips[2], audio=False))
+	assert cache.stats["evictions"] == 1
+	assert cache.stats["clips"] == 2
+	assert cache.get(clips[0], audio=False) is entries[0]
+	assert cache.get(clips[1], audio=False) is not entries[1]
+
+def test_eviction_to_make_room_for_frames(clips):
+	frames = np.zeros((10, 48, 64, 3), dtype=np.uint8)
+	cache = player.ClipCache(max_bytes=int(1.5 * frames.nbytes))
+	first = cache.get(clips[0], audio=False)
+	second = cache.get(clips[1], audio=False)
+	assert cache.store_frames(first, frames, ((64, 48), "rgb24"))
+	assert cache.stats["bytes"] == frames.nbytes
+
+	# Frames that do not fit at all are not stored
+	assert not cache.store_frames(second, np.zeros((20, 48, 64, 3), dtype=np.uint8),
+		((64, 48), "rgb24"))
+	assert second.frames is None
+
+	# The frames of the second clip push out the first clip
+	assert cache.store_frames(second, frames.copy(), ((64, 48), "rgb24"))
+	assert cache.stats["evictions"] == 1
+	assert cache.stats["clips"] == 1
+	assert cache.stats["bytes"] == frames.nbytes
+
+def test_changed_file_is_opened_anew(clips):
+	cache = player.ClipCache()
+	entry = cache.get(clips[0], audio=False)
+	cache.release(entry)
+	mtime = os.path.getmtime(clips[0])
+	os.utime(clips[0], (mtime + 10, mtime + 10))
+	assert cache.get(clips[0], audio=False) is not entry
+	assert cache.stats["evictions"] == 1
+	assert cache.stats["clips"] == 1
+
+def test_players_share_clips_one_at_a_time(numbered_clip):
+	cache = player.ClipCache()
+	first = player.Player(numbered_clip, play_audio=False, clip_cache=cache)
+	second = player.Player(numbered_clip, play_audio=False, clip_cache=cache)
+	# The second player could not check out the clip, and opened its own
+	assert first.cache_entry is not None
+	assert second.cache_entry is None
+	assert second.clip is not first.clip
+
+	clip = first.clip
+	first.release()
+	third = player.Player(numbered_clip, play_audio=False, clip_cache=cache)
+	assert third.clip is clip
+	assert cache.stats["hits"] == 1
+	third.release()
+	second.release()
@@ -0,0 +1,156 @@
+""" Tests of player.FramePrefetcher """
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+
+import pytest
+
+import player
+
+FREE = player.FramePrefetcher.FREE
+READY = player.FramePrefetcher.READY
+HELD = player.FramePrefetcher.HELD
+
+class Decoder(object):
+	""" Stands in for a decoder: writes the frame number into the frame, and
+	only decodes a frame once it has been allowed to """
+
+	def __init__(self, fail_at=None):
+		self.allowed = threading.Semaphore(0)
+		self.decoded = []
+		self.fail_at = fail_at
+
+	def __call__(self, frame_no, out):
+		self.allowed.acquire()
+		if frame_no == self.fail_at:
+			raise IOError("Broken frame")
+		out[...] = frame_no
+		self.decoded.append(frame_no)
+
+	def allow(self, n):
+		for i in range(n):
+			self.allowed.release()
+
+def wait_for(prefetcher, condition, timeout=5):
+	""" Waits until condition (a function of the prefetcher) is true """
+	deadline = time.time() + timeout
+	while True:
+		with prefetcher.cond:
+			if condition(prefetcher):
+				return
+		assert time.time() < deadline
+		time.sleep(0.001)
+
+@pytest.fixture
+def decoder():
+	return Decoder()
+
+def test_frames_are_delivered_in_order_and_held(decoder):
+	prefetcher = player.FramePrefetcher(decoder, (2, 2, 3), 10, depth=4, hold=2)
+	prefetcher.start()
+	try:
+		decoder.allow(4)
+		wait_for(prefetcher, lambda p: p.fill == 4)
+		assert prefetcher.slot_state == [READY] * 4
+
+		frame = prefetcher.fetch(0)
+		assert frame[0, 0, 0] == 0
+		assert prefetcher.slot_state == [HELD, READY, READY, READY]
+		prefetcher.fetch(1)
+		assert prefetcher.slot_state == [HELD, HELD, READY, READY]
+		# Only the last 'hold' frames stay protected
+		prefetcher.fetch(2)
+		assert prefetcher.slot_state == [FREE, HELD, HELD, READY]
+
+		# The free slot is written with the next frame
+		decoder.allow(1)
+		wait_for(prefetcher, lambda p: p.slot_state[0] == READY)
+		assert prefetcher.slot_frame[0] == 4
+		assert prefetcher.fetch(3)[0, 0, 0] == 3
+		assert prefetcher.fetch(4)[0, 0, 0] == 4
+		assert prefetcher.stats["delivered"] == 5
+	finally:
+		decoder.allow(100)
+		prefetcher.stop()
+
+def test_underruns_and_late_frames(decoder):
+	prefetcher = player.FramePrefetcher(decoder, (2, 2, 3), 10, depth=4, hold=1)
+	prefetcher.start()
+	try:
+		# Nothing has been decoded yet
+		assert prefetcher.fetch(0) is None
+		assert prefetcher.underruns == 1
+
+		decoder.allow(3)
+		wait_for(prefetcher, lambda p: p.fill == 3)
+		# Frames before the requested one are discarded
+		assert prefetcher.fetch(2)[0, 0, 0] == 2
+		assert prefetcher.discarded == 2
+		assert prefetcher.slot_state == [FREE, FREE, HELD, FREE]
+
+		# A frame that is not next in line is not delivered
+		decoder.allow(1)
+		wait_for(prefetcher, lambda p: p.fill == 1)
+		assert prefetcher.fetch(5) is None
+		assert prefetcher.discarded == 3
+	finally:
+		decoder.allow(100)
+		prefetcher.stop()
+
+def test_skip_late_jumps_to_the_wanted_frame(decoder):
+	prefetcher = player.FramePrefetcher(decoder, (2, 2, 3), 10, depth=4, hold=1,
+		skip_late=True)
+	# The render loop is already at frame 6 when the decoder starts
+	assert prefetcher.fetch(6) is None
+	prefetcher.start()
+	try:
+		decoder.allow(2)
+		assert prefetcher.fetch(6, block=True)[0, 0, 0] == 6
+		assert prefetcher.fetch(7, block=True)[0, 0, 0] == 7
+		assert decoder.decoded == [6, 7]
+		assert prefetcher.skipped == 6
+	finally:
+		decoder.allow(100)
+		prefetcher.stop()
+
+def test_finishes_at_the_end_of_the_clip(decoder):
+	prefetcher = player.FramePrefetcher(decoder, (2, 2, 3), 3, depth=4, hold=1)
+	decoder.allow(3)
+	prefetcher.start()
+	for frame_no in range(3):
+		assert prefetcher.fetch(frame_no, block=True)[0, 0, 0] == frame_no
+	wait_for(prefetcher, lambda p: p.finished)
+	assert prefetcher.fetch(3, block=True) is None
+	prefetcher.stop()
+	assert not prefetcher.thread.is_alive()
+
+def test_stop_wakes_up_a_waiting_decoder(decoder):
+	prefetcher = player.FramePrefetcher(decoder, (2, 2, 3), 100, depth=3, hold=1)
+	decoder.allow(100)
+	prefetcher.start()
+	# The ring is full, so the decoder waits for a free slot
+	wait_for(prefetcher, lambda p: p.fill == 3)
+	prefetcher.stop()
+	assert not prefetcher.thread.is_alive()
+	assert prefetcher.fetch(3, block=True) is None
+
+def test_decoder_errors_are_raised_by_fetch():
+	decoder = Decoder(fail_at=1)
+	prefetcher = player.FramePrefetcher(decoder, (2, 2, 3), 10, depth=4, hold=1)
+	decoder.allow(1)
+	prefetcher.start()
+	assert prefetcher.fetch(0, block=True)[0, 0, 0] == 0
+	decoder.allow(1)
+	with pytest.raises(IOError):
+		prefetcher.fetch(1, block=True)
+	prefetcher.stop()
+
+def test_depth_must_exceed_hold(decoder):
+	with pytest.raises(ValueError):
+		player.FramePrefetcher(decoder, (2, 2, 3), 10, depth=2, hold=2)
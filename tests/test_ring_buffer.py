@@ -0,0 +1,61 @@
+""" Tests of player.SampleRingBuffer """
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+
+import player
+
+def samples(start, n, nchannels=2):
+	""" Returns n stereo samples numbered from start, so their order can be
+	checked after they have been read """
+	return np.repeat(np.arange(start, start + n, dtype=np.int16)[:,None], nchannels, axis=1)
+
+def test_wraparound():
+	ring = player.SampleRingBuffer(8, 2)
+	assert ring.write(samples(0, 6)) == 6
+	out = np.zeros((4, 2), dtype=np.int16)
+	assert ring.read_into(out) == 4
+	assert (out == samples(0, 4)).all()
+
+	# Writing 5 samples from position 6 wraps around the end of the buffer
+	assert ring.write(samples(6, 5)) == 5
+	assert ring.fill == 7
+	out = np.zeros((7, 2), dtype=np.int16)
+	assert ring.read_into(out) == 7
+	assert (out == samples(4, 7)).all()
+	assert ring.fill == 0
+	assert ring.underruns == 0
+
+	# Keep going around a few more times
+	for start in range(11, 60, 7):
+		assert ring.write(samples(start, 7)) == 7
+		out = np.zeros((7, 2), dtype=np.int16)
+		assert ring.read_into(out) == 7
+		assert (out == samples(start, 7)).all()
+
+def test_underrun_is_filled_with_silence():
+	ring = player.SampleRingBuffer(8, 2)
+	ring.write(samples(1, 3))
+	out = np.ones((5, 2), dtype=np.int16)
+	assert ring.read_into(out) == 3
+	assert (out[:3] == samples(1, 3)).all()
+	assert (out[3:] == 0).all()
+	assert ring.underruns == 1
+
+	# Running dry at the end of the stream is not an underrun
+	ring.end_of_stream = True
+	assert ring.read_into(out) == 0
+	assert ring.underruns == 1
+
+def test_write_to_full_buffer_times_out():
+	ring = player.SampleRingBuffer(8, 2)
+	assert ring.write(samples(0, 12), timeout=0.01) == 8
+	assert ring.fill == 8
+	out = np.zeros((8, 2), dtype=np.int16)
+	ring.read_into(out)
+	assert (out == samples(0, 8)).all()
@@ -0,0 +1,98 @@
+""" Tests of the frame accuracy of Player.seek() and Player.step() """
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+
+import pytest
+
+import player
+from conftest import FPS, GOP, NFRAMES, frame_number
+
+@pytest.fixture(params=["time", "stream"])
+def seeker(request, numbered_clip):
+	""" Player of the numbered clip that records the frames passed to its
+	videorenderfunc """
+	frames = []
+	mplayer = player.Player(numbered_clip, videorenderfunc=frames.append,
+		play_audio=False, decode_mode=request.param)
+	mplayer.rendered = frames
+	yield mplayer
+	mplayer.release()
+
+def test_clip_properties(seeker):
+	assert seeker.fps == FPS
+	assert seeker.nframes == NFRAMES
+
+@pytest.mark.parametrize("frame_no", [0, 1, 9, 10, 23, 7, 48, 49, 0])
+def test_seek_to_frame(seeker, frame_no):
+	assert seeker.seek(frame_no, unit="frames") == frame_no
+	assert frame_number(seeker.rendered[-1]) == frame_no
+	assert seeker.rendered_frame_no == frame_no
+
+def test_seek_to_time(seeker):
+	# A time within a frame shows that frame
+	assert seeker.seek(0.5) == 12
+	assert frame_number(seeker.rendered[-1]) == 12
+	assert seeker.seek(1.0 + 0.5 / FPS) == 25
+	assert frame_number(seeker.rendered[-1]) == 25
+
+def test_back_and_forth(seeker):
+	for frame_no in [30, 12, 31, 2, 45, 44]:
+		seeker.seek(frame_no, unit="frames")
+		assert frame_number(seeker.rendered[-1]) == frame_no
+
+def test_step(seeker):
+	seeker.seek(20, unit="frames")
+	for n, expected in [(1, 21), (1, 22), (-3, 19), (-1, 18), (10, 28)]:
+		assert seeker.step(n) == expected
+		assert frame_number(seeker.rendered[-1]) == expected
+
+def test_step_stops_at_the_first_and_last_frame(seeker):
+	seeker.seek(2, unit="frames")
+	assert seeker.step(-5) == 0
+	assert frame_number(seeker.rendered[-1]) == 0
+	seeker.seek(NFRAMES - 2, unit="frames")
+	assert seeker.step(5) == NFRAMES - 1
+	assert frame_number(seeker.rendered[-1]) == NFRAMES - 1
+
+def test_seek_out_of_range(seeker):
+	with pytest.raises(ValueError):
+		seeker.seek(NFRAMES, unit="frames")
+	with pytest.raises(ValueError):
+		seeker.seek(-1, unit="frames")
+	with pytest.raises(ValueError):
+		seeker.seek(0, unit="minutes")
+
+def test_keyframe_index(numbered_clip, tmp_path):
+	index = player.KeyframeIndex.load(numbered_clip, FPS, str(tmp_path))
+	assert os.path.isfile(player.KeyframeIndex.path(numbered_clip, str(tmp_path)))
+	assert index.previous(0) == 0
+	assert index.previous(25) == 20
+	assert index.previous(NFRAMES - 1) == (NFRAMES - 1) // GOP * GOP
+
+def test_seek_from_keyframe(numbered_clip):
+	frames = []
+	mplayer = player.Player(numbered_clip, videorenderfunc=frames.append,
+		play_audio=False, decode_mode="stream")
+	assert mplayer.seek(25, unit="frames") == 25
+	assert mplayer.seek_stats["keyframe"] == 20
+	assert frame_number(frames[-1]) == 25
+	mplayer.release()
+
+def test_play_from_seek_position(numbered_clip):
+	frames = []
+	mplayer = player.Player(numbered_clip, videorenderfunc=frames.append,
+		play_audio=False, clock_mode="monotonic", decode_mode="stream",
+		sync_policy="never_drop")
+	mplayer.seek(40, unit="frames")
+	# Playback shows the frame seek() has shown again, and continues from there
+	del frames[:]
+	mplayer.play()
+	mplayer.renderloop.join(10)
+	assert [frame_number(frame) for frame in frames] == list(range(40, NFRAMES))
+	mplayer.release()
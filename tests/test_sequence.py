@@ -0,0 +1,78 @@
+""" Tests of gapless playback of queued and looped clips """
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+
+import player
+from conftest import NFRAMES, frame_number
+
+def sequence_player(videofile, decode_mode, **kwargs):
+	""" Returns a player that shows every frame in order, and records the
+	numbers of the frames it passes to the videorenderfunc """
+	frames = []
+	mplayer = player.Player(videofile, videorenderfunc=lambda frame:
+		frames.append(frame_number(frame)), play_audio=False,
+		clock_mode="monotonic", decode_mode=decode_mode,
+		sync_policy="never_drop", **kwargs)
+	mplayer.rendered = frames
+	return mplayer
+
+def wait_for_frames(mplayer, n, timeout=30):
+	""" Waits until n frames have been rendered or playback has ended """
+	deadline = time.time() + timeout
+	while len(mplayer.rendered) < n and mplayer.status == player.PLAYING:
+		assert time.time() < deadline
+		time.sleep(0.01)
+
+@pytest.mark.parametrize("decode_mode", ["time", "stream"])
+def test_queue(numbered_clip, decode_mode):
+	mplayer = sequence_player(numbered_clip, decode_mode)
+	mplayer.queue(numbered_clip)
+	mplayer.queue(numbered_clip)
+	mplayer.play()
+	mplayer.renderloop.join(30)
+	assert not mplayer.renderloop.is_alive()
+
+	assert mplayer.rendered == list(range(NFRAMES)) * 3
+	assert mplayer.times_played == 3
+	assert mplayer.status == player.EOS
+	assert len(mplayer.transitions) == 2
+	mplayer.release()
+
+@pytest.mark.parametrize("decode_mode", ["time", "stream"])
+def test_loop(numbered_clip, decode_mode):
+	mplayer = sequence_player(numbered_clip, decode_mode, loop=True)
+	mplayer.play()
+	wait_for_frames(mplayer, 3 * NFRAMES)
+	assert mplayer.status == player.PLAYING
+	mplayer.stop()
+	mplayer.renderloop.join(10)
+
+	rendered = mplayer.rendered
+	assert len(rendered) >= 3 * NFRAMES
+	assert rendered == [i % NFRAMES for i in range(len(rendered))]
+	# Repetitions count once the next one has started
+	assert mplayer.times_played == (len(rendered) - 1) // NFRAMES
+	assert len(mplayer.transitions) == mplayer.times_played
+	mplayer.release()
+
+def test_gaps_between_clips(numbered_clip):
+	""" The next clip starts one frame interval after the last frame of the
+	previous one. The bounds are generous, as the tests might run on a busy
+	machine, but a gap of a whole frame fails. """
+	mplayer = sequence_player(numbered_clip, "stream")
+	mplayer.queue(numbered_clip)
+	mplayer.play()
+	mplayer.renderloop.join(30)
+	gap, lateness = mplayer.transitions[0]
+	frame_interval = 1.0 / mplayer.fps
+	assert gap < 1.5 * frame_interval
+	assert lateness < frame_interval
+	mplayer.release()
@@ -0,0 +1,300 @@
+"""
+Transcodes the video files in the file pool of an OpenSesame experiment into a
+format that is cheap to decode during playback. Run
+
+	python transcode.py --help
+
+to see the available options. Every video in the pool (the __pool__ folder of
+an extracted experiment, or any other folder) is probed, transcoded in
+parallel, and written with the same file name to the output folder, after
+which the decoding cost of the original and the transcoded file is reported.
+Videos in a container that cannot hold the chosen codec (such as .webm or
+.ogv) are written as .mkv instead. Copy the transcoded files back into the
+file pool to use them in the experiment, and update the references to videos
+that were renamed.
+"""
+
+# Python 3 compatibility
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+
+# Files with these extensions are considered to be videos
+VIDEO_EXTENSIONS = [".avi", ".flv", ".m4v", ".mkv", ".mov", ".mp4", ".mpeg",
+	".mpg", ".ogv", ".webm", ".wmv"]
+
+# Containers that each video codec can be written to. Videos in other
+# containers are written as Matroska (.mkv), which can hold any codec.
+CODEC_CONTAINERS = {
+	"libx264": [".mkv", ".mov", ".mp4"],
+	"mjpeg": [".avi", ".mkv", ".mov"],
+}
+
+# Audio codecs that can be copied into each container, and the codec other
+# audio is encoded with. Matroska can hold any audio codec.
+AUDIO_CODECS = {
+	".avi": (["ac3", "mp3", "pcm_s16le"], "pcm_s16le"),
+	".mov": (["aac", "alac", "mp3", "pcm_s16le"], "aac"),
+	".mp4": (["aac", "alac", "mp3"], "aac"),
+}
+
+def output_name(name, codec):
+	""" Returns the name under which the video name (a path relative to the
+	pool folder) is written when it is transcoded with codec: the same name,
+	or with the .mkv extension if its container cannot hold the codec """
+	base, ext = os.path.splitext(name)
+	if ext.lower() in CODEC_CONTAINERS[codec]:
+		return name
+	return base + ".mkv"
+
+def find_videos(pool_folder, exclude=None):
+	""" Returns the paths of all video files in pool_folder and its subfolders,
+	sorted by name.
+
+	Arguments:
+	pool_folder -- the folder to scan
+
+	Keyword arguments:
+	exclude -- a folder to skip, such as the output folder (default: None)
+	"""
+	videos = []
+	for folder, subfolders, files in os.walk(pool_folder):
+		if exclude:
+			subfolders[:] = [name for name in subfolders if
+				os.path.abspath(os.path.join(folder, name)) != os.path.abspath(exclude)]
+		for name in files:
+			if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+				videos.append(os.path.join(folder, name))
+	return sorted(videos)
+
+def probe(videofile):
+	""" Returns a dict with the codec, size, frame rate, number of frames and
+	duration of the video stream of videofile, whether it has audio and the
+	codec of the audio stream, or None if ffmpeg cannot read a video stream
+	from it """
+	try:
+		infos = ffmpeg_parse_infos(videofile)
+	except (IOError, OSError):
+		return None
+	if not infos.get("video_found"):
+		return None
+	# MoviePy does not report the codec, so look it up in ffmpeg's output
+	proc = subprocess.Popen([get_setting("FFMPEG_BINARY"), "-hide_banner",
+		"-i", videofile], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	output = proc.communicate()[1].decode("utf8", "replace")
+	match = re.search(r"Stream #.*?Video: ([^,\r\n]+)", output)
+	audio_match = re.search(r"Stream #.*?Audio: ([^,\s]+)", output)
+	return {
+		"codec": match.group(1).strip() if match else "unknown",
+		"audio_codec": audio_match.group(1) if audio_match else None,
+		"size": tuple(infos["video_size"]),
+		"fps": infos["video_fps"],
+		"nframes": infos["video_nframes"],
+		"duration": infos["duration"],
+		"audio": infos["audio_found"],
+	}
+
+def decode_cost(videofile, max_frames=150):
+	""" Decodes up to max_frames frames of videofile from the start, the way the
+	player does during playback, and returns the mean wall-clock time it took
+	per frame in seconds """
+	reader = FFMPEG_VideoReader(videofile)
+	try:
+		nframes = min(max_frames, reader.nframes)
+		start = time.time()
+		for _ in range(nframes):
+			reader.read_frame()
+		return (time.time() - start) / max(1, nframes)
+	finally:
+		reader.close()
+
+def transcode_command(videofile, outfile, info, args):
+	""" Returns the ffmpeg command line that transcodes videofile into outfile
+	with the settings in args """
+	cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+		"-i", videofile, "-map", "0:v:0", "-map", "0:a?"]
+	pixel_format = args.pixel_format
+	if pixel_format is None:
+		# MJPEG stores full range YUV
+		pixel_format = "yuvj420p" if args.codec == "mjpeg" else "yuv420p"
+	size = args.size
+	if pixel_format.endswith("420p"):
+		# The chroma planes have half the width and height, so both need to be
+		# even. A size of -2 keeps the aspect ratio at an even size.
+		if size:
+			size = [-2 if d < 0 else max(2, d - d % 2) for d in size]
+		elif info["size"][0] % 2 or info["size"][1] % 2:
+			size = [d - d % 2 for d in info["size"]]
+	if size:
+		cmd += ["-vf", "scale={0}:{1}".format(*size)]
+	cmd += ["-c:v", args.codec, "-pix_fmt", pixel_format]
+	if args.codec == "libx264":
+		# Skip the in-loop filters and CABAC, which are expensive to decode
+		cmd += ["-preset", "veryfast", "-tune", "fastdecode",
+			"-crf", str(args.crf), "-g", str(args.gop)]
+	elif args.codec == "mjpeg":
+		# Every frame is a keyframe already
+		cmd += ["-q:v", "2"]
+	if info["audio"]:
+		# Copy the audio if the container can hold it, and encode it otherwise
+		ext = os.path.splitext(outfile)[1].lower()
+		if ext in AUDIO_CODECS and not info["audio_codec"] in AUDIO_CODECS[ext][0]:
+			cmd += ["-c:a", AUDIO_CODECS[ext][1]]
+		else:
+			cmd += ["-c:a", "copy"]
+	return cmd + [outfile]
+
+def transcode(job):
+	""" Transcodes one video. Runs in a worker process.
+
+	Arguments:
+	job -- (videofile, outfile, info, args) tuple
+
+	Returns:
+	(videofile, error) tuple, in which error is None if transcoding succeeded
+	"""
+	videofile, outfile, info, args = job
+	folder = os.path.dirname(outfile)
+	if not os.path.isdir(folder):
+		try:
+			os.makedirs(folder)
+		except OSError:
+			# Created by another worker in the meantime
+			pass
+	# Write to a temporary file first, so a failed run never leaves a
+	# truncated video that looks up to date
+	tmpfile = "{0}.tmp{1}".format(*os.path.splitext(outfile))
+	proc = subprocess.Popen(transcode_command(videofile, tmpfile, info, args),
+		stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	error = proc.communicate()[1].decode("utf8", "replace").strip()
+	if proc.returncode != 0:
+		if os.path.exists(tmpfile):
+			os.remove(tmpfile)
+		return videofile, error or "ffmpeg exited with code {0}".format(proc.returncode)
+	if os.path.exists(outfile):
+		os.remove(outfile)
+	os.rename(tmpfile, outfile)
+	return videofile, None
+
+def parse_arguments(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.split("Run")[0].strip())
+	parser.add_argument("pool_folder", help="folder with the videos to transcode, "
+		"such as the __pool__ folder of an extracted .osexp experiment")
+	parser.add_argument("-o", "--output",
+		help="folder to write the transcoded videos to (default: a folder "
+		"named 'transcoded' inside the pool folder)")
+	parser.add_argument("--codec", choices=["libx264", "mjpeg"], default="libx264",
+		help="video codec to encode with (default: libx264)")
+	parser.add_argument("--gop", type=int, default=1,
+		help="keyframe interval of libx264; 1 makes every frame a keyframe, "
+		"which is the fastest to decode and seek in (default: 1)")
+	parser.add_argument("--crf", type=int, default=18,
+		help="quality of libx264, lower is better (default: 18)")
+	parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+		help="resolution to scale the videos to; use -1 or -2 for one of both "
+		"to keep the aspect ratio. Rounded down to even numbers for 4:2:0 "
+		"pixel formats (default: keep the original size)")
+	parser.add_argument("--pixel-format",
+		help="pixel format of the transcoded videos (default: yuv420p, or "
+		"yuvj420p for mjpeg)")
+	parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+		help="number of videos to transcode at the same time "
+		"(default: the number of CPUs)")
+	parser.add_argument("--force", action="store_true",
+		help="also transcode videos whose output is newer than the original")
+	parser.add_argument("--measure-frames", type=int, default=150,
+		help="number of frames to decode when measuring the decoding cost; "
+		"0 skips the measurement (default: 150)")
+	return parser.parse_args(argv)
+
+def main(argv=None):
+	args = parse_arguments(argv)
+	if not os.path.isdir(args.pool_folder):
+		sys.exit("{0} is not a folder".format(args.pool_folder))
+	output = args.output or os.path.join(args.pool_folder, "transcoded")
+	if os.path.abspath(output) == os.path.abspath(args.pool_folder):
+		sys.exit("The output folder should differ from the pool folder")
+
+	# Probe all videos and decide which ones still need to be transcoded
+	jobs = []
+	infos = {}
+	outfiles = {}
+	for videofile in find_videos(args.pool_folder, exclude=output):
+		info = probe(videofile)
+		name = os.path.relpath(videofile, args.pool_folder)
+		if info is None:
+			print("Skipping {0}: no video stream found".format(name))
+			continue
+		print("{0}: {1}, {2}x{3}, {4:.2f} fps, {5:.2f} s{6}".format(name,
+			info["codec"], info["size"][0], info["size"][1], info["fps"],
+			info["duration"], ", with audio" if info["audio"] else ""))
+		outfile = os.path.join(output, output_name(name, args.codec))
+		if outfile in outfiles.values():
+			print("\tSkipping: another video is written to {0} already".format(
+				os.path.relpath(outfile, output)))
+			continue
+		if outfile != os.path.join(output, name):
+			print("\tWritten as {0}; update the references to {1} in the "
+				"experiment".format(os.path.relpath(outfile, output), name))
+		infos[videofile] = info
+		outfiles[videofile] = outfile
+		if not args.force and os.path.exists(outfile) and \
+			os.path.getmtime(outfile) >= os.path.getmtime(videofile):
+			print("\tAlready transcoded")
+			continue
+		jobs.append((videofile, outfile, info, args))
+	if not infos:
+		print("No videos found in {0}".format(args.pool_folder))
+		return
+
+	# Transcode in parallel. Each ffmpeg process is mostly single threaded for
+	# short clips, so one process per CPU keeps all of them busy.
+	if jobs:
+		print("Transcoding {0} video(s) with {1} process(es)".format(
+			len(jobs), args.jobs))
+		start = time.time()
+		failed = []
+		pool = multiprocessing.Pool(max(1, args.jobs))
+		try:
+			for videofile, error in pool.imap_unordered(transcode, jobs):
+				name = os.path.relpath(videofile, args.pool_folder)
+				if error:
+					failed.append(videofile)
+					print("\tFailed to transcode {0}: {1}".format(name, error))
+				else:
+					print("\tTranscoded {0}".format(name))
+		finally:
+			pool.close()
+			pool.join()
+		print("Done in {0:.1f} s".format(time.time() - start))
+		for videofile in failed:
+			del infos[videofile]
+
+	# Measure the decoding cost one video at a time, so that the measurements
+	# do not compete for the CPU
+	if args.measure_frames <= 0:
+		return
+	print("Decoding cost per frame (original -> transcoded):")
+	for videofile, info in sorted(infos.items()):
+		name = os.path.relpath(videofile, args.pool_folder)
+		before = decode_cost(videofile, args.measure_frames)
+		after = decode_cost(outfiles[videofile], args.measure_frames)
+		print("\t{0}: {1:.2f} ms -> {2:.2f} ms ({3:.1f}x), budget at {4:.2f} fps is "
+			"{5:.2f} ms".format(name, before * 1000, after * 1000,
+			before / after if after else float("inf"), info["fps"],
+			1000.0 / info["fps"]))
+
+if __name__ == "__main__":
+	main()